@@ -1,35 +1,62 @@
-from fastapi import APIRouter, Depends
-from sqlalchemy.orm import Session
-from app.models.database import get_db, Conversation
-from app.schemas.chat import AnalyticsResponse, ConversationHistory
-from app.services.analytics_service import AnalyticsService
-from typing import List
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+from fastapi.responses import StreamingResponse
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.models.database import AsyncReadSessionLocal, get_async_read_db
+from app.schemas.chat import AnalyticsResponse
+from app.services.analytics_cache import analytics_cache
+from app.services.analytics_service import AnalyticsService, AsyncAnalyticsService
+from app.services.event_bus import dashboard_events
+from app.services.export import FORMATS, aexport_lines
+from app.services.metrics_rollup import merge_deltas
+from app.services.pagination import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE
+from app.services.sentiment_trends import to_naive_utc
+from datetime import datetime
+from typing import Literal, Optional
+import asyncio
+import json
 
 router = APIRouter()
 
+# Seconds between SSE comments that keep idle proxies from closing the stream
+LIVE_KEEPALIVE = 15
+
+async def cached_response(request: Request, endpoint: str, params: dict, compute) -> Response:
+    """Serve endpoint from the shared analytics cache, answering 304 when the client's ETag matches"""
+    entry = await analytics_cache.get(endpoint, params, compute)
+    # no-cache: clients may keep the body but must revalidate it every time
+    headers = {"ETag": entry.etag, "Cache-Control": "no-cache"}
+
+    if_none_match = request.headers.get("if-none-match", "")
+    if entry.etag in (tag.strip() for tag in if_none_match.split(",")) or if_none_match.strip() == "*":
+        return Response(status_code=304, headers=headers)
+    return Response(content=entry.body, media_type="application/json", headers=headers)
+
 @router.get("/analytics/dashboard", response_model=AnalyticsResponse)
-async def get_dashboard_analytics(db: Session = Depends(get_db)):
+async def get_dashboard_analytics(request: Request, db: AsyncSession = Depends(get_async_read_db)):
     """Get main dashboard analytics"""
-    analytics_service = AnalyticsService(db)
-    stats = analytics_service.get_dashboard_stats()
-    return AnalyticsResponse(**stats)
+    analytics_service = AsyncAnalyticsService(db)
+
+    async def compute():
+        stats = await analytics_service.get_dashboard_stats()
+        return AnalyticsResponse(**stats)
+
+    return await cached_response(request, "dashboard", {}, compute)
 
 @router.get("/analytics/conversations")
 async def get_all_conversations(
+    request: Request,
     status: str = None,
-    limit: int = 50,
-    db: Session = Depends(get_db)
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    before: Optional[str] = None,
+    after: Optional[str] = None,
+    db: AsyncSession = Depends(get_async_read_db)
 ):
-    """Get list of all conversations with optional filtering"""
-    query = db.query(Conversation)
-    
-    if status:
-        query = query.filter(Conversation.status == status)
-    
-    conversations = query.order_by(Conversation.created_at.desc()).limit(limit).all()
-    
-    return [
-        {
+    """Get a page of conversations, newest first, with optional status filter and before/after cursors"""
+    analytics_service = AsyncAnalyticsService(db)
+
+    async def compute():
+        page = await analytics_service.list_conversations(status, limit, before, after)
+        return page.to_dict(lambda conv: {
             "id": conv.id,
             "session_id": conv.session_id,
             "customer_name": conv.customer_name,
@@ -37,13 +64,94 @@ async def get_all_conversations(
             "escalated": conv.escalated,
             "average_sentiment": conv.average_sentiment,
             "created_at": conv.created_at.isoformat()
-        }
-        for conv in conversations
-    ]
+        })
+
+    try:
+        return await cached_response(
+            request, "conversations",
+            {"status": status, "limit": limit, "before": before, "after": after}, compute
+        )
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
 
 @router.get("/analytics/sentiment-trends")
-async def get_sentiment_trends(db: Session = Depends(get_db)):
-    """Get sentiment trends over time"""
-    analytics_service = AnalyticsService(db)
-    trends = analytics_service.get_sentiment_over_time()
-    return {"trends": trends}
\ No newline at end of file
+async def get_sentiment_trends(
+    request: Request,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    granularity: Literal["hour", "day", "week"] = "day",
+    db: AsyncSession = Depends(get_async_read_db)
+):
+    """Get average sentiment per hour/day/week bucket in [start, end)"""
+    analytics_service = AsyncAnalyticsService(db)
+
+    async def compute():
+        trends = await analytics_service.get_sentiment_over_time(granularity, start, end)
+        return {"trends": trends, "granularity": granularity}
+
+    return await cached_response(
+        request, "sentiment-trends",
+        {"start": start and start.isoformat(), "end": end and end.isoformat(), "granularity": granularity},
+        compute
+    )
+
+@router.get("/analytics/live")
+async def live_dashboard():
+    """Server-sent events for the dashboard.
+
+    A "snapshot" event carries the full dashboard, then one "update" event
+    per tick with writes carries the refreshed dashboard plus the metric
+    deltas, changed conversations and sentiment bucket deltas behind it.
+    """
+    async def events():
+        queue = dashboard_events.subscribe()
+        metrics = {}
+        try:
+            while True:
+                try:
+                    event = await asyncio.wait_for(dashboard_events.next_event(queue), LIVE_KEEPALIVE)
+                except asyncio.TimeoutError:
+                    yield ": keepalive\n\n"
+                    continue
+
+                payload = dict(event)
+                event_type = payload.pop("type")
+                if event_type == "snapshot":
+                    metrics = payload.pop("metrics")
+                else:
+                    metrics = merge_deltas(metrics, payload["metrics"])
+
+                # Derived from this stream's own copy of the counters; no query per client
+                stats = AnalyticsService(None).get_dashboard_stats(metrics)
+                payload["dashboard"] = AnalyticsResponse(**stats).model_dump()
+                yield f"event: {event_type}\ndata: {json.dumps(payload, separators=(',', ':'))}\n\n"
+        finally:
+            dashboard_events.unsubscribe(queue)
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@router.get("/export/{kind}")
+async def export_rows(
+    kind: Literal["conversations", "messages"],
+    format: Literal["ndjson", "csv"] = "ndjson",
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    status: Optional[str] = None,
+    include_archived: bool = True,
+    batch_size: int = Query(5000, ge=100, le=50000)
+):
+    """Stream every conversation or message in [start, end) as NDJSON or CSV, in id order"""
+    async def stream():
+        # The session lives as long as the response body, on the read replica when there is one
+        async with AsyncReadSessionLocal() as db:
+            async for chunk in aexport_lines(db, kind, format, to_naive_utc(start), to_naive_utc(end),
+                                             status, include_archived, batch_size):
+                yield chunk
+
+    return StreamingResponse(stream(), media_type=FORMATS[format], headers={
+        "Content-Disposition": f'attachment; filename="{kind}.{format}"'
+    })
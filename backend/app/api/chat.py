@@ -1,155 +1,250 @@
-﻿from fastapi import APIRouter, Depends
-from sqlalchemy.orm import Session
-from app.models.database import get_db, Message
-from app.schemas.chat import ChatMessage, ChatResponse, MessageDetail
-from app.services.chat_service import ChatService
-from app.services.sentiment import analyze_sentiment as ai_sentiment
-from typing import List
-import random
+﻿from fastapi import APIRouter, Depends, HTTPException, Query, Request, WebSocket, WebSocketDisconnect
+from pydantic import ValidationError
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.models.database import AsyncSessionLocal, get_async_db, get_session_read_db, recent_writes
+from app.schemas.chat import ChatMessage, ChatResponse, ChatSocketMessage, MessageDetail, MessagePage
+from app.services.bulk_import import import_transcripts_async
+from app.services.chat_service import AsyncChatService
+from app.services.context_builder import context_stats
+from app.services.context_cache import context_cache
+from app.services.llm import llm_client
+from app.services.metrics import stage
+from app.services.pagination import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE
+from app.services.rag_service import faq_retriever
+from app.services.turn_processor import AsyncTurnProcessor
+from app.services.write_behind import write_behind
+from app.services.sentiment import sentiment_engine, signed_score
+from typing import Optional
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
 async def get_llm_response(message: str, history: list) -> str:
-    """Smart mock responses for demo"""
-    message_lower = message.lower()
-    
-    # Greeting responses
-    if any(word in message_lower for word in ['hello', 'hi', 'hey']):
-        return "Hello! I'm your AI support assistant. How can I help you today?"
-    
-    # Order-related
-    if any(word in message_lower for word in ['order', 'delivery', 'shipping', 'package']):
-        return "I'd be happy to help with your order! Could you please provide your order number so I can look into this for you?"
-    
-    # Frustrated/angry sentiment
-    if any(word in message_lower for word in ['frustrated', 'angry', 'upset', 'annoyed', 'terrible']):
-        return "I completely understand your frustration, and I sincerely apologize for the inconvenience. Let me escalate this to a senior agent who can resolve this immediately. In the meantime, can you share more details about the issue?"
-    
-    # Refund/return
-    if any(word in message_lower for word in ['refund', 'return', 'money back', 'cancel']):
-        return "I can definitely help you with that. Our return policy allows refunds within 30 days. Would you like me to start the refund process for you? I'll need your order number to proceed."
-    
-    # Account issues
-    if any(word in message_lower for word in ['account', 'login', 'password', 'sign in']):
-        return "I can help you with your account! Have you tried resetting your password? I can send you a password reset link to your registered email address."
-    
-    # Payment issues
-    if any(word in message_lower for word in ['payment', 'charge', 'credit card', 'billing']):
-        return "Let me help you resolve this payment issue. Could you clarify what specific problem you're experiencing? I can check your billing details and transaction history."
-    
-    # Product questions
-    if any(word in message_lower for word in ['product', 'item', 'quality', 'size', 'color']):
-        return "I'd be happy to provide more information about our products! Which specific item are you interested in? I can share details about features, specifications, and availability."
-    
-    # Thanks/positive
-    if any(word in message_lower for word in ['thank', 'thanks', 'appreciate', 'great', 'awesome']):
-        return "You're very welcome! I'm glad I could help. Is there anything else I can assist you with today?"
-    
-    # Help/general
-    if any(word in message_lower for word in ['help', 'support', 'assist', 'question']):
-        return "I'm here to help! I can assist with orders, returns, account issues, product information, and more. What would you like help with?"
-    
-    # Default fallback responses
-    fallbacks = [
-        "I understand your concern. Could you provide a bit more detail so I can assist you better?",
-        "Thank you for reaching out! Let me help you with that. Can you share more information about your issue?",
-        "I'm here to help resolve this for you. Could you elaborate on what you're experiencing?",
-        "I appreciate you contacting us. To better assist you, could you provide more details about your situation?"
-    ]
-    
-    return random.choice(fallbacks)
+    """Reply from the configured LLM provider (rule-based replies when it is slow or down)"""
+    return await llm_client.respond(message, history)
 
-async def analyze_sentiment(message: str) -> tuple:
-    """Call sentiment analysis"""
-    result = ai_sentiment(message)
-
-    mood = result["mood"]
-    confidence = result["confidence"]
-
-    if mood == "positive":
-        score = confidence
-    elif mood == "negative":
-        score = -confidence
-    else:
-        score = 0.0
+async def stream_llm_response(message: str, history: list):
+    """Yield the assistant reply in chunks as it is produced"""
+    async for chunk in llm_client.stream(message, history):
+        yield chunk
 
-    return (score, mood)
+async def analyze_sentiment(message: str) -> tuple:
+    """Call sentiment analysis (batched and cached, scored off the event loop)"""
+    with stage("sentiment"):
+        return signed_score(await sentiment_engine.analyze(message))
 
 @router.post("/chat", response_model=ChatResponse)
-async def chat(chat_message: ChatMessage, db: Session = Depends(get_db)):
+async def chat(chat_message: ChatMessage, db: AsyncSession = Depends(get_async_db)):
     """Handle chat message and return AI response"""
 
-    chat_service = ChatService(db)
+    sentiment_score, sentiment_label = await analyze_sentiment(chat_message.message)
 
-    conversation = chat_service.get_or_create_conversation(
+    # Whole turn is one unit of work: reads, response generation, one commit
+    processor = AsyncTurnProcessor(db)
+    turn = await processor.begin(
         chat_message.session_id,
+        chat_message.message,
         chat_message.customer_name
     )
 
-    sentiment_score, sentiment_label = await analyze_sentiment(chat_message.message)
-
-    chat_service.save_message(
-        session_id=chat_message.session_id,
-        role="user",
-        content=chat_message.message,
+    ai_response, should_escalate = await processor.respond(
+        turn,
         sentiment_score=sentiment_score,
-        sentiment_label=sentiment_label
-    )
-
-    history = chat_service.get_conversation_history(chat_message.session_id)
-    history_list = [{"role": m.role, "content": m.content} for m in history]
-
-    ai_response = await get_llm_response(chat_message.message, history_list)
-
-    chat_service.save_message(
-        session_id=chat_message.session_id,
-        role="assistant",
-        content=ai_response
+        sentiment_label=sentiment_label,
+        reply=get_llm_response(chat_message.message, turn.history)
     )
 
-    should_escalate = chat_service.should_escalate(sentiment_score, conversation.id)
-
-    if should_escalate:
-        chat_service.escalate_conversation(chat_message.session_id)
-
     return ChatResponse(
         response=ai_response,
         sentiment_score=sentiment_score,
         sentiment_label=sentiment_label,
         should_escalate=should_escalate,
-        session_id=chat_message.session_id
+        session_id=chat_message.session_id,
+        prompt_tokens=turn.prompt_tokens,
+        prompt_tokens_saved=turn.tokens_saved
     )
 
-@router.get("/chat/history/{session_id}", response_model=List[MessageDetail])
-async def get_chat_history(session_id: str, db: Session = Depends(get_db)):
-    """Get conversation history"""
-    chat_service = ChatService(db)
-    messages = chat_service.get_conversation_history(session_id)
-    return messages
+# Socket turns in flight; held so a turn outlives a cancelled connection handler
+_socket_turns = set()
+
+def _socket_turn_done(task: asyncio.Task):
+    _socket_turns.discard(task)
+    # Logged here so the error is seen even when the handler is gone
+    if not task.cancelled() and task.exception() is not None:
+        logger.error("Socket chat turn failed", exc_info=task.exception())
+
+async def run_socket_turn(session_id: str, chat_message: ChatSocketMessage, send):
+    """One chat turn over a socket: sentiment event, reply chunks, persist, done event"""
+    async with AsyncSessionLocal() as db:
+        # Score the message while the history loads; neither waits on the other
+        processor = AsyncTurnProcessor(db)
+        begin = asyncio.create_task(
+            processor.begin(session_id, chat_message.message, chat_message.customer_name)
+        )
+        try:
+            sentiment_score, sentiment_label = await analyze_sentiment(chat_message.message)
+            await send({
+                "type": "sentiment",
+                "sentiment_score": sentiment_score,
+                "sentiment_label": sentiment_label
+            })
+        except BaseException as exc:
+            # Not left running (or its error unretrieved) when scoring fails
+            begin.cancel()
+            loaded, = await asyncio.gather(begin, return_exceptions=True)
+            # A history load that had already failed is the failure to report
+            if isinstance(exc, Exception) and isinstance(loaded, Exception):
+                raise loaded
+            raise
+        turn = await begin
+
+        async def reply():
+            chunks = []
+            async for chunk in stream_llm_response(chat_message.message, turn.history):
+                chunks.append(chunk)
+                await send({"type": "chunk", "content": chunk})
+            return "".join(chunks)
+
+        ai_response, should_escalate = await processor.respond(
+            turn,
+            sentiment_score=sentiment_score,
+            sentiment_label=sentiment_label,
+            reply=reply()
+        )
+
+    await send({
+        "type": "done",
+        "response": ai_response,
+        "should_escalate": should_escalate,
+        "session_id": session_id,
+        "prompt_tokens": turn.prompt_tokens,
+        "prompt_tokens_saved": turn.tokens_saved
+    })
+
+@router.websocket("/ws/chat/{session_id}")
+async def chat_socket(websocket: WebSocket, session_id: str):
+    """Chat over one connection per session.
+
+    Each client frame is {"message", "customer_name"}. The server answers with
+    a "sentiment" event as soon as the message is scored, "chunk" events as
+    the reply is produced, and a "done" event once the turn is persisted. A
+    malformed frame or a turn that fails gets an "error" event instead.
+    """
+    await websocket.accept()
+    connected = True
+
+    async def send(event: dict):
+        nonlocal connected
+        if connected:
+            try:
+                await websocket.send_json(event)
+            except Exception:
+                # Closed by the client; the exception type depends on the server
+                connected = False
+
+    while connected:
+        try:
+            payload = await websocket.receive_json()
+        except WebSocketDisconnect:
+            return
+        except ValueError:
+            await send({"type": "error", "detail": "Frames must be JSON"})
+            continue
+
+        try:
+            chat_message = ChatSocketMessage.model_validate(payload)
+        except ValidationError as exc:
+            await send({"type": "error", "detail": exc.errors(include_url=False)})
+            continue
+
+        # A client that leaves mid-reply still gets its turn recorded
+        task = asyncio.create_task(run_socket_turn(session_id, chat_message, send))
+        _socket_turns.add(task)
+        task.add_done_callback(_socket_turn_done)
+        try:
+            await asyncio.shield(task)
+        except Exception:
+            await send({"type": "error", "detail": "The message could not be processed"})
+
+@router.post("/chat/import")
+async def import_conversations(
+    request: Request,
+    batch_size: int = Query(1000, ge=1, le=10000),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Bulk-load NDJSON transcripts, one conversation per line (existing sessions are skipped)"""
+    result = await import_transcripts_async(db, request.stream(), batch_size)
+    return result.to_dict()
+
+@router.get("/chat/sentiment-stats")
+async def get_sentiment_stats():
+    """Sentiment engine throughput, latency and cache statistics"""
+    return sentiment_engine.snapshot()
+
+@router.get("/chat/llm-stats")
+async def get_llm_stats():
+    """LLM provider replies, fallbacks, retries and latency"""
+    return llm_client.snapshot()
+
+@router.get("/faq/search")
+async def search_faq(q: str = Query(..., min_length=1), k: int = Query(3, ge=1, le=20)):
+    """Top FAQ passages for a query, as the assistant is grounded with"""
+    return [passage.to_dict() for passage in faq_retriever.search(q, k)]
+
+@router.get("/faq/stats")
+async def get_faq_stats():
+    """FAQ index size and retrieval latency"""
+    return faq_retriever.snapshot()
+
+@router.get("/chat/write-stats")
+async def get_write_stats():
+    """Write-behind queue depth, group commit sizes and flush latency"""
+    return write_behind.snapshot()
+
+@router.get("/chat/context-stats")
+async def get_context_stats():
+    """Session context cache size, hit rate and evictions, and prompt tokens saved"""
+    return {**context_cache.snapshot(), "prompts": context_stats.snapshot()}
+
+@router.get("/chat/history/{session_id}", response_model=MessagePage)
+async def get_chat_history(
+    session_id: str,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    before: Optional[str] = None,
+    after: Optional[str] = None,
+    db: AsyncSession = Depends(get_session_read_db)
+):
+    """Get a page of conversation history (latest messages first page, before/after cursors to scroll)"""
+    # Read your own replies: wait for any still in the write-behind queue
+    if write_behind.pending(session_id):
+        await write_behind.flush()
+    chat_service = AsyncChatService(db)
+    try:
+        page = await chat_service.get_conversation_history(session_id, limit, before, after)
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+    return page.to_dict(MessageDetail.model_validate)
 
 @router.post("/chat/resolve/{session_id}")
-async def resolve_conversation(session_id: str, db: Session = Depends(get_db)):
+async def resolve_conversation(session_id: str, db: AsyncSession = Depends(get_async_db)):
     """Mark conversation as resolved"""
-    chat_service = ChatService(db)
-    chat_service.resolve_conversation(session_id)
+    chat_service = AsyncChatService(db)
+    await chat_service.resolve_conversation(session_id)
+    recent_writes.mark(session_id)
     return {"status": "resolved"}
 
 @router.post("/chat/update-sentiment/{session_id}")
-async def update_conversation_sentiment(session_id: str, db: Session = Depends(get_db)):
-    """Force update conversation sentiment"""
-    chat_service = ChatService(db)
-    conversation = chat_service.get_or_create_conversation(session_id)
-    
-    messages = db.query(Message).filter(
-        Message.conversation_id == conversation.id,
-        Message.role == "user",
-        Message.sentiment_score.isnot(None)
-    ).all()
-
-    if messages:
-        avg = sum(m.sentiment_score for m in messages) / len(messages)
-        conversation.average_sentiment = avg
-        db.commit()
-        return {"sentiment": avg, "message_count": len(messages)}
-
-    return {"sentiment": None, "message_count": 0}
+async def update_conversation_sentiment(session_id: str, db: AsyncSession = Depends(get_async_db)):
+    """Recompute conversation sentiment aggregates from stored messages"""
+    chat_service = AsyncChatService(db)
+    conversation = await chat_service.get_or_create_conversation(session_id)
+    conversation = await chat_service.update_conversation_sentiment(conversation.id)
+    recent_writes.mark(session_id)
+
+    return {
+        "sentiment": conversation.average_sentiment,
+        "message_count": conversation.sentiment_count
+    }
@@ -0,0 +1,226 @@
+"""Maintenance commands, run from backend/: python -m app.cli <command>"""
+import argparse
+from app.models.database import SessionLocal, init_db
+from app.services.bulk_import import import_transcripts
+from app.services.export import COLUMNS, FORMATS, export_lines
+from app.services.issue_classifier import backfill_issue_types
+from app.services.metrics_rollup import MetricsRollupService
+from app.services.query_plans import check_query_plans, pick_sample, seed_sample_data
+from app.services.rag_service import FAQ_CORPUS, FAQ_INDEX_DIR, build_index, load_corpus
+from app.services.retention import ARCHIVE_DIR, RETENTION_DAYS, archive_conversations, retention_cutoff
+from app.services.sentiment_trends import SentimentTrendService, to_naive_utc
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from pathlib import Path
+import gzip
+import multiprocessing
+import os
+import sys
+import time
+
+def rebuild_metrics(args):
+    """Recompute the dashboard rollups from conversations and messages"""
+    db = SessionLocal()
+    try:
+        values = MetricsRollupService(db).rebuild()
+        buckets = SentimentTrendService(db).rebuild(batch_size=args.batch_size)
+    finally:
+        db.close()
+    
+    for metric, value in values.items():
+        print(f"{metric}: {value}")
+    print(f"sentiment trend buckets: {buckets}")
+
+def backfill_issues(args):
+    """Tag stored user messages with an issue_type, then refresh the rollup"""
+    db = SessionLocal()
+    try:
+        tagged = backfill_issue_types(db, batch_size=args.batch_size)
+        MetricsRollupService(db).rebuild()
+    finally:
+        db.close()
+    
+    print(f"Tagged {tagged} messages")
+
+def check_plans(args):
+    """EXPLAIN the hot request-path queries; exits non-zero if any plan regressed"""
+    db = SessionLocal()
+    try:
+        if args.seed and seed_sample_data(db, args.seed):
+            MetricsRollupService(db).rebuild()
+            SentimentTrendService(db).rebuild()
+            print(f"Seeded {args.seed} conversations")
+        results = check_query_plans(db, pick_sample(db))
+    except ValueError as exc:
+        raise SystemExit(str(exc))
+    finally:
+        db.close()
+    
+    regressions = [result for result in results if result.problems]
+    for result in results:
+        print(f"[{'FAIL' if result.problems else 'ok'}] {result.name}")
+        for problem in result.problems:
+            print(f"    {problem}")
+        if result.problems or args.verbose:
+            for statement, plan in result.plans:
+                print(f"    {' '.join(statement.split())}")
+                for line in plan:
+                    print(f"      {line}")
+    
+    print(f"{len(results)} query paths checked, {len(regressions)} regressed")
+    if regressions:
+        raise SystemExit(1)
+
+def index_faq(args):
+    """Build the FAQ retrieval index from the corpus (workers memory-map the result)"""
+    started = time.perf_counter()
+    try:
+        meta = build_index(load_corpus(args.corpus), args.out, dense_dim=args.dense_dim)
+    except (OSError, ValueError, KeyError) as exc:
+        raise SystemExit(f"Could not index {args.corpus}: {exc!r}")
+    
+    print(f"Indexed {meta['passages']} passages ({meta['terms']} terms, dense_dim {meta['dense_dim']}) "
+          f"into {args.out} in {time.perf_counter() - started:.2f}s")
+
+def import_conversations(args):
+    """Bulk-load NDJSON transcripts (see services.bulk_import for the format)"""
+    if args.path == "-":
+        lines = sys.stdin.buffer
+    elif args.path.endswith(".gz"):
+        lines = gzip.open(args.path, "rb")
+    else:
+        lines = open(args.path, "rb")
+    
+    def progress(result):
+        print(f"\r{result.conversations} conversations, {result.messages} messages, "
+              f"{result.skipped} skipped, {result.failed} failed", end="", file=sys.stderr, flush=True)
+    
+    executor = None
+    if args.workers:
+        executor = ProcessPoolExecutor(max_workers=args.workers,
+                                       mp_context=multiprocessing.get_context("spawn"))
+    db = SessionLocal()
+    try:
+        result = import_transcripts(db, lines, batch_size=args.batch_size, executor=executor,
+                                    workers=args.workers, on_batch=progress)
+    finally:
+        db.close()
+        lines.close()
+        if executor is not None:
+            executor.shutdown()
+    
+    summary = result.to_dict()
+    print(file=sys.stderr)
+    for error in summary.pop("errors"):
+        print(f"line {error['line']}: {error['error']}")
+    for key, value in summary.items():
+        print(f"{key}: {value}")
+    if result.failed:
+        raise SystemExit(1)
+
+def archive_cold(args):
+    """Move resolved conversations idle for --older-than-days into monthly archive files"""
+    cutoff = retention_cutoff(args.older_than_days)
+    
+    def progress(result):
+        print(f"\r{result.conversations} conversations, {result.messages} messages archived",
+              end="", file=sys.stderr, flush=True)
+    
+    db = SessionLocal()
+    try:
+        result = archive_conversations(db, cutoff, args.archive_dir, batch_size=args.batch_size,
+                                       on_batch=progress)
+    finally:
+        db.close()
+    
+    print(file=sys.stderr)
+    print(f"cutoff: {cutoff.isoformat()}")
+    for key, value in result.to_dict().items():
+        print(f"{key}: {value}")
+
+def export_rows(args):
+    """Stream conversations or messages to a file or stdout in constant memory"""
+    if args.output == "-":
+        out = sys.stdout
+    elif args.output.endswith(".gz"):
+        out = gzip.open(args.output, "wt", encoding="utf-8", newline="")
+    else:
+        out = open(args.output, "w", encoding="utf-8", newline="")
+    
+    started = time.perf_counter()
+    written = 0
+    db = SessionLocal()
+    try:
+        for chunk in export_lines(db, args.kind, args.format, args.start, args.end, args.status,
+                                  not args.no_archived, args.batch_size):
+            out.write(chunk)
+            written += chunk.count("\n")
+    finally:
+        db.close()
+        if out is not sys.stdout:
+            out.close()
+    
+    print(f"Exported {written} lines in {time.perf_counter() - started:.1f}s", file=sys.stderr)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m app.cli", description="Support agent maintenance commands")
+    commands = parser.add_subparsers(dest="command", required=True)
+    
+    rebuild = commands.add_parser("rebuild-metrics", help="recompute the dashboard metrics and trend rollups")
+    rebuild.add_argument("--batch-size", type=int, default=1000, help="messages fetched per round trip")
+    rebuild.set_defaults(func=rebuild_metrics)
+    
+    backfill = commands.add_parser("backfill-issues", help="classify stored messages missing an issue_type")
+    backfill.add_argument("--batch-size", type=int, default=1000, help="messages tagged per transaction")
+    backfill.set_defaults(func=backfill_issues)
+    
+    plans = commands.add_parser("check-query-plans", help="fail if a hot query's plan scans, sorts or loses its index")
+    plans.add_argument("--seed", type=int, default=0,
+                       help="first fill an empty (scratch) database with this many synthetic conversations")
+    plans.add_argument("--verbose", action="store_true", help="print every statement and plan")
+    plans.set_defaults(func=check_plans)
+    
+    faq = commands.add_parser("index-faq", help="build the FAQ retrieval index from a JSON-lines corpus")
+    faq.add_argument("--corpus", type=Path, default=FAQ_CORPUS, help="one {id, title, text} object per line")
+    faq.add_argument("--out", type=Path, default=FAQ_INDEX_DIR, help="index directory (replaced atomically)")
+    faq.add_argument("--dense-dim", type=int, default=0,
+                     help="also store hashed dense vectors of this size for hybrid scoring")
+    faq.set_defaults(func=index_faq, database=False)
+    
+    bulk = commands.add_parser("import-transcripts", help="bulk-load conversations from NDJSON transcripts")
+    bulk.add_argument("path", help="one conversation per line (.gz accepted, - for stdin)")
+    bulk.add_argument("--batch-size", type=int, default=1000, help="conversations written per transaction")
+    bulk.add_argument("--workers", type=int, default=os.cpu_count() or 1,
+                      help="sentiment scoring processes (0 scores inline)")
+    bulk.set_defaults(func=import_conversations)
+    
+    archive = commands.add_parser("archive-conversations",
+                                  help="move cold resolved conversations into compressed monthly archives")
+    archive.add_argument("--older-than-days", type=float, default=RETENTION_DAYS,
+                         help="days since the last message (default: RETENTION_DAYS)")
+    archive.add_argument("--archive-dir", type=Path, default=ARCHIVE_DIR,
+                         help="archive root; files go in one YYYY-MM directory per month")
+    archive.add_argument("--batch-size", type=int, default=500, help="conversations archived per transaction")
+    archive.set_defaults(func=archive_cold)
+    
+    def timestamp(value):
+        return to_naive_utc(datetime.fromisoformat(value))
+    
+    export = commands.add_parser("export", help="stream conversations or messages as NDJSON or CSV")
+    export.add_argument("kind", choices=list(COLUMNS))
+    export.add_argument("--format", choices=list(FORMATS), default="ndjson")
+    export.add_argument("--start", type=timestamp, help="ISO date/time; conversations by created_at, messages by timestamp")
+    export.add_argument("--end", type=timestamp, help="exclusive upper bound, like --start")
+    export.add_argument("--status", help="only conversations with this status (and their messages)")
+    export.add_argument("--output", default="-", help="file to write (.gz compressed), - for stdout")
+    export.add_argument("--batch-size", type=int, default=5000, help="rows fetched per round trip")
+    export.add_argument("--no-archived", action="store_true", help="leave out archived conversations")
+    export.set_defaults(func=export_rows)
+    
+    args = parser.parse_args(argv)
+    if getattr(args, "database", True):
+        init_db()
+    args.func(args)
+
+if __name__ == "__main__":
+    main()
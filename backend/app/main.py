@@ -1,7 +1,18 @@
 from fastapi import FastAPI
+from fastapi.responses import Response
 from fastapi.middleware.cors import CORSMiddleware
 from app.api import chat, analytics
-from app.models.database import init_db
+from app.models.database import init_db, async_engine, async_read_engine
+from app.services.analytics_cache import analytics_cache
+from app.services.analytics_service import load_dashboard_metrics
+from app.services.context_cache import context_cache
+from app.services.event_bus import dashboard_events
+from app.services.llm import llm_client
+from app.services.metrics import CONTENT_TYPE, MetricsMiddleware, registry
+from app.services.metrics_rollup import init_rollup
+from app.services.rag_service import faq_retriever
+from app.services.sentiment import sentiment_engine
+from app.services.write_behind import write_behind
 
 app = FastAPI(title="Customer Support Agent API", version="1.0.0")
 
@@ -12,19 +23,60 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+app.add_middleware(MetricsMiddleware)
 
 app.include_router(chat.router, prefix="/api", tags=["chat"])
 app.include_router(analytics.router, prefix="/api", tags=["analytics"])
 
+registry.collect("sentiment", sentiment_engine.snapshot,
+                 counters=("requests", "cache_hits", "coalesced", "batches", "texts_scored"),
+                 gauges=("cache_hit_rate", "cache_size", "queue_depth", "workers"))
+registry.collect("llm", llm_client.snapshot,
+                 counters=("requests", "cached", "provider_replies", "fallbacks", "retries",
+                           "failures", "busy", "interrupted", "cache.hits", "cache.semantic_hits",
+                           "cache.misses", "cache.rejected", "cache.evictions"),
+                 gauges=("in_flight", "cooling_down", "cache.hit_rate", "cache.entries"))
+registry.collect("context_cache", context_cache.snapshot,
+                 counters=("hits", "misses", "evictions"),
+                 gauges=("hit_rate", "sessions", "bytes"))
+registry.collect("analytics_cache", analytics_cache.snapshot,
+                 counters=("hits", "misses"), gauges=("hit_rate", "entries"))
+registry.collect("write_behind", write_behind.snapshot,
+                 counters=("enqueued", "written", "dropped", "batches", "failures", "waits"),
+                 gauges=("queued", "max_size", "flush_ms.p95"))
+registry.collect("faq", faq_retriever.snapshot, counters=("queries",), gauges=("passages",))
+registry.collect("dashboard_events", dashboard_events.snapshot,
+                 gauges=("subscribers", "max_queue_depth"))
+
 @app.on_event("startup")
 async def startup_event():
     init_db()
+    init_rollup()
+    sentiment_engine.start()
+    dashboard_events.start(load_dashboard_metrics)
+    faq_retriever.load()
+    write_behind.start()
     print("✅ Database initialized!")
 
+@app.on_event("shutdown")
+async def shutdown_event():
+    await dashboard_events.stop()
+    await sentiment_engine.stop()
+    await llm_client.aclose()
+    await write_behind.stop()
+    await async_engine.dispose()
+    if async_read_engine is not async_engine:
+        await async_read_engine.dispose()
+
 @app.get("/")
 async def root():
     return {"message": "Customer Support Agent API", "version": "1.0.0"}
 
 @app.get("/health")
 async def health_check():
-    return {"status": "healthy"}
\ No newline at end of file
+    return {"status": "healthy"}
+
+@app.get("/metrics")
+async def metrics():
+    """Prometheus text exposition of this worker's metrics"""
+    return Response(registry.render(), media_type=CONTENT_TYPE)
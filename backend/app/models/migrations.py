@@ -0,0 +1,119 @@
+"""Versioned schema migrations for databases created by older releases.
+
+init_db() creates missing tables with create_all, which never alters a table
+that already exists. Each migration here brings such a table up to date and
+is written to be a no-op on a schema create_all has just built, so a fresh
+database simply records every version as applied. Applied versions live in
+the schema_migrations table; add new steps at the end of MIGRATIONS.
+"""
+from sqlalchemy import inspect, text
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.schema import CreateColumn
+from app.models.database import Conversation, Message
+from datetime import datetime
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Arbitrary key for the Postgres advisory lock that serializes workers starting together
+_MIGRATION_LOCK_KEY = 72064001
+
+def add_missing_columns(conn: Connection, model, names: list):
+    """ALTER TABLE ... ADD COLUMN for each of the model's columns the table lacks"""
+    existing = {column["name"] for column in inspect(conn).get_columns(model.__tablename__)}
+    for name in names:
+        if name not in existing:
+            column = CreateColumn(model.__table__.c[name]).compile(dialect=conn.dialect)
+            conn.execute(text(f"ALTER TABLE {model.__tablename__} ADD COLUMN {column}"))
+
+def create_missing_indexes(conn: Connection, model):
+    """Create the model's declared indexes that the table lacks"""
+    for index in model.__table__.indexes:
+        index.create(conn, checkfirst=True)
+
+def _sentiment_aggregates(conn: Connection):
+    add_missing_columns(conn, Conversation, [
+        "sentiment_sum", "sentiment_count", "sentiment_min",
+        "recent_sentiment_1", "recent_sentiment_2", "recent_sentiment_3"
+    ])
+    # Seed the running aggregates and the recent-score window (newest first,
+    # as update_conversation_sentiment orders it) from stored scores
+    recent = """(SELECT m.sentiment_score FROM messages m
+                WHERE m.conversation_id = conversations.id AND m.role = 'user'
+                    AND m.sentiment_score IS NOT NULL
+                ORDER BY m.timestamp DESC, m.id DESC LIMIT 1 OFFSET {})"""
+    conn.execute(text(f"""
+        UPDATE conversations SET
+            sentiment_sum = COALESCE((SELECT SUM(m.sentiment_score) FROM messages m
+                WHERE m.conversation_id = conversations.id AND m.role = 'user'), 0),
+            sentiment_count = (SELECT COUNT(m.sentiment_score) FROM messages m
+                WHERE m.conversation_id = conversations.id AND m.role = 'user'),
+            sentiment_min = (SELECT MIN(m.sentiment_score) FROM messages m
+                WHERE m.conversation_id = conversations.id AND m.role = 'user'),
+            recent_sentiment_1 = {recent.format(0)},
+            recent_sentiment_2 = {recent.format(1)},
+            recent_sentiment_3 = {recent.format(2)}
+        WHERE sentiment_count = 0 AND average_sentiment IS NOT NULL
+    """))
+
+def _message_issue_types(conn: Connection):
+    # Existing rows are tagged by `python -m app.cli backfill-issues`
+    add_missing_columns(conn, Message, ["issue_type"])
+    create_missing_indexes(conn, Message)
+
+def _hot_query_indexes(conn: Connection):
+    create_missing_indexes(conn, Conversation)
+    create_missing_indexes(conn, Message)
+
+def _conversation_summaries(conn: Connection):
+    # Existing conversations are summarized the next time they are loaded
+    add_missing_columns(conn, Conversation, ["summary", "summary_message_count", "summarized_tokens"])
+
+# (version, description, upgrade) in the order they must be applied
+MIGRATIONS = [
+    (1, "conversation sentiment aggregates", _sentiment_aggregates),
+    (2, "message issue types", _message_issue_types),
+    (3, "composite indexes for conversation lists, history and sentiment repair", _hot_query_indexes),
+    (4, "rolling conversation summaries", _conversation_summaries),
+]
+
+def applied_versions(conn: Connection) -> set:
+    conn.execute(text(
+        "CREATE TABLE IF NOT EXISTS schema_migrations ("
+        "version INTEGER PRIMARY KEY, description VARCHAR NOT NULL, applied_at TIMESTAMP NOT NULL)"
+    ))
+    return {version for (version,) in conn.execute(text("SELECT version FROM schema_migrations"))}
+
+def run_migrations(engine: Engine) -> list:
+    """Apply pending migrations, each in its own transaction; returns the versions applied"""
+    applied = []
+
+    with engine.connect() as conn:
+        postgres = conn.dialect.name == "postgresql"
+        if postgres:
+            conn.execute(text("SELECT pg_advisory_lock(:key)"), {"key": _MIGRATION_LOCK_KEY})
+            conn.commit()
+
+        try:
+            done = applied_versions(conn)
+            conn.commit()
+
+            for version, description, upgrade in MIGRATIONS:
+                if version in done:
+                    continue
+                upgrade(conn)
+                conn.execute(
+                    text("INSERT INTO schema_migrations (version, description, applied_at) "
+                         "VALUES (:version, :description, :applied_at)"),
+                    {"version": version, "description": description, "applied_at": datetime.utcnow()}
+                )
+                conn.commit()
+                logger.info("Applied migration %s: %s", version, description)
+                applied.append(version)
+        finally:
+            conn.rollback()
+            if postgres:
+                conn.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": _MIGRATION_LOCK_KEY})
+                conn.commit()
+
+    return applied
@@ -7,12 +7,19 @@ class ChatMessage(BaseModel):
     message: str
     customer_name: Optional[str] = None
 
+class ChatSocketMessage(BaseModel):
+    message: str
+    customer_name: Optional[str] = None
+
 class ChatResponse(BaseModel):
     response: str
     sentiment_score: float
     sentiment_label: str
     should_escalate: bool
     session_id: str
+    # Estimated prompt size and the tokens the rolling summary saved this turn
+    prompt_tokens: Optional[int] = None
+    prompt_tokens_saved: Optional[int] = None
 
 class MessageDetail(BaseModel):
     id: int
@@ -25,6 +32,12 @@ class MessageDetail(BaseModel):
     class Config:
         from_attributes = True
 
+class MessagePage(BaseModel):
+    items: List[MessageDetail]
+    before: Optional[str]
+    after: Optional[str]
+    has_more: bool
+
 class ConversationHistory(BaseModel):
     id: int
     session_id: str
@@ -0,0 +1,113 @@
+from collections import OrderedDict
+from fastapi.encoders import jsonable_encoder
+import asyncio
+import hashlib
+import json
+import os
+import time
+
+# Seconds a cached analytics response may be served without any write
+# invalidating it; the TTL bounds staleness from writes in other workers
+ANALYTICS_CACHE_TTLS = {
+    "dashboard": float(os.getenv("ANALYTICS_CACHE_TTL_DASHBOARD", "10")),
+    "conversations": float(os.getenv("ANALYTICS_CACHE_TTL_CONVERSATIONS", "10")),
+    "sentiment-trends": float(os.getenv("ANALYTICS_CACHE_TTL_TRENDS", "60"))
+}
+
+# Endpoints affected by each kind of write
+MESSAGE_WRITE = ("dashboard", "conversations", "sentiment-trends")
+CONVERSATION_WRITE = ("dashboard", "conversations")
+
+class CachedResponse:
+
+    def __init__(self, body: bytes, version: int, expires_at: float):
+        self.body = body
+        self.etag = '"' + hashlib.blake2b(body, digest_size=16).hexdigest() + '"'
+        self.version = version
+        self.expires_at = expires_at
+
+class AnalyticsCache:
+    """Serialized analytics responses shared by every client of this worker.
+
+    Entries are keyed on endpoint and query parameters. An entry is served
+    until its endpoint's TTL expires or a write invalidates the endpoint;
+    concurrent misses for the same key wait for a single computation.
+    """
+
+    def __init__(self, ttls: dict, max_entries: int = 256):
+        self.ttls = ttls
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._versions = {endpoint: 0 for endpoint in ttls}
+        self._entries = OrderedDict()
+        self._locks = {}
+        # Calls holding or waiting on each key's lock
+        self._waiters = {}
+
+    def invalidate(self, *endpoints: str):
+        """Mark cached responses for endpoints stale (called after writes commit)"""
+        for endpoint in endpoints:
+            self._versions[endpoint] = self._versions.get(endpoint, 0) + 1
+
+    def clear(self):
+        self._entries.clear()
+
+    async def get(self, endpoint: str, params: dict, compute) -> CachedResponse:
+        """Cached response for endpoint/params, awaiting compute() to build it on a miss"""
+        key = (endpoint, tuple(sorted(params.items())))
+
+        entry = self._fresh(endpoint, key)
+        if entry is not None:
+            self.hits += 1
+            return entry
+
+        # One lock per key while anyone computes or waits on it, so the map
+        # only ever holds keys in flight
+        lock = self._locks.get(key)
+        if lock is None:
+            lock = self._locks[key] = asyncio.Lock()
+        self._waiters[key] = self._waiters.get(key, 0) + 1
+        try:
+            async with lock:
+                entry = self._fresh(endpoint, key)
+                if entry is not None:
+                    self.hits += 1
+                    return entry
+
+                self.misses += 1
+                version = self._versions.get(endpoint, 0)
+                data = await compute()
+                body = json.dumps(jsonable_encoder(data), separators=(",", ":")).encode()
+                entry = CachedResponse(body, version, time.monotonic() + self.ttls.get(endpoint, 0))
+
+                self._entries[key] = entry
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+                return entry
+        finally:
+            self._waiters[key] -= 1
+            if not self._waiters[key]:
+                del self._waiters[key]
+                del self._locks[key]
+
+    def snapshot(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0
+        }
+
+    def _fresh(self, endpoint: str, key: tuple):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry.version != self._versions.get(endpoint, 0) or entry.expires_at <= time.monotonic():
+            return None
+        self._entries.move_to_end(key)
+        return entry
+
+analytics_cache = AnalyticsCache(ANALYTICS_CACHE_TTLS)
@@ -1,7 +1,12 @@
 from sqlalchemy.orm import Session
-from sqlalchemy import func
-from app.models.database import Conversation, Message
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.models.database import ArchivedConversation, AsyncReadSessionLocal, Conversation
+from app.services.issue_classifier import ISSUE_KEYWORDS
+from app.services.metrics_rollup import SENTIMENT_LABELS, MetricsRollupService
+from app.services.pagination import DEFAULT_PAGE_SIZE, keyset_rows, rows_page
+from app.services.sentiment_trends import SentimentTrendService
 from collections import Counter
+from datetime import datetime
 import json
 
 class AnalyticsService:
@@ -9,37 +14,24 @@ class AnalyticsService:
     def __init__(self, db: Session):
         self.db = db
     
-    def get_dashboard_stats(self):
-        """Get overall dashboard statistics"""
-        
-        # Total conversations
-        total_conversations = self.db.query(Conversation).count()
-        
-        # Resolved conversations
-        resolved_conversations = self.db.query(Conversation).filter(
-            Conversation.status == "resolved"
-        ).count()
+    def get_metrics(self) -> dict:
+        """Raw dashboard counters from the metrics rollup"""
+        return MetricsRollupService(self.db).read()
+    
+    def get_dashboard_stats(self, metrics: dict = None):
+        """Get overall dashboard statistics (one read of the metrics rollup)"""
+        metrics = metrics or self.get_metrics()
         
-        # Escalated conversations
-        escalated_conversations = self.db.query(Conversation).filter(
-            Conversation.escalated == True
-        ).count()
+        total_conversations = int(metrics["conversations_total"])
+        resolved_conversations = int(metrics["conversations_resolved"])
+        escalated_conversations = int(metrics["conversations_escalated"])
         
         # Calculate resolution rate
         resolution_rate = (resolved_conversations / total_conversations * 100) if total_conversations > 0 else 0
         
-        # Average sentiment
-        avg_sentiment_result = self.db.query(
-            func.avg(Conversation.average_sentiment)
-        ).filter(Conversation.average_sentiment.isnot(None)).scalar()
-        
-        average_sentiment = float(avg_sentiment_result) if avg_sentiment_result else 0
-        
-        # Sentiment distribution
-        sentiment_distribution = self.get_sentiment_distribution()
-        
-        # Common issues
-        common_issues = self.get_common_issues()
+        # Average of per-conversation average sentiment
+        sentiment_count = metrics["conversation_sentiment_count"]
+        average_sentiment = metrics["conversation_sentiment_sum"] / sentiment_count if sentiment_count > 0 else 0
         
         return {
             "total_conversations": total_conversations,
@@ -47,74 +39,91 @@ class AnalyticsService:
             "escalated_conversations": escalated_conversations,
             "resolution_rate": round(resolution_rate, 2),
             "average_sentiment": round(average_sentiment, 3),
-            "sentiment_distribution": sentiment_distribution,
-            "common_issues": common_issues
+            "sentiment_distribution": self.get_sentiment_distribution(metrics),
+            "common_issues": self.get_common_issues(metrics=metrics)
         }
     
-    def get_sentiment_distribution(self):
+    def get_sentiment_distribution(self, metrics: dict = None):
         """Get distribution of sentiments"""
-        messages = self.db.query(Message).filter(
-            Message.sentiment_label.isnot(None),
-            Message.role == "user"
-        ).all()
+        metrics = metrics or MetricsRollupService(self.db).read()
         
-        if not messages:
-            return {"positive": 0, "neutral": 0, "negative": 0}
+        sentiment_counts = {label: metrics[f"messages_{label}"] for label in SENTIMENT_LABELS}
+        total = sum(sentiment_counts.values())
         
-        sentiment_counts = Counter(m.sentiment_label for m in messages)
-        total = len(messages)
+        if not total:
+            return {"positive": 0, "neutral": 0, "negative": 0}
         
         return {
-            "positive": round(sentiment_counts.get("positive", 0) / total * 100, 1),
-            "neutral": round(sentiment_counts.get("neutral", 0) / total * 100, 1),
-            "negative": round(sentiment_counts.get("negative", 0) / total * 100, 1)
+            label: round(count / total * 100, 1)
+            for label, count in sentiment_counts.items()
         }
     
-    def get_common_issues(self, limit=5):
-        """Extract common issues from user messages"""
-        messages = self.db.query(Message).filter(
-            Message.role == "user"
-        ).all()
-        
-        # Keywords to look for
-        issue_keywords = {
-            "password": ["password", "login", "access", "sign in"],
-            "order": ["order", "delivery", "shipping", "track"],
-            "refund": ["refund", "return", "money back"],
-            "account": ["account", "profile", "settings"],
-            "payment": ["payment", "charge", "billing", "card"],
-            "technical": ["error", "bug", "not working", "broken"]
-        }
-        
-        issue_counts = Counter()
+    def get_common_issues(self, limit=5, metrics: dict = None):
+        """Most frequent issue categories in user messages"""
+        metrics = metrics or MetricsRollupService(self.db).read()
         
-        for message in messages:
-            content_lower = message.content.lower()
-            for issue, keywords in issue_keywords.items():
-                if any(keyword in content_lower for keyword in keywords):
-                    issue_counts[issue] += 1
+        issue_counts = Counter({
+            issue: int(metrics[f"issue_{issue}"])
+            for issue in ISSUE_KEYWORDS
+            if metrics[f"issue_{issue}"] > 0
+        })
         
         # Get top issues
         common_issues = [issue for issue, count in issue_counts.most_common(limit)]
         
         return common_issues if common_issues else ["No data yet"]
     
-    def get_sentiment_over_time(self):
-        """Get sentiment trends over time"""
-        results = self.db.query(
-            func.date(Message.timestamp).label('date'),
-            func.avg(Message.sentiment_score).label('avg_sentiment')
-        ).filter(
-            Message.sentiment_score.isnot(None),
-            Message.role == "user"
-        ).group_by(
-            func.date(Message.timestamp)
-        ).order_by('date').all()
-        
-        return [
-            {
-                "date": str(r.date),
-                "sentiment": round(float(r.avg_sentiment), 3)
-            }
-            for r in results
-        ]
\ No newline at end of file
+    def list_conversations(self, status: str = None, limit: int = DEFAULT_PAGE_SIZE,
+                           before: str = None, after: str = None):
+        """Page of conversations, newest first, optionally filtered by status.
+
+        Archived conversations are merged in: each table gives the rows
+        nearest the cursor and the page is cut from both.
+        """
+        query = self.db.query(Conversation)
+        archived = self.db.query(ArchivedConversation)
+        
+        if status:
+            query = query.filter(Conversation.status == status)
+            archived = archived.filter(ArchivedConversation.status == status)
+        
+        rows = (keyset_rows(query, Conversation.created_at, Conversation.id, limit, before, after)
+                + keyset_rows(archived, ArchivedConversation.created_at, ArchivedConversation.id,
+                              limit, before, after))
+        return rows_page(rows, lambda conversation: (conversation.created_at, conversation.id),
+                         limit, before, after)
+    
+    def get_sentiment_over_time(self, granularity: str = "day", start: datetime = None,
+                                end: datetime = None):
+        """Get sentiment trends over time from the pre-aggregated buckets"""
+        return SentimentTrendService(self.db).get_trends(granularity, start, end)
+
+class AsyncAnalyticsService:
+    """AnalyticsService on an AsyncSession; queries run through run_sync"""
+    
+    def __init__(self, db: AsyncSession):
+        self.db = db
+    
+    async def _run(self, method: str, *args, **kwargs):
+        return await self.db.run_sync(
+            lambda session: getattr(AnalyticsService(session), method)(*args, **kwargs)
+        )
+    
+    async def get_metrics(self):
+        return await self._run("get_metrics")
+    
+    async def get_dashboard_stats(self):
+        return await self._run("get_dashboard_stats")
+    
+    async def list_conversations(self, status: str = None, limit: int = DEFAULT_PAGE_SIZE,
+                                 before: str = None, after: str = None):
+        return await self._run("list_conversations", status, limit, before, after)
+    
+    async def get_sentiment_over_time(self, granularity: str = "day", start: datetime = None,
+                                      end: datetime = None):
+        return await self._run("get_sentiment_over_time", granularity, start, end)
+
+async def load_dashboard_metrics() -> dict:
+    """Rollup snapshot for the live dashboard feed, on a session of its own"""
+    async with AsyncReadSessionLocal() as db:
+        return await AsyncAnalyticsService(db).get_metrics()
@@ -0,0 +1,371 @@
+"""Bulk import of conversation transcripts, for backfills and channel imports.
+
+Transcripts are newline-delimited JSON, one conversation per line:
+
+    {"session_id": "hd-1042", "customer_name": "Ana", "created_at": "2024-03-01T09:30:00Z",
+     "status": "resolved", "messages": [{"role": "user", "content": "...",
+     "timestamp": "2024-03-01T09:30:05Z"}, {"role": "assistant", "content": "..."}]}
+
+Only session_id and messages are required. Lines are read in batches. User
+messages without a sentiment_score are scored a batch at a time, and each
+batch is written in one transaction: a multi-row INSERT of the conversations
+with their sentiment aggregates already computed, multi-row INSERTs of the
+messages, one sentiment bucket upsert and one rollup UPDATE. Sessions that
+already exist are skipped, so an interrupted import can simply be rerun.
+Imported conversations get their rolling summary the first time a turn
+loads them, like conversations stored before summaries existed.
+"""
+from sqlalchemy.orm import Session
+from sqlalchemy import insert, select
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.models.database import Conversation, Message, SENTIMENT_WINDOW
+from app.services.analytics_cache import MESSAGE_WRITE, analytics_cache
+from app.services.chat_service import escalation_needed
+from app.services.event_bus import dashboard_events
+from app.services.issue_classifier import classify_issue
+from app.services.metrics_rollup import (
+    MetricsRollupService, average_deltas, merge_deltas, message_deltas, status_deltas
+)
+from app.services.sentiment import analyze_batch, mood_for, sentiment_engine, signed_score
+from app.services.sentiment_trends import SentimentTrendService, to_naive_utc
+from datetime import datetime
+import json
+import time
+
+ROLES = ("user", "assistant")
+STATUSES = ("active", "resolved", "escalated")
+
+# Line errors kept for the import report; later ones are only counted
+MAX_REPORTED_ERRORS = 100
+
+class Transcript:
+    """One parsed conversation, messages in time order"""
+
+    __slots__ = ("session_id", "customer_name", "created_at", "status", "escalated", "messages")
+
+    def __init__(self, session_id: str, customer_name: str, created_at: datetime,
+                 status: str, escalated: bool, messages: list):
+        self.session_id = session_id
+        self.customer_name = customer_name
+        self.created_at = created_at
+        self.status = status
+        self.escalated = escalated
+        self.messages = messages
+
+class ImportResult:
+    """Running totals of an import"""
+
+    def __init__(self):
+        self.lines = 0
+        self.conversations = 0
+        self.messages = 0
+        self.skipped = 0
+        self.scored = 0
+        self.failed = 0
+        self.errors = []
+        self.started = time.perf_counter()
+
+    def error(self, line: int, reason: str):
+        self.failed += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({"line": line, "error": reason})
+
+    def to_dict(self) -> dict:
+        seconds = time.perf_counter() - self.started
+        return {
+            "lines": self.lines,
+            "conversations": self.conversations,
+            "messages": self.messages,
+            "skipped": self.skipped,
+            "scored": self.scored,
+            "failed": self.failed,
+            "errors": self.errors,
+            "seconds": round(seconds, 3),
+            "messages_per_second": round(self.messages / seconds, 1) if seconds else 0.0
+        }
+
+def parse_timestamp(value, field: str):
+    """Naive UTC datetime from an ISO 8601 string (None stays None)"""
+    if value is None:
+        return None
+    if not isinstance(value, str):
+        raise ValueError(f"{field} must be an ISO 8601 string")
+    try:
+        return to_naive_utc(datetime.fromisoformat(value.replace("Z", "+00:00")))
+    except ValueError:
+        raise ValueError(f"{field} is not an ISO 8601 timestamp: {value!r}")
+
+def parse_transcript(record) -> Transcript:
+    """Validate one decoded line; raises ValueError saying what is wrong"""
+    if not isinstance(record, dict):
+        raise ValueError("expected a JSON object")
+
+    session_id = record.get("session_id")
+    if not isinstance(session_id, str) or not session_id:
+        raise ValueError("session_id is required")
+    customer_name = record.get("customer_name")
+    if customer_name is not None and not isinstance(customer_name, str):
+        raise ValueError("customer_name must be a string")
+    status = record.get("status")
+    if status is not None and status not in STATUSES:
+        raise ValueError(f"status must be one of {', '.join(STATUSES)}")
+    escalated = record.get("escalated")
+    if escalated is not None and not isinstance(escalated, bool):
+        raise ValueError("escalated must be true or false")
+    created_at = parse_timestamp(record.get("created_at"), "created_at")
+
+    entries = record.get("messages")
+    if not isinstance(entries, list) or not entries:
+        raise ValueError("messages must be a non-empty list")
+
+    messages = []
+    for number, entry in enumerate(entries):
+        field = f"messages[{number}]"
+        if not isinstance(entry, dict):
+            raise ValueError(f"{field} must be an object")
+        role, content = entry.get("role"), entry.get("content")
+        if role not in ROLES:
+            raise ValueError(f"{field}.role must be one of {', '.join(ROLES)}")
+        if not isinstance(content, str):
+            raise ValueError(f"{field}.content must be a string")
+        score = entry.get("sentiment_score")
+        if score is not None and (isinstance(score, bool) or not isinstance(score, (int, float))):
+            raise ValueError(f"{field}.sentiment_score must be a number")
+        label = entry.get("sentiment_label")
+        if label is not None and not isinstance(label, str):
+            raise ValueError(f"{field}.sentiment_label must be a string")
+
+        messages.append({
+            "role": role,
+            "content": content,
+            "timestamp": parse_timestamp(entry.get("timestamp"), f"{field}.timestamp"),
+            "sentiment_score": float(score) if role == "user" and score is not None else None,
+            "sentiment_label": (label or mood_for(score)) if role == "user" and score is not None else None
+        })
+
+    # Untimed messages follow the one before them; the conversation starts at
+    # created_at, else its first timed message, else now
+    timestamps = [message["timestamp"] for message in messages if message["timestamp"]]
+    created_at = created_at or (min(timestamps) if timestamps else datetime.utcnow())
+    previous = created_at
+    for message in messages:
+        previous = message["timestamp"] = message["timestamp"] or previous
+    messages.sort(key=lambda message: message["timestamp"])
+
+    return Transcript(session_id, customer_name, created_at, status, escalated, messages)
+
+def parse_line(number: int, line, result: ImportResult):
+    """Transcript on one line, or None for blank and invalid lines (recorded in result)"""
+    result.lines += 1
+    try:
+        if isinstance(line, bytes):
+            line = line.decode("utf-8")
+        if not line.strip():
+            return None
+        return parse_transcript(json.loads(line))
+    except ValueError as exc:
+        result.error(number, str(exc))
+        return None
+
+def read_batches(lines, batch_size: int, result: ImportResult):
+    """Lists of up to batch_size transcripts from an iterable of lines"""
+    batch = []
+    for number, line in enumerate(lines, 1):
+        transcript = parse_line(number, line, result)
+        if transcript is not None:
+            batch.append(transcript)
+            if len(batch) >= batch_size:
+                yield batch
+                batch = []
+    if batch:
+        yield batch
+
+async def aread_batches(chunks, batch_size: int, result: ImportResult):
+    """read_batches over an async iterable of byte chunks, such as a request body"""
+    batch, buffer, number = [], b"", 0
+    async for chunk in chunks:
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            number += 1
+            transcript = parse_line(number, line, result)
+            if transcript is not None:
+                batch.append(transcript)
+        while len(batch) >= batch_size:
+            yield batch[:batch_size]
+            batch = batch[batch_size:]
+
+    if buffer.strip():
+        transcript = parse_line(number + 1, buffer, result)
+        if transcript is not None:
+            batch.append(transcript)
+    if batch:
+        yield batch
+
+def unscored(batch: list) -> list:
+    """User messages in batch that still need a sentiment score"""
+    return [
+        message
+        for transcript in batch
+        for message in transcript.messages
+        if message["role"] == "user" and message["sentiment_score"] is None
+    ]
+
+def apply_scores(messages: list, results: list):
+    """Store analyze_sentiment results on the messages they were computed for"""
+    for message, scored in zip(messages, results):
+        message["sentiment_score"], message["sentiment_label"] = signed_score(scored)
+
+def without_existing(db: Session, batch: list, result: ImportResult) -> list:
+    """Drop transcripts whose session is already stored, before any scoring work"""
+    sessions = {transcript.session_id for transcript in batch}
+    existing = {session_id for (session_id,) in db.execute(
+        select(Conversation.session_id).where(Conversation.session_id.in_(sessions))
+    )}
+    result.skipped += sum(transcript.session_id in existing for transcript in batch)
+    return [transcript for transcript in batch if transcript.session_id not in existing]
+
+def conversation_row(transcript: Transcript) -> dict:
+    """Conversation columns with the aggregates ChatService would have built message by message"""
+    scores = [message["sentiment_score"] for message in transcript.messages
+              if message["role"] == "user" and message["sentiment_score"] is not None]
+
+    # Replay the live escalation rule unless the source system recorded it
+    escalated = transcript.escalated
+    if escalated is None:
+        escalated = transcript.status == "escalated"
+        recent = []
+        for score in scores:
+            recent = [score] + recent[:SENTIMENT_WINDOW - 1]
+            escalated = escalated or escalation_needed(score, recent)
+    status = transcript.status or ("escalated" if escalated else "active")
+
+    recent = scores[::-1][:SENTIMENT_WINDOW] + [None] * SENTIMENT_WINDOW
+    return {
+        "session_id": transcript.session_id,
+        "customer_name": transcript.customer_name,
+        "created_at": transcript.created_at,
+        "status": status,
+        "escalated": escalated or status == "escalated",
+        "sentiment_sum": sum(scores),
+        "sentiment_count": len(scores),
+        "sentiment_min": min(scores) if scores else None,
+        "average_sentiment": sum(scores) / len(scores) if scores else None,
+        "recent_sentiment_1": recent[0],
+        "recent_sentiment_2": recent[1],
+        "recent_sentiment_3": recent[2]
+    }
+
+def write_batch(db: Session, batch: list) -> tuple:
+    """Insert a batch of scored transcripts in one transaction; returns (conversations, messages)"""
+    rows = {}
+    for transcript in batch:
+        # A session repeated within the batch keeps its first transcript
+        rows.setdefault(transcript.session_id, (transcript, conversation_row(transcript)))
+    if not rows:
+        return 0, 0
+
+    # Core statements on the session's connection: the ORM bulk path would
+    # fall back to one INSERT per row for these
+    connection = db.connection()
+    insert_ignoring = postgresql.insert if connection.dialect.name == "postgresql" else sqlite.insert
+    inserted = connection.execute(
+        insert_ignoring(Conversation.__table__)
+        .on_conflict_do_nothing(index_elements=["session_id"])
+        .returning(Conversation.__table__.c.id, Conversation.__table__.c.session_id),
+        [row for _, row in rows.values()]
+    ).all()
+
+    messages, scores, deltas = [], [], []
+    for conversation_id, session_id in inserted:
+        transcript, row = rows[session_id]
+        deltas.append({"conversations_total": 1})
+        deltas.append(status_deltas(None, False, row["status"], row["escalated"]))
+        deltas.append(average_deltas(None, row["average_sentiment"]))
+        for message in transcript.messages:
+            issue_type = classify_issue(message["content"]) if message["role"] == "user" else None
+            messages.append({
+                "conversation_id": conversation_id,
+                "session_id": session_id,
+                "issue_type": issue_type,
+                **message
+            })
+            if message["role"] == "user":
+                deltas.append(message_deltas(issue_type, message["sentiment_label"]))
+                scores.append((message["timestamp"], message["sentiment_score"]))
+
+    if messages:
+        connection.execute(insert(Message.__table__), messages)
+    SentimentTrendService(db).record_many(scores)
+    MetricsRollupService(db).apply(merge_deltas(*deltas))
+    db.commit()
+    return len(inserted), len(messages)
+
+def _finish(result: ImportResult) -> ImportResult:
+    if result.conversations:
+        analytics_cache.invalidate(*MESSAGE_WRITE)
+        # Live dashboards reload one snapshot rather than replaying the import
+        dashboard_events.resync()
+    return result
+
+def _record(result: ImportResult, batch: list, written: tuple):
+    conversations, messages = written
+    result.conversations += conversations
+    result.messages += messages
+    result.skipped += len(batch) - conversations
+
+def import_transcripts(db: Session, lines, batch_size: int = 1000, executor=None,
+                       workers: int = 1, on_batch=None) -> ImportResult:
+    """Import NDJSON lines with a sync session (the CLI).
+
+    With an executor (a process pool of workers processes), the next batch
+    is scored while the current one is written, split into one job per
+    worker. on_batch is called with the running result after each commit.
+    """
+    result = ImportResult()
+
+    def score(batch):
+        # Each distinct text once; the results arrive when the returned callable is called
+        texts = list(dict.fromkeys(message["content"] for message in unscored(batch)))
+        if executor is None:
+            results = dict(zip(texts, analyze_batch(texts)))
+            return lambda: results
+        size = -(-len(texts) // max(1, workers)) or 1
+        jobs = [(texts[start:start + size], executor.submit(analyze_batch, texts[start:start + size]))
+                for start in range(0, len(texts), size)]
+        return lambda: {text: scored for part, job in jobs for text, scored in zip(part, job.result())}
+
+    def write(batch, scoring):
+        messages = unscored(batch)
+        results = scoring()
+        apply_scores(messages, [results[message["content"]] for message in messages])
+        result.scored += len(messages)
+        _record(result, batch, write_batch(db, batch))
+        if on_batch is not None:
+            on_batch(result)
+
+    pending = None
+    for batch in read_batches(lines, batch_size, result):
+        batch = without_existing(db, batch, result)
+        scoring = score(batch)
+        if pending is not None:
+            write(*pending)
+        pending = (batch, scoring)
+    if pending is not None:
+        write(*pending)
+
+    return _finish(result)
+
+async def import_transcripts_async(db: AsyncSession, chunks, batch_size: int = 1000) -> ImportResult:
+    """Import an NDJSON byte stream with an AsyncSession (the API), scoring on the sentiment engine"""
+    result = ImportResult()
+    async for batch in aread_batches(chunks, batch_size, result):
+        batch = await db.run_sync(lambda session: without_existing(session, batch, result))
+        messages = unscored(batch)
+        apply_scores(messages, await sentiment_engine.analyze_many(
+            [message["content"] for message in messages]
+        ))
+        result.scored += len(messages)
+        _record(result, batch, await db.run_sync(lambda session: write_batch(session, batch)))
+    return _finish(result)
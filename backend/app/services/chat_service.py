@@ -1,7 +1,22 @@
 from sqlalchemy.orm import Session
-from app.models.database import Conversation, Message
+from sqlalchemy import case, func, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.models.database import ArchivedConversation, Conversation, Message, SENTIMENT_WINDOW
+from app.services.analytics_cache import CONVERSATION_WRITE, MESSAGE_WRITE, analytics_cache
+from app.services.context_cache import context_cache
+from app.services.event_bus import dashboard_events
+from app.services.issue_classifier import classify_issue
+from app.services.metrics_rollup import (
+    MetricsRollupService, average_deltas, merge_deltas, message_deltas, status_deltas
+)
+from app.services.pagination import DEFAULT_PAGE_SIZE, keyset_page, rows_page
+from app.services.retention import archived_messages
+from app.services.sentiment_trends import SentimentTrendService
 from datetime import datetime
 
+ESCALATION_THRESHOLD = -0.5
+NEGATIVE_THRESHOLD = -0.3
+
 class ChatService:
     
     def __init__(self, db: Session):
@@ -21,8 +36,14 @@ class ChatService:
                 status="active"
             )
             self.db.add(conversation)
+            MetricsRollupService(self.db).apply({"conversations_total": 1})
             self.db.commit()
+            analytics_cache.invalidate(*CONVERSATION_WRITE)
             self.db.refresh(conversation)
+            dashboard_events.publish(
+                metrics={"conversations_total": 1},
+                conversation=conversation_event(conversation)
+            )
         
         return conversation
     
@@ -38,33 +59,79 @@ class ChatService:
             content=content,
             sentiment_score=sentiment_score,
             sentiment_label=sentiment_label,
+            issue_type=classify_issue(content) if role == "user" else None,
             timestamp=datetime.utcnow()
         )
         
         self.db.add(message)
+        
+        # Fold the message into conversation aggregates and dashboard rollup
+        # in the same transaction
+        if role == "user":
+            deltas = message_deltas(message.issue_type, sentiment_label)
+            changes = {"id": conversation.id}
+            if sentiment_score is not None:
+                row = apply_sentiment(self.db, conversation.id, sentiment_score)
+                deltas = merge_deltas(deltas, average_deltas(
+                    previous_average(row, sentiment_score), row.average_sentiment
+                ))
+                changes["average_sentiment"] = row.average_sentiment
+                SentimentTrendService(self.db).record(message.timestamp, sentiment_score)
+            MetricsRollupService(self.db).apply(deltas)
+        
         self.db.commit()
+        context_cache.append(session_id, conversation.id, [(role, content)])
         
-        # Update conversation average sentiment
-        if sentiment_score is not None and role == "user":
-            self.update_conversation_sentiment(conversation.id)
+        if role == "user":
+            analytics_cache.invalidate(*MESSAGE_WRITE)
+            dashboard_events.publish(
+                metrics=deltas,
+                conversation=changes,
+                sentiment=(message.timestamp, sentiment_score)
+            )
         
         return message
     
     def update_conversation_sentiment(self, conversation_id: int):
-        """Calculate and update average sentiment for conversation"""
-        messages = self.db.query(Message).filter(
+        """Recompute sentiment aggregates from stored messages (repair/backfill)"""
+        user_scores = (
             Message.conversation_id == conversation_id,
             Message.role == "user",
             Message.sentiment_score.isnot(None)
-        ).all()
+        )
         
-        if messages:
-            avg_sentiment = sum(m.sentiment_score for m in messages) / len(messages)
-            conversation = self.db.query(Conversation).filter(
-                Conversation.id == conversation_id
-            ).first()
-            conversation.average_sentiment = avg_sentiment
+        total, count, minimum = self.db.query(
+            func.sum(Message.sentiment_score),
+            func.count(Message.sentiment_score),
+            func.min(Message.sentiment_score)
+        ).filter(*user_scores).one()
+        
+        recent = self.db.query(Message.sentiment_score).filter(
+            *user_scores
+        ).order_by(Message.timestamp.desc(), Message.id.desc()).limit(SENTIMENT_WINDOW).all()
+        recent = [r.sentiment_score for r in recent] + [None] * SENTIMENT_WINDOW
+        
+        conversation = self.db.query(Conversation).filter(
+            Conversation.id == conversation_id
+        ).first()
+        
+        if conversation:
+            old_average = conversation.average_sentiment
+            conversation.sentiment_sum = total or 0.0
+            conversation.sentiment_count = count
+            conversation.sentiment_min = minimum
+            conversation.average_sentiment = total / count if count else None
+            conversation.recent_sentiment_1 = recent[0]
+            conversation.recent_sentiment_2 = recent[1]
+            conversation.recent_sentiment_3 = recent[2]
+            deltas = average_deltas(old_average, conversation.average_sentiment)
+            MetricsRollupService(self.db).apply(deltas)
+            event = conversation_event(conversation)
             self.db.commit()
+            analytics_cache.invalidate(*CONVERSATION_WRITE)
+            dashboard_events.publish(metrics=deltas, conversation=event)
+        
+        return conversation
     
     def escalate_conversation(self, session_id: str):
         """Mark conversation as escalated"""
@@ -73,9 +140,14 @@ class ChatService:
         ).first()
         
         if conversation:
+            deltas = status_deltas(conversation.status, conversation.escalated, "escalated", True)
+            MetricsRollupService(self.db).apply(deltas)
             conversation.escalated = True
             conversation.status = "escalated"
+            event = conversation_event(conversation)
             self.db.commit()
+            analytics_cache.invalidate(*CONVERSATION_WRITE)
+            dashboard_events.publish(metrics=deltas, conversation=event)
     
     def resolve_conversation(self, session_id: str):
         """Mark conversation as resolved"""
@@ -84,33 +156,166 @@ class ChatService:
         ).first()
         
         if conversation:
+            deltas = status_deltas(
+                conversation.status, conversation.escalated, "resolved", conversation.escalated
+            )
+            MetricsRollupService(self.db).apply(deltas)
             conversation.status = "resolved"
+            event = conversation_event(conversation)
             self.db.commit()
+            analytics_cache.invalidate(*CONVERSATION_WRITE)
+            dashboard_events.publish(metrics=deltas, conversation=event)
     
-    def get_conversation_history(self, session_id: str):
-        """Get all messages for a conversation"""
-        messages = self.db.query(Message).filter(
-            Message.session_id == session_id
-        ).order_by(Message.timestamp).all()
+    def get_conversation_history(self, session_id: str, limit: int = DEFAULT_PAGE_SIZE,
+                                 before: str = None, after: str = None):
+        """Page of messages for a conversation, oldest first (latest page by default)"""
+        query = self.db.query(Message).filter(Message.session_id == session_id)
         
-        return messages
+        # An archived session is read from its archive file (plus any messages
+        # since), and paged in memory
+        archived = self.db.query(ArchivedConversation).filter(
+            ArchivedConversation.session_id == session_id
+        ).all()
+        if archived:
+            return rows_page(archived_messages(archived) + query.all(),
+                             lambda message: (message.timestamp, message.id),
+                             limit, before, after, newest_first=False)
+        
+        return keyset_page(query, Message.timestamp, Message.id, limit, before, after,
+                           newest_first=False)
     
     def should_escalate(self, sentiment_score: float, conversation_id: int):
         """Determine if conversation should be escalated"""
-        # Escalate if very negative sentiment
-        if sentiment_score < -0.5:
-            return True
-        
-        # Check conversation history
-        messages = self.db.query(Message).filter(
-            Message.conversation_id == conversation_id,
-            Message.role == "user"
-        ).order_by(Message.timestamp.desc()).limit(3).all()
-        
-        # Escalate if last 3 messages are all negative
-        if len(messages) >= 3:
-            recent_sentiments = [m.sentiment_score for m in messages if m.sentiment_score]
-            if all(s < -0.3 for s in recent_sentiments):
-                return True
+        conversation = self.db.query(Conversation).filter(
+            Conversation.id == conversation_id
+        ).first()
         
-        return False
\ No newline at end of file
+        recent = conversation.recent_sentiments if conversation else []
+        return escalation_needed(sentiment_score, recent)
+
+class AsyncChatService:
+    """ChatService for request handlers on an AsyncSession.
+
+    Each call runs the sync implementation through run_sync, so statements
+    go through the async driver and the event loop is never blocked.
+    """
+    
+    def __init__(self, db: AsyncSession):
+        self.db = db
+    
+    async def _run(self, method: str, *args, **kwargs):
+        return await self.db.run_sync(
+            lambda session: getattr(ChatService(session), method)(*args, **kwargs)
+        )
+    
+    async def get_or_create_conversation(self, session_id: str, customer_name: str = None):
+        return await self._run("get_or_create_conversation", session_id, customer_name)
+    
+    async def save_message(self, session_id: str, role: str, content: str,
+                           sentiment_score: float = None, sentiment_label: str = None):
+        return await self._run("save_message", session_id, role, content,
+                               sentiment_score, sentiment_label)
+    
+    async def update_conversation_sentiment(self, conversation_id: int):
+        return await self._run("update_conversation_sentiment", conversation_id)
+    
+    async def escalate_conversation(self, session_id: str):
+        return await self._run("escalate_conversation", session_id)
+    
+    async def resolve_conversation(self, session_id: str):
+        return await self._run("resolve_conversation", session_id)
+    
+    async def get_conversation_history(self, session_id: str, limit: int = DEFAULT_PAGE_SIZE,
+                                       before: str = None, after: str = None):
+        return await self._run("get_conversation_history", session_id, limit, before, after)
+    
+    async def should_escalate(self, sentiment_score: float, conversation_id: int):
+        return await self._run("should_escalate", sentiment_score, conversation_id)
+
+def conversation_event(conversation: Conversation) -> dict:
+    """A conversation as listed by /analytics/conversations, for dashboard events"""
+    return {
+        "id": conversation.id,
+        "session_id": conversation.session_id,
+        "customer_name": conversation.customer_name,
+        "status": conversation.status,
+        "escalated": conversation.escalated,
+        "average_sentiment": conversation.average_sentiment,
+        "created_at": conversation.created_at.isoformat()
+    }
+
+def apply_sentiment(db: Session, conversation_id: int, sentiment_score: float, **values):
+    """Fold a user score into the running aggregates with a single atomic UPDATE.
+
+    Returns the updated aggregates plus the (unchanged) status and escalated
+    flag, so callers can decide escalation without another query. Other
+    conversation columns to set in the same statement go in values.
+    """
+    new_sum = func.coalesce(Conversation.sentiment_sum, 0.0) + sentiment_score
+    new_count = func.coalesce(Conversation.sentiment_count, 0) + 1
+    
+    return db.execute(
+        update(Conversation)
+        .where(Conversation.id == conversation_id)
+        .values(
+            sentiment_sum=new_sum,
+            sentiment_count=new_count,
+            sentiment_min=case(
+                (Conversation.sentiment_min.is_(None), sentiment_score),
+                (Conversation.sentiment_min > sentiment_score, sentiment_score),
+                else_=Conversation.sentiment_min
+            ),
+            average_sentiment=new_sum / new_count,
+            # Shift the recent-score window; SET expressions see pre-update values
+            recent_sentiment_3=Conversation.recent_sentiment_2,
+            recent_sentiment_2=Conversation.recent_sentiment_1,
+            recent_sentiment_1=sentiment_score,
+            **values
+        )
+        .returning(
+            Conversation.sentiment_sum,
+            Conversation.sentiment_count,
+            Conversation.average_sentiment,
+            Conversation.recent_sentiment_1,
+            Conversation.recent_sentiment_2,
+            Conversation.recent_sentiment_3,
+            Conversation.status,
+            Conversation.escalated,
+            Conversation.summary_message_count
+        )
+        .execution_options(synchronize_session=False)
+    ).one()
+
+def guarded_summary(summary: dict, stored_count: int) -> dict:
+    """SET values for the summary columns that only take effect while
+    summary_message_count is still stored_count, the count the summary was
+    built from; otherwise the stored summary is kept"""
+    current = Conversation.summary_message_count == stored_count
+    return {
+        column: case((current, value), else_=getattr(Conversation, column))
+        for column, value in summary.items()
+    }
+
+def recent_window(row) -> list:
+    """Recent scores, newest first, from an apply_sentiment row"""
+    window = [row.recent_sentiment_1, row.recent_sentiment_2, row.recent_sentiment_3]
+    return [s for s in window if s is not None]
+
+def previous_average(row, sentiment_score: float):
+    """Conversation average before sentiment_score was folded in"""
+    if row.sentiment_count <= 1:
+        return None
+    return (row.sentiment_sum - sentiment_score) / (row.sentiment_count - 1)
+
+def escalation_needed(sentiment_score: float, recent_sentiments: list) -> bool:
+    """Escalation rule over the latest score and the conversation's recent window"""
+    # Escalate if very negative sentiment
+    if sentiment_score < ESCALATION_THRESHOLD:
+        return True
+    
+    # Escalate if the last SENTIMENT_WINDOW user messages are all negative
+    if len(recent_sentiments) >= SENTIMENT_WINDOW:
+        if all(s < NEGATIVE_THRESHOLD for s in recent_sentiments[:SENTIMENT_WINDOW]):
+            return True
+    
+    return False
@@ -0,0 +1,94 @@
+from app.services.issue_classifier import UNKNOWN_ISSUE, classify_issue
+import os
+import re
+
+# Prompt tokens available for history (summary, recent turns and the new message)
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "1500"))
+# Upper bound on the rolling summary itself; its oldest lines go first
+SUMMARY_TOKEN_LIMIT = int(os.getenv("SUMMARY_TOKEN_LIMIT", "300"))
+# Role and separator tokens each chat message costs on top of its text
+MESSAGE_TOKEN_OVERHEAD = 4
+
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s")
+
+def estimate_tokens(text: str) -> int:
+    """Approximate token count (about four characters per token for English)"""
+    return (len(text) + 3) // 4
+
+def message_tokens(content: str) -> int:
+    return estimate_tokens(content) + MESSAGE_TOKEN_OVERHEAD
+
+def first_sentence(content: str, limit: int) -> str:
+    sentence = _SENTENCE_END.split(" ".join(content.split()), 1)[0]
+    return sentence if len(sentence) <= limit else sentence[:limit - 3].rstrip() + "..."
+
+def fold_into_summary(summary: str, role: str, content: str, limit: int = SUMMARY_TOKEN_LIMIT) -> str:
+    """Add one message to a rolling summary.
+
+    The summary is a "Topics:" line listing the issue categories raised so far
+    followed by one short line per folded message; lines are dropped oldest
+    first to stay within limit tokens, topics are kept.
+    """
+    topics_line, *lines = summary.split("\n") if summary else ["Topics:"]
+    topics = [topic.strip() for topic in topics_line[len("Topics:"):].split(",") if topic.strip()]
+
+    if role == "user":
+        issue = classify_issue(content)
+        if issue != UNKNOWN_ISSUE and issue not in topics:
+            topics.append(issue)
+        lines.append(f"- Customer: {first_sentence(content, 120)}")
+    else:
+        lines.append(f"- Agent: {first_sentence(content, 60)}")
+
+    header = f"Topics: {', '.join(topics)}"
+    while lines and estimate_tokens(header + "\n" + "\n".join(lines)) > limit:
+        lines.pop(0)
+    return "\n".join([header] + lines)
+
+class ContextStats:
+    """Prompt sizes across turns, to show what summarization saves"""
+
+    def __init__(self):
+        self.turns = 0
+        self.prompt_tokens = 0
+        self.tokens_saved = 0
+
+    def snapshot(self) -> dict:
+        return {
+            "turns": self.turns,
+            "prompt_tokens": self.prompt_tokens,
+            "prompt_tokens_saved": self.tokens_saved,
+            "average_prompt_tokens": round(self.prompt_tokens / self.turns, 1) if self.turns else 0.0
+        }
+
+context_stats = ContextStats()
+
+def build_history(context, message: str, budget: int = CONTEXT_TOKEN_BUDGET) -> tuple:
+    """Prompt history for a turn within budget tokens: (history, prompt_tokens, tokens_saved).
+
+    The new message is always included. Recent messages are kept verbatim,
+    newest first, while they fit; older ones are folded into the context's
+    rolling summary, which leads the history as a system message. The fold
+    is kept on the context, so the next turn starts from it.
+    """
+    def used():
+        summary = message_tokens(context.summary) if context.summary else 0
+        return summary + sum(message_tokens(content) for _, content in context.messages)
+
+    current = message_tokens(message)
+    while context.messages and used() + current > budget:
+        context.fold_oldest()
+
+    history = []
+    if context.summary:
+        history.append({"role": "system", "content": "Summary of earlier conversation:\n" + context.summary})
+    history.extend(context.history())
+    history.append({"role": "user", "content": message})
+
+    prompt_tokens = used() + current
+    tokens_saved = max(0, context.summarized_tokens - (message_tokens(context.summary) if context.summary else 0))
+
+    context_stats.turns += 1
+    context_stats.prompt_tokens += prompt_tokens
+    context_stats.tokens_saved += tokens_saved
+    return history, prompt_tokens, tokens_saved
@@ -0,0 +1,177 @@
+from collections import OrderedDict, deque
+from app.services.context_builder import fold_into_summary, message_tokens
+import os
+import time
+
+# Rough per-message overhead (tuple, strings, deque slot) for the memory budget
+MESSAGE_OVERHEAD = 120
+
+class SessionContext:
+    """The latest messages of one conversation as (role, content) tuples, plus
+    a rolling summary of the messages before them"""
+
+    __slots__ = ("conversation_id", "messages", "summary", "summary_count",
+                 "summarized_tokens", "stored_count", "dirty", "last_used")
+
+    def __init__(self, conversation_id: int, max_messages: int, summary: str = None,
+                 summary_count: int = 0, summarized_tokens: int = 0):
+        self.conversation_id = conversation_id
+        self.messages = deque(maxlen=max_messages)
+        self.summary = summary or ""
+        # Messages folded into the summary, counted from the start of the conversation
+        self.summary_count = summary_count
+        self.summarized_tokens = summarized_tokens
+        # summary_message_count on the conversation row as this context last
+        # wrote (or loaded) it; summary writes only apply while it still is
+        self.stored_count = summary_count
+        # The summary has changed since it was last stored on the conversation
+        self.dirty = False
+        self.last_used = time.monotonic()
+
+    @property
+    def size(self) -> int:
+        return len(self.summary) + sum(len(content) + MESSAGE_OVERHEAD for _, content in self.messages)
+
+    def extend(self, messages: list):
+        """Add messages, folding the oldest into the summary when full"""
+        for role, content in messages:
+            if len(self.messages) == self.messages.maxlen:
+                self.fold_oldest()
+            self.messages.append((role, content))
+
+    def fold(self, role: str, content: str):
+        """Fold a message older than every kept message into the summary"""
+        self.summary = fold_into_summary(self.summary, role, content)
+        self.summary_count += 1
+        self.summarized_tokens += message_tokens(content)
+        self.dirty = True
+
+    def fold_oldest(self):
+        self.fold(*self.messages.popleft())
+
+    def summary_values(self) -> dict:
+        """Conversation columns that store the summary"""
+        return {
+            "summary": self.summary or None,
+            "summary_message_count": self.summary_count,
+            "summarized_tokens": self.summarized_tokens
+        }
+
+    def history(self) -> list:
+        return [{"role": role, "content": content} for role, content in self.messages]
+
+class ContextCache:
+    """Recent history per chat session, so most turns skip the history query.
+
+    Holds the last max_turns user/assistant pairs per session and the rolling
+    summary of everything older, written through by the chat write paths.
+    Least recently used sessions are evicted once the estimated size passes
+    memory_budget bytes (0 disables caching), and sessions idle for idle_ttl
+    seconds are dropped. Writes made by other worker processes are not seen,
+    so the cache relies on a session's turns reaching the same worker (one
+    WebSocket per session does this); idle_ttl bounds staleness otherwise.
+    A stale context never overwrites a newer stored summary: summary writes
+    are guarded on SessionContext.stored_count, and a write that finds the
+    row moved on drops the context, so the next turn reloads it.
+    """
+
+    def __init__(self, max_turns: int = 10, memory_budget: int = 32 * 1024 * 1024,
+                 idle_ttl: float = 1800):
+        self.max_messages = max_turns * 2
+        self.memory_budget = memory_budget
+        self.idle_ttl = idle_ttl
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._sessions = OrderedDict()
+        # Size each session was charged at, since contexts change in place
+        self._sizes = {}
+
+    @property
+    def enabled(self) -> bool:
+        return self.memory_budget > 0
+
+    def new_context(self, conversation_id: int = None, **summary) -> SessionContext:
+        return SessionContext(conversation_id, self.max_messages, **summary)
+
+    def __contains__(self, session_id: str) -> bool:
+        return session_id in self._sessions
+
+    def get(self, session_id: str):
+        """SessionContext for session_id, or None on a miss"""
+        context = self._sessions.get(session_id)
+        if context is not None and time.monotonic() - context.last_used > self.idle_ttl:
+            self.invalidate(session_id)
+            context = None
+
+        if context is None:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        context.last_used = time.monotonic()
+        self._sessions.move_to_end(session_id)
+        return context
+
+    def put(self, session_id: str, context: SessionContext):
+        """Cache a session's context after a cold load or after changing it in place"""
+        if not self.enabled:
+            return
+        self.invalidate(session_id)
+        context.last_used = time.monotonic()
+        self._sessions[session_id] = context
+        self._sizes[session_id] = context.size
+        self.size += self._sizes[session_id]
+        self._evict()
+
+    def append(self, session_id: str, conversation_id: int, messages: list):
+        """Write committed messages through to a cached session.
+
+        Sessions that are not cached are left alone, since their earlier
+        messages are unknown.
+        """
+        context = self._sessions.get(session_id)
+        if context is None:
+            return
+
+        context.conversation_id = conversation_id
+        context.extend(messages)
+        self.put(session_id, context)
+
+    def invalidate(self, session_id: str):
+        if self._sessions.pop(session_id, None) is not None:
+            self.size -= self._sizes.pop(session_id)
+
+    def clear(self):
+        self._sessions.clear()
+        self._sizes.clear()
+        self.size = 0
+
+    def snapshot(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "sessions": len(self._sessions),
+            "bytes": self.size,
+            "memory_budget": self.memory_budget,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+            "evictions": self.evictions
+        }
+
+    def _evict(self):
+        now = time.monotonic()
+        # Least recently used first, so idle sessions sit at the front
+        while self._sessions:
+            session_id, context = next(iter(self._sessions.items()))
+            if self.size <= self.memory_budget and now - context.last_used <= self.idle_ttl:
+                break
+            self.invalidate(session_id)
+            self.evictions += 1
+
+context_cache = ContextCache(
+    max_turns=max(1, int(os.getenv("CONTEXT_CACHE_TURNS", "10"))),
+    memory_budget=int(os.getenv("CONTEXT_CACHE_BYTES", str(32 * 1024 * 1024))),
+    idle_ttl=float(os.getenv("CONTEXT_CACHE_TTL", "1800"))
+)
@@ -0,0 +1,63 @@
+"""Sparse text embeddings for comparing short customer messages.
+
+A message becomes a bag of its content words and adjacent word pairs,
+L2-normalized, so cosine similarity is a dot product over shared features.
+This needs no model or native dependency and is good at what support
+traffic needs: recognising rephrasings of the same short question.
+"""
+import math
+import re
+
+_WORD = re.compile(r"[a-z0-9]+")
+
+# Function words that carry no meaning for matching questions
+STOPWORDS = frozenset("""
+a an the and or but if of to in on at for from with by about as into than then
+i me my mine we us our you your it its is are was were be been being am do does
+did doing have has had can could would should will shall may might must please
+this that these those there here what which who whom when where why how just so
+very too also any some all no not""".split())
+
+# Words that flip a question's meaning; tokenize(keep_negations=True) keeps
+# them (with "n't" and "cannot" read as "not"), so "I can't log in" and
+# "I can log in" stay apart where that matters
+NEGATIONS = frozenset("no not never nor none nothing nobody nowhere".split())
+_CONTRACTED_NEGATION = re.compile(r"\b(?:can|won|shan)['’]t\b|\bcannot\b|n['’]t\b")
+
+_SUFFIXES = ("ing", "ed", "es", "s")
+
+def stem(word: str) -> str:
+    """Strip a simple inflection, so "orders", "ordered" and "ordering" match "order" """
+    for suffix in _SUFFIXES:
+        if len(word) > len(suffix) + 2 and word.endswith(suffix):
+            return word[:-len(suffix)]
+    return word
+
+def tokenize(text: str, keep_negations: bool = False) -> list:
+    """Stemmed content words of text, in order, plus any NEGATIONS when keep_negations"""
+    text = text.lower()
+    if keep_negations:
+        text = _CONTRACTED_NEGATION.sub(" not", text)
+        return [word if word in NEGATIONS else stem(word) for word in _WORD.findall(text)
+                if word in NEGATIONS or (word not in STOPWORDS and len(word) > 1)]
+    return [stem(word) for word in _WORD.findall(text)
+            if word not in STOPWORDS and len(word) > 1]
+
+def embed(text: str, keep_negations: bool = False) -> dict:
+    """{feature: weight} unit vector over words and adjacent word pairs"""
+    words = tokenize(text, keep_negations)
+    features = {}
+    for word in words:
+        features[word] = features.get(word, 0.0) + 1.0
+    for pair in zip(words, words[1:]):
+        feature = " ".join(pair)
+        features[feature] = features.get(feature, 0.0) + 1.0
+
+    norm = math.sqrt(sum(weight * weight for weight in features.values()))
+    return {feature: weight / norm for feature, weight in features.items()} if norm else {}
+
+def cosine(a: dict, b: dict) -> float:
+    """Cosine similarity of two embed() vectors"""
+    if len(a) > len(b):
+        a, b = b, a
+    return sum(weight * b.get(feature, 0.0) for feature, weight in a.items())
@@ -0,0 +1,136 @@
+from app.services.metrics_rollup import merge_deltas
+from app.services.sentiment_trends import GRANULARITIES, bucket_label, bucket_start
+import asyncio
+import os
+
+class DashboardEventBus:
+    """In-process fan-out of committed dashboard changes to live subscribers.
+
+    Write paths call publish() after they commit. Changes are merged until the
+    next tick, so a burst of writes reaches each subscriber as one update:
+    rollup metric deltas are summed, conversation fields keep their latest
+    value and sentiment bucket deltas are summed per bucket. Every
+    resync_interval seconds subscribers also reload a snapshot from
+    load_metrics, which corrects drift from writes served by other workers.
+    """
+
+    def __init__(self, tick: float = 1.0, resync_interval: float = 60.0, queue_size: int = 100):
+        self.tick = tick
+        self.resync_interval = resync_interval
+        self.queue_size = queue_size
+        self._subscribers = set()
+        self._metrics = {}
+        self._conversations = {}
+        self._trends = {}
+        self._load_metrics = None
+        self._loading = None
+        self._task = None
+
+    def start(self, load_metrics):
+        """Begin ticking; load_metrics() is awaited for snapshots of the rollup"""
+        self._load_metrics = load_metrics
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            task, self._task = self._task, None
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+
+    def publish(self, metrics: dict = None, conversation: dict = None, sentiment: tuple = None):
+        """Record one committed write.
+
+        metrics are rollup deltas, conversation is the changed fields of one
+        conversation (including its id) and sentiment is the (timestamp,
+        score) of a stored user message. Ignored while nobody is listening.
+        """
+        if not self._subscribers:
+            return
+
+        if metrics:
+            self._metrics = merge_deltas(self._metrics, metrics)
+        if conversation:
+            self._conversations.setdefault(conversation["id"], {}).update(conversation)
+        if sentiment and sentiment[1] is not None:
+            timestamp, score = sentiment
+            for granularity in GRANULARITIES:
+                key = (granularity, bucket_label(bucket_start(timestamp, granularity), granularity))
+                total, count = self._trends.get(key, (0.0, 0))
+                self._trends[key] = (total + score, count + 1)
+
+    def subscribe(self) -> asyncio.Queue:
+        """Queue of events for one client; read it with next_event()"""
+        queue = asyncio.Queue(maxsize=self.queue_size)
+        # None stands for "send a fresh snapshot", which every client starts with
+        queue.put_nowait(None)
+        self._subscribers.add(queue)
+        return queue
+
+    def unsubscribe(self, queue: asyncio.Queue):
+        self._subscribers.discard(queue)
+
+    def snapshot(self) -> dict:
+        return {
+            "subscribers": len(self._subscribers),
+            # Events waiting in the fullest subscriber queue
+            "max_queue_depth": max((queue.qsize() for queue in self._subscribers), default=0)
+        }
+
+    async def next_event(self, queue: asyncio.Queue) -> dict:
+        event = await queue.get()
+        if event is None:
+            event = {"type": "snapshot", "metrics": await self._snapshot()}
+        return event
+
+    async def _snapshot(self) -> dict:
+        # Subscribers reloading together (e.g. on resync) share one read
+        if self._loading is None or self._loading.done():
+            self._loading = asyncio.ensure_future(self._load_metrics())
+        return dict(await asyncio.shield(self._loading))
+
+    def flush(self):
+        """Send the changes merged since the last tick to every subscriber"""
+        if not (self._metrics or self._conversations or self._trends):
+            return
+
+        update = {
+            "type": "update",
+            "metrics": {metric: delta for metric, delta in self._metrics.items() if delta},
+            "conversations": list(self._conversations.values()),
+            "trends": [
+                {"granularity": granularity, "date": date, "sentiment_sum": total, "count": count}
+                for (granularity, date), (total, count) in self._trends.items()
+            ]
+        }
+        self._metrics, self._conversations, self._trends = {}, {}, {}
+        self._broadcast(update)
+
+    def resync(self):
+        """Have every subscriber reload a snapshot"""
+        self._broadcast(None)
+
+    def _broadcast(self, event):
+        for queue in self._subscribers:
+            try:
+                queue.put_nowait(event)
+            except asyncio.QueueFull:
+                # Too far behind to catch up event by event; start it over from a snapshot
+                while not queue.empty():
+                    queue.get_nowait()
+                queue.put_nowait(None)
+
+    async def _run(self):
+        since_resync = 0.0
+        while True:
+            await asyncio.sleep(self.tick)
+            self.flush()
+            since_resync += self.tick
+            if since_resync >= self.resync_interval:
+                since_resync = 0.0
+                self.resync()
+
+dashboard_events = DashboardEventBus(
+    tick=float(os.getenv("DASHBOARD_EVENT_TICK", "1")),
+    resync_interval=float(os.getenv("DASHBOARD_RESYNC_INTERVAL", "60"))
+)
@@ -0,0 +1,174 @@
+"""Streaming exports of conversations and messages as NDJSON or CSV.
+
+Rows are read in batches of batch_size through a server-side cursor
+(yield_per on the CLI's Session, AsyncSession.stream for the API) and
+written out one batch at a time, so memory stays flat however many rows
+match. Rows come in primary key order, which needs no sort; start/end
+filter conversations on created_at and messages on timestamp, and status
+filters both by conversation status. Archived conversations (see
+services.retention) follow the hot rows unless include_archived is off;
+their messages are read back from the archive files one conversation at
+a time.
+"""
+from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.models.database import ArchivedConversation, Conversation, Message
+from app.services.retention import ARCHIVE_DIR, read_archived
+from datetime import datetime
+from pathlib import Path
+import asyncio
+import csv
+import io
+import json
+
+FORMATS = {"ndjson": "application/x-ndjson", "csv": "text/csv"}
+
+COLUMNS = {
+    "conversations": ("id", "session_id", "customer_name", "created_at", "status", "escalated",
+                      "average_sentiment", "archived"),
+    "messages": ("id", "conversation_id", "session_id", "role", "content", "sentiment_score",
+                 "sentiment_label", "issue_type", "timestamp")
+}
+
+def _value(value):
+    return value.isoformat() if isinstance(value, datetime) else value
+
+class Encoder:
+    """Rows to text in one format; CSV starts with header()"""
+
+    def __init__(self, kind: str, format: str):
+        if kind not in COLUMNS:
+            raise ValueError(f"kind must be one of {', '.join(COLUMNS)}")
+        if format not in FORMATS:
+            raise ValueError(f"format must be one of {', '.join(FORMATS)}")
+        self.columns = COLUMNS[kind]
+        self.format = format
+
+    def header(self) -> str:
+        return self.batch([dict(zip(self.columns, self.columns))])
+
+    def batch(self, rows: list) -> str:
+        if self.format == "ndjson":
+            return "".join(
+                json.dumps({column: _value(row.get(column)) for column in self.columns},
+                           separators=(",", ":")) + "\n"
+                for row in rows
+            )
+        buffer = io.StringIO()
+        writer = csv.writer(buffer, lineterminator="\n")
+        writer.writerows([["" if row.get(column) is None else _value(row.get(column))
+                           for column in self.columns] for row in rows])
+        return buffer.getvalue()
+
+def hot_query(kind: str, start: datetime = None, end: datetime = None, status: str = None):
+    """SELECT of the matching rows still in the hot tables, in id order"""
+    if kind == "conversations":
+        statement = select(
+            Conversation.id, Conversation.session_id, Conversation.customer_name,
+            Conversation.created_at, Conversation.status, Conversation.escalated,
+            Conversation.average_sentiment
+        )
+        column = Conversation.created_at
+    else:
+        statement = select(*(Message.__table__.c[name] for name in COLUMNS["messages"]))
+        column = Message.timestamp
+        if status:
+            statement = statement.where(Message.conversation_id.in_(
+                select(Conversation.id).where(Conversation.status == status)
+            ))
+    if kind == "conversations" and status:
+        statement = statement.where(Conversation.status == status)
+    if start:
+        statement = statement.where(column >= start)
+    if end:
+        statement = statement.where(column < end)
+    return statement.order_by(statement.selected_columns.id)
+
+def archived_query(start: datetime = None, end: datetime = None, status: str = None,
+                   kind: str = "conversations"):
+    """SELECT of the archived conversations that may hold matching rows"""
+    statement = select(ArchivedConversation)
+    if status:
+        statement = statement.where(ArchivedConversation.status == status)
+    if kind == "conversations":
+        if start:
+            statement = statement.where(ArchivedConversation.created_at >= start)
+        if end:
+            statement = statement.where(ArchivedConversation.created_at < end)
+    else:
+        # Messages fall between created_at and last_message_at
+        if start:
+            statement = statement.where(ArchivedConversation.last_message_at >= start)
+        if end:
+            statement = statement.where(ArchivedConversation.created_at < end)
+    # File order, so consecutive reads stay in one file
+    return statement.order_by(ArchivedConversation.path, ArchivedConversation.offset)
+
+def archived_conversation_row(entry) -> dict:
+    return {
+        "id": entry.id,
+        "session_id": entry.session_id,
+        "customer_name": entry.customer_name,
+        "created_at": entry.created_at,
+        "status": entry.status,
+        "escalated": entry.escalated,
+        "average_sentiment": entry.average_sentiment,
+        "archived": True
+    }
+
+def archived_message_rows(entry, transcript: dict, start: datetime = None, end: datetime = None) -> list:
+    rows = []
+    for message in transcript["messages"]:
+        timestamp = datetime.fromisoformat(message["timestamp"])
+        if (start and timestamp < start) or (end and timestamp >= end):
+            continue
+        rows.append({**message, "conversation_id": entry.id, "session_id": entry.session_id,
+                     "timestamp": timestamp})
+    return rows
+
+def export_lines(db: Session, kind: str, format: str = "ndjson", start: datetime = None,
+                 end: datetime = None, status: str = None, include_archived: bool = True,
+                 batch_size: int = 5000, archive_dir: Path = ARCHIVE_DIR):
+    """Yield the export as text chunks, one per batch of rows"""
+    encoder = Encoder(kind, format)
+    if format == "csv":
+        yield encoder.header()
+
+    result = db.execute(hot_query(kind, start, end, status).execution_options(yield_per=batch_size))
+    for batch in result.mappings().partitions():
+        yield encoder.batch([dict(row, archived=False) for row in batch])
+
+    if not include_archived:
+        return
+    entries = db.execute(archived_query(start, end, status, kind).execution_options(yield_per=batch_size))
+    for batch in entries.scalars().partitions():
+        if kind == "conversations":
+            yield encoder.batch([archived_conversation_row(entry) for entry in batch])
+        else:
+            for entry in batch:
+                yield encoder.batch(archived_message_rows(entry, read_archived(entry, archive_dir), start, end))
+
+async def aexport_lines(db: AsyncSession, kind: str, format: str = "ndjson", start: datetime = None,
+                        end: datetime = None, status: str = None, include_archived: bool = True,
+                        batch_size: int = 5000, archive_dir: Path = ARCHIVE_DIR):
+    """export_lines() on an AsyncSession, for StreamingResponse"""
+    encoder = Encoder(kind, format)
+    if format == "csv":
+        yield encoder.header()
+
+    result = await db.stream(hot_query(kind, start, end, status).execution_options(yield_per=batch_size))
+    async for batch in result.mappings().partitions():
+        yield encoder.batch([dict(row, archived=False) for row in batch])
+
+    if not include_archived:
+        return
+    entries = await db.stream(archived_query(start, end, status, kind).execution_options(yield_per=batch_size))
+    async for batch in entries.scalars().partitions():
+        if kind == "conversations":
+            yield encoder.batch([archived_conversation_row(entry) for entry in batch])
+        else:
+            for entry in batch:
+                # File reads off the event loop
+                transcript = await asyncio.to_thread(read_archived, entry, archive_dir)
+                yield encoder.batch(archived_message_rows(entry, transcript, start, end))
@@ -0,0 +1,51 @@
+from app.services.issue_classifier import compile_keyword_pattern
+
+# Keywords per intent, highest priority first: when a message mentions
+# several intents the earliest listed wins, so a complaint about a refund is
+# handled as a complaint and "hi, where is my order?" as an order question
+INTENT_KEYWORDS = {
+    "frustrated": ["frustrated", "angry", "upset", "annoyed", "terrible", "furious",
+                   "unacceptable", "ridiculous", "worst"],
+    "refund": ["refund", "return", "money back", "cancel", "cancelled", "cancellation"],
+    "payment": ["payment", "charge", "credit card", "billing", "invoice"],
+    "account": ["account", "login", "log in", "password", "sign in", "locked out"],
+    "order": ["order", "delivery", "shipping", "package", "shipment", "track", "tracking"],
+    "product": ["product", "item", "quality", "size", "color", "colour"],
+    "thanks": ["thank", "thanks", "appreciate", "great", "awesome"],
+    "help": ["help", "support", "assist", "question"],
+    "greeting": ["hello", "hi", "hey", "good morning", "good afternoon", "good evening"],
+}
+
+# Routed when no intent keyword is mentioned
+FALLBACK_INTENT = "fallback"
+
+_INTENT_PATTERN = compile_keyword_pattern(INTENT_KEYWORDS)
+_PRIORITY = {intent: rank for rank, intent in enumerate(INTENT_KEYWORDS)}
+
+class IntentMatch:
+    """Routed intent, with the share of keyword hits that point at it as confidence"""
+
+    __slots__ = ("intent", "confidence")
+
+    def __init__(self, intent: str, confidence: float):
+        self.intent = intent
+        self.confidence = confidence
+
+    def __repr__(self):
+        return f"IntentMatch({self.intent!r}, {self.confidence})"
+
+def route_intent(message: str) -> IntentMatch:
+    """Route a message with one pass of the compiled keyword pattern.
+
+    Keywords match whole words only, so "hi" does not fire on "this" or
+    "shipping". Of the intents mentioned the highest priority wins.
+    """
+    hits = {}
+    for match in _INTENT_PATTERN.finditer(message or ""):
+        hits[match.lastgroup] = hits.get(match.lastgroup, 0) + 1
+
+    if not hits:
+        return IntentMatch(FALLBACK_INTENT, 0.0)
+
+    intent = min(hits, key=_PRIORITY.__getitem__)
+    return IntentMatch(intent, round(hits[intent] / sum(hits.values()), 3))
@@ -0,0 +1,104 @@
+from sqlalchemy.orm import Session
+from sqlalchemy import update
+from app.models.database import Message
+import re
+
+# Keywords to look for, in priority order for ties at the same position
+ISSUE_KEYWORDS = {
+    "password": ["password", "login", "access", "sign in"],
+    "order": ["order", "delivery", "shipping", "track"],
+    "refund": ["refund", "return", "money back"],
+    "account": ["account", "profile", "settings"],
+    "payment": ["payment", "charge", "billing", "card"],
+    "technical": ["error", "bug", "not working", "broken"]
+}
+
+# Inflected forms matched along with a keyword. Only nouns and verbs are
+# inflected, each with its forms listed: a generic suffix turns short words
+# into false hits ("hi" into "his" and "hid"), so greetings, thanks and
+# anything not listed here match exactly as written
+KEYWORD_FORMS = {
+    "password": ["passwords"],
+    "login": ["logins"],
+    "access": ["accessed", "accessing"],
+    "sign in": ["signed in", "signing in"],
+    "log in": ["logged in", "logging in"],
+    "order": ["orders", "ordered", "ordering"],
+    "delivery": ["deliveries"],
+    "package": ["packages"],
+    "shipment": ["shipments"],
+    "track": ["tracks", "tracked"],
+    "refund": ["refunds", "refunded"],
+    "return": ["returns", "returned", "returning"],
+    "cancel": ["cancels", "canceled", "canceling", "cancelling"],
+    "account": ["accounts"],
+    "profile": ["profiles"],
+    "payment": ["payments"],
+    "charge": ["charges", "charged", "charging"],
+    "card": ["cards"],
+    "credit card": ["credit cards"],
+    "invoice": ["invoices", "invoiced"],
+    "error": ["errors"],
+    "bug": ["bugs"],
+    "product": ["products"],
+    "item": ["items"],
+    "size": ["sizes"],
+    "color": ["colors"],
+    "colour": ["colours"],
+    "question": ["questions"],
+}
+
+# Stored for user messages that mention no known issue, so they are not re-scanned
+UNKNOWN_ISSUE = "unknown"
+
+def compile_keyword_pattern(groups: dict, forms: dict = KEYWORD_FORMS) -> re.Pattern:
+    """One case-insensitive regex with a named group per category.
+
+    Keywords match whole words, in the forms listed for them in forms (so
+    "orders" or "charged", but never "his" for "hi"); multi-word keywords
+    allow any whitespace between words, and longer keywords win over their
+    prefixes. The word-start check is shared by all alternatives, so
+    positions inside words are rejected before any keyword is tried.
+    """
+    alternatives = []
+    for name, keywords in groups.items():
+        words = sorted({form for word in keywords for form in [word, *forms.get(word, ())]},
+                       key=lambda word: (-len(word), word))
+        body = "|".join(r"\s+".join(map(re.escape, word.split())) for word in words)
+        alternatives.append(rf"(?P<{name}>(?:{body})\b)")
+    return re.compile(r"(?<!\w)(?=\w)(?:" + "|".join(alternatives) + ")", re.IGNORECASE)
+
+_ISSUE_PATTERN = compile_keyword_pattern(ISSUE_KEYWORDS)
+
+def classify_issue(content: str) -> str:
+    """Issue category of a user message: the first category mentioned, else UNKNOWN_ISSUE"""
+    match = _ISSUE_PATTERN.search(content or "")
+    return match.lastgroup if match else UNKNOWN_ISSUE
+
+def backfill_issue_types(db: Session, batch_size: int = 1000) -> int:
+    """Tag user messages that have no issue_type yet; commits once per batch.
+
+    Walks the table in primary key order (keyset pagination), so each batch
+    is an indexed range read and the job can be stopped and rerun safely.
+    """
+    tagged = 0
+    last_id = 0
+
+    while True:
+        batch = db.query(Message.id, Message.content).filter(
+            Message.role == "user",
+            Message.issue_type.is_(None),
+            Message.id > last_id
+        ).order_by(Message.id).limit(batch_size).all()
+
+        if not batch:
+            return tagged
+
+        db.execute(
+            update(Message),
+            [{"id": row.id, "issue_type": classify_issue(row.content)} for row in batch]
+        )
+        db.commit()
+
+        tagged += len(batch)
+        last_id = batch[-1].id
@@ -0,0 +1,424 @@
+from app.services.intent_router import route_intent
+from app.services.rag_service import FAQRetriever, faq_retriever
+from app.services.response_cache import ResponseCache, response_cache
+from collections import deque
+from contextlib import asynccontextmanager
+import asyncio
+import httpx
+import json
+import logging
+import os
+import random
+import re
+import time
+
+logger = logging.getLogger(__name__)
+
+# Mock reply for each routed intent
+INTENT_REPLIES = {
+    "greeting": "Hello! I'm your AI support assistant. How can I help you today?",
+    "order": "I'd be happy to help with your order! Could you please provide your order number so I can look into this for you?",
+    "frustrated": "I completely understand your frustration, and I sincerely apologize for the inconvenience. Let me escalate this to a senior agent who can resolve this immediately. In the meantime, can you share more details about the issue?",
+    "refund": "I can definitely help you with that. Our return policy allows refunds within 30 days. Would you like me to start the refund process for you? I'll need your order number to proceed.",
+    "account": "I can help you with your account! Have you tried resetting your password? I can send you a password reset link to your registered email address.",
+    "payment": "Let me help you resolve this payment issue. Could you clarify what specific problem you're experiencing? I can check your billing details and transaction history.",
+    "product": "I'd be happy to provide more information about our products! Which specific item are you interested in? I can share details about features, specifications, and availability.",
+    "thanks": "You're very welcome! I'm glad I could help. Is there anything else I can assist you with today?",
+    "help": "I'm here to help! I can assist with orders, returns, account issues, product information, and more. What would you like help with?"
+}
+
+# Replies when no intent is recognised
+FALLBACK_REPLIES = [
+    "I understand your concern. Could you provide a bit more detail so I can assist you better?",
+    "Thank you for reaching out! Let me help you with that. Can you share more information about your issue?",
+    "I'm here to help resolve this for you. Could you elaborate on what you're experiencing?",
+    "I appreciate you contacting us. To better assist you, could you provide more details about your situation?"
+]
+
+def rule_based_reply(message: str) -> str:
+    """Canned reply for the message's routed intent"""
+    reply = INTENT_REPLIES.get(route_intent(message).intent)
+    return reply if reply is not None else random.choice(FALLBACK_REPLIES)
+
+async def word_chunks(text: str):
+    """Yield text word by word, for replies that exist all at once"""
+    for chunk in re.findall(r"\S+\s*", text):
+        yield chunk
+        await asyncio.sleep(0)
+
+class LLMUnavailable(RuntimeError):
+    """The provider failed or timed out, after any retries"""
+
+class LLMBusy(LLMUnavailable):
+    """Every provider slot stayed taken for the whole queue timeout"""
+
+class LLMProvider:
+    """A chat model backend.
+
+    history is the prompt history from context_builder.build_history, ending
+    with the new user message. stream() yields the reply in chunks; by
+    default it yields complete() as a single chunk.
+    """
+
+    name = "base"
+
+    async def complete(self, message: str, history: list) -> str:
+        raise NotImplementedError
+
+    async def stream(self, message: str, history: list):
+        yield await self.complete(message, history)
+
+    async def aclose(self):
+        pass
+
+class RuleBasedProvider(LLMProvider):
+    """Keyword-routed canned replies; always available"""
+
+    name = "rules"
+
+    async def complete(self, message: str, history: list) -> str:
+        return rule_based_reply(message)
+
+    async def stream(self, message: str, history: list):
+        async for chunk in word_chunks(rule_based_reply(message)):
+            yield chunk
+
+def anthropic_messages(history: list) -> tuple:
+    """(system, messages) for the Messages API from prompt history.
+
+    System entries (the rolling summary) become the system prompt, and
+    messages must alternate starting with the user, so consecutive turns of
+    one role are joined and leading assistant turns dropped.
+    """
+    system = "\n\n".join(entry["content"] for entry in history if entry["role"] == "system")
+    messages = []
+    for entry in history:
+        if entry["role"] == "system" or (not messages and entry["role"] != "user"):
+            continue
+        if messages and messages[-1]["role"] == entry["role"]:
+            messages[-1]["content"] += "\n\n" + entry["content"]
+        else:
+            messages.append({"role": entry["role"], "content": entry["content"]})
+    return system, messages
+
+class AnthropicProvider(LLMProvider):
+    """Claude over the Messages API, sharing one pooled HTTP client.
+
+    timeout bounds connecting and each read, so a stalled upstream surfaces
+    as an error instead of holding a worker; LLMClient adds the overall
+    deadline, retries and fallback.
+    """
+
+    name = "anthropic"
+
+    def __init__(self, api_key: str, model: str, base_url: str = "https://api.anthropic.com",
+                 max_tokens: int = 512, timeout: float = 10.0, connect_timeout: float = 2.0,
+                 max_connections: int = 32, system_prompt: str = ""):
+        self.model = model
+        self.max_tokens = max_tokens
+        self.system_prompt = system_prompt
+        self.client = httpx.AsyncClient(
+            base_url=base_url,
+            headers={"x-api-key": api_key, "anthropic-version": "2023-06-01"},
+            timeout=httpx.Timeout(timeout, connect=connect_timeout),
+            limits=httpx.Limits(max_connections=max_connections,
+                                max_keepalive_connections=max_connections)
+        )
+
+    def _payload(self, history: list, stream: bool) -> dict:
+        system, messages = anthropic_messages(history)
+        system = "\n\n".join(part for part in (self.system_prompt, system) if part)
+        payload = {"model": self.model, "max_tokens": self.max_tokens, "messages": messages}
+        if system:
+            payload["system"] = system
+        if stream:
+            payload["stream"] = True
+        return payload
+
+    async def complete(self, message: str, history: list) -> str:
+        response = await self.client.post("/v1/messages", json=self._payload(history, stream=False))
+        response.raise_for_status()
+        return "".join(block.get("text", "") for block in response.json()["content"]
+                       if block["type"] == "text")
+
+    async def stream(self, message: str, history: list):
+        async with self.client.stream("POST", "/v1/messages",
+                                      json=self._payload(history, stream=True)) as response:
+            if response.is_error:
+                await response.aread()
+                response.raise_for_status()
+            async for line in response.aiter_lines():
+                if not line.startswith("data:"):
+                    continue
+                event = json.loads(line[5:])
+                if event["type"] == "content_block_delta" and event["delta"]["type"] == "text_delta":
+                    yield event["delta"]["text"]
+                elif event["type"] == "error":
+                    raise LLMUnavailable(event["error"].get("message", "stream error"))
+
+    async def aclose(self):
+        await self.client.aclose()
+
+def retryable(exc: BaseException) -> bool:
+    """Timeouts, network errors, rate limiting and upstream 5xx/overloaded are worth retrying"""
+    if isinstance(exc, httpx.HTTPStatusError):
+        return exc.response.status_code == 429 or exc.response.status_code >= 500
+    return isinstance(exc, (asyncio.TimeoutError, httpx.TransportError))
+
+class LLMStats:
+    """Provider outcomes and latency, to size timeouts and concurrency"""
+
+    def __init__(self, window: int = 1000):
+        self.requests = 0
+        self.cached = 0
+        self.provider_replies = 0
+        self.fallbacks = 0
+        self.retries = 0
+        self.failures = 0
+        self.busy = 0
+        self.interrupted = 0
+        self.latencies = deque(maxlen=window)
+
+    def snapshot(self, provider: str, in_flight: int, cooling_down: bool) -> dict:
+        latencies = sorted(self.latencies)
+
+        def percentile(p):
+            if not latencies:
+                return 0.0
+            return round(latencies[min(len(latencies) - 1, int(p * len(latencies)))] * 1000, 3)
+
+        return {
+            "provider": provider,
+            "requests": self.requests,
+            "cached": self.cached,
+            "provider_replies": self.provider_replies,
+            "fallbacks": self.fallbacks,
+            "retries": self.retries,
+            "failures": self.failures,
+            "busy": self.busy,
+            "interrupted": self.interrupted,
+            "in_flight": in_flight,
+            "cooling_down": cooling_down,
+            # Time to the full reply, or to the first chunk when streaming
+            "latency_ms": {"p50": percentile(0.50), "p95": percentile(0.95), "p99": percentile(0.99)}
+        }
+
+class LLMClient:
+    """Guards a provider so a slow or failing upstream cannot take the API down.
+
+    At most max_concurrency calls reach the provider at once; a turn that
+    waits longer than queue_timeout for a slot is answered by the fallback.
+    Each attempt must produce its reply (or, when streaming, its first chunk)
+    within timeout seconds, and failed attempts that may succeed later are
+    retried up to retries times after a jittered exponential backoff. When
+    the provider still fails, the fallback answers and the provider is
+    skipped for cooldown seconds, so an outage costs one slow turn rather
+    than every turn waiting out its retries.
+
+    With a ResponseCache, repeated questions are answered from earlier
+    provider replies (also while the provider is down); fallback replies
+    are never cached. With a retriever, the top FAQ passages for the
+    message lead the provider's prompt as a system entry.
+    """
+
+    def __init__(self, provider: LLMProvider, fallback: LLMProvider, max_concurrency: int = 16,
+                 timeout: float = 10.0, queue_timeout: float = 1.0, retries: int = 2,
+                 backoff: float = 0.25, backoff_max: float = 2.0, cooldown: float = 15.0,
+                 cache: ResponseCache = None, retriever: FAQRetriever = None):
+        self.provider = provider
+        self.fallback = fallback
+        self.cache = cache
+        self.retriever = retriever
+        self.max_concurrency = max_concurrency
+        self.timeout = timeout
+        self.queue_timeout = queue_timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.backoff_max = backoff_max
+        self.cooldown = cooldown
+        self.stats = LLMStats()
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._in_flight = 0
+        self._down_until = 0.0
+
+    async def respond(self, message: str, history: list) -> str:
+        """The provider's reply (possibly cached), or the fallback's"""
+        self.stats.requests += 1
+        cached, key = self._lookup(message, history)
+        if cached is not None:
+            return cached
+
+        if self._usable():
+            history = self._grounded(message, history)
+            try:
+                async with self._slot():
+                    started = time.perf_counter()
+                    reply = await self._with_retries(
+                        lambda: asyncio.wait_for(self.provider.complete(message, history), self.timeout)
+                    )
+                self.stats.latencies.append(time.perf_counter() - started)
+                self.stats.provider_replies += 1
+                if key is not None:
+                    self.cache.store(key, reply)
+                return reply
+            except LLMUnavailable as exc:
+                self._failed(exc)
+
+        self.stats.fallbacks += 1
+        return await self.fallback.complete(message, history)
+
+    async def stream(self, message: str, history: list):
+        """Reply chunks from the provider, or from the fallback when it cannot start in time.
+
+        Once the provider has sent part of a reply a later failure ends the
+        reply there, since chunks already delivered cannot be taken back.
+        """
+        self.stats.requests += 1
+        cached, key = self._lookup(message, history)
+        if cached is not None:
+            async for chunk in word_chunks(cached):
+                yield chunk
+            return
+
+        if self._usable():
+            history = self._grounded(message, history)
+            try:
+                async with self._slot():
+                    started = time.perf_counter()
+                    chunks, first = await self._with_retries(lambda: self._first_chunk(message, history))
+                    self.stats.latencies.append(time.perf_counter() - started)
+                    self.stats.provider_replies += 1
+                    reply = [first]
+                    try:
+                        yield first
+                        async for chunk in chunks:
+                            reply.append(chunk)
+                            yield chunk
+                        if key is not None:
+                            self.cache.store(key, "".join(reply))
+                    except Exception as exc:
+                        self.stats.interrupted += 1
+                        logger.warning("LLM stream from %s interrupted: %r", self.provider.name, exc)
+                    finally:
+                        await chunks.aclose()
+                return
+            except LLMUnavailable as exc:
+                self._failed(exc)
+
+        self.stats.fallbacks += 1
+        async for chunk in self.fallback.stream(message, history):
+            yield chunk
+
+    async def aclose(self):
+        await self.provider.aclose()
+        if self.fallback is not self.provider:
+            await self.fallback.aclose()
+
+    def snapshot(self) -> dict:
+        snapshot = self.stats.snapshot(self.provider.name, self._in_flight,
+                                       time.monotonic() < self._down_until)
+        if self.cache is not None:
+            snapshot["cache"] = self.cache.snapshot()
+        return snapshot
+
+    def _lookup(self, message: str, history: list) -> tuple:
+        """(cached reply, cache key for the fresh reply); rule-based replies are not cached"""
+        if self.cache is None or self.provider is self.fallback:
+            return None, None
+        cached, key = self.cache.lookup(message, history)
+        if cached is not None:
+            self.stats.cached += 1
+        return cached, key
+
+    def _grounded(self, message: str, history: list) -> list:
+        passages = self.retriever.search(message) if self.retriever is not None else []
+        if not passages:
+            return history
+        articles = "\n".join(f"- {passage.title} {passage.text}" for passage in passages)
+        return [{"role": "system", "content": "Relevant help-center articles:\n" + articles}] + history
+
+    def _usable(self) -> bool:
+        return self.provider is not self.fallback and time.monotonic() >= self._down_until
+
+    @asynccontextmanager
+    async def _slot(self):
+        acquire = asyncio.ensure_future(self._semaphore.acquire())
+        done, _ = await asyncio.wait({acquire}, timeout=self.queue_timeout)
+        if not done:
+            # A cancelled acquire hands any permit it was given on to the next waiter
+            acquire.cancel()
+            raise LLMBusy(f"all {self.max_concurrency} provider slots busy")
+
+        self._in_flight += 1
+        try:
+            yield
+        finally:
+            self._in_flight -= 1
+            self._semaphore.release()
+
+    async def _first_chunk(self, message: str, history: list) -> tuple:
+        chunks = self.provider.stream(message, history).__aiter__()
+        try:
+            return chunks, await asyncio.wait_for(chunks.__anext__(), self.timeout)
+        except StopAsyncIteration:
+            return chunks, ""
+        except BaseException:
+            await chunks.aclose()
+            raise
+
+    async def _with_retries(self, attempt):
+        for number in range(self.retries + 1):
+            try:
+                return await attempt()
+            except Exception as exc:
+                if number == self.retries or not retryable(exc):
+                    raise LLMUnavailable(f"{self.provider.name}: {exc!r}") from exc
+                self.stats.retries += 1
+                # Full jitter keeps retries from many turns from arriving in step
+                await asyncio.sleep(random.uniform(0, min(self.backoff_max, self.backoff * 2 ** number)))
+
+    def _failed(self, exc: LLMUnavailable):
+        if isinstance(exc, LLMBusy):
+            # Expected under load; the busy counter tracks it
+            self.stats.busy += 1
+            return
+        self.stats.failures += 1
+        self._down_until = time.monotonic() + self.cooldown
+        logger.warning("LLM provider failed, using rule-based replies for %ss: %s", self.cooldown, exc)
+
+def create_llm_client() -> LLMClient:
+    """LLMClient for LLM_PROVIDER (anthropic when ANTHROPIC_API_KEY is set, else rules)"""
+    rules = RuleBasedProvider()
+    name = os.getenv("LLM_PROVIDER") or ("anthropic" if os.getenv("ANTHROPIC_API_KEY") else "rules")
+    timeout = float(os.getenv("LLM_TIMEOUT", "10"))
+    max_concurrency = int(os.getenv("LLM_MAX_CONCURRENCY", "16"))
+
+    if name == "rules":
+        provider = rules
+    elif name == "anthropic":
+        provider = AnthropicProvider(
+            api_key=os.getenv("ANTHROPIC_API_KEY", ""),
+            model=os.getenv("LLM_MODEL", "claude-3-5-haiku-latest"),
+            base_url=os.getenv("LLM_BASE_URL", "https://api.anthropic.com"),
+            max_tokens=int(os.getenv("LLM_MAX_TOKENS", "512")),
+            timeout=timeout,
+            connect_timeout=float(os.getenv("LLM_CONNECT_TIMEOUT", "2")),
+            max_connections=max_concurrency,
+            system_prompt=os.getenv("LLM_SYSTEM_PROMPT", "You are a friendly, concise customer support agent.")
+        )
+    else:
+        raise ValueError(f"Unknown LLM_PROVIDER {name!r} (expected anthropic or rules)")
+
+    return LLMClient(
+        provider,
+        fallback=rules,
+        max_concurrency=max_concurrency,
+        timeout=timeout,
+        queue_timeout=float(os.getenv("LLM_QUEUE_TIMEOUT", "1")),
+        retries=int(os.getenv("LLM_RETRIES", "2")),
+        cooldown=float(os.getenv("LLM_COOLDOWN", "15")),
+        cache=response_cache,
+        retriever=faq_retriever
+    )
+
+llm_client = create_llm_client()
@@ -0,0 +1,225 @@
+"""Process metrics in the Prometheus text exposition format, served on /metrics.
+
+Counters and histograms are kept in memory per worker process and scraped
+as text; prometheus_client is not needed. Each chat turn records the time
+spent in each stage in chat_stage_seconds. MetricsMiddleware times every
+HTTP request and counts the SQL statements and commits it issues through
+the engine events in app.models.database. Services that already keep
+their own stats (sentiment, LLM, caches, write-behind queue) are read at
+scrape time through collect(), so the hot paths pay nothing extra for them.
+"""
+from app.models.database import QueryCounter, count_queries
+from contextlib import contextmanager
+import bisect
+import threading
+import time
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Seconds; from a cached lookup up to a slow LLM reply
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# Statements per request, around the chat turn's budget of 7
+QUERY_BUCKETS = (0, 1, 2, 3, 4, 5, 6, 7, 8, 10, 15, 25, 50)
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+def _labels(names: tuple, values: tuple, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+def _number(value) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class Counter:
+    """A monotonically increasing count per label set"""
+
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labels: tuple = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels):
+        key = tuple(labels.get(name, "") for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(tuple(labels.get(name, "") for name in self.labelnames), 0)
+
+    def samples(self):
+        for key, value in sorted(self._values.items()):
+            yield f"{self.name}{_labels(self.labelnames, key)} {_number(value)}"
+
+class Histogram:
+    """Observations counted into cumulative buckets per label set"""
+
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labels: tuple = (), buckets: tuple = LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labels)
+        self.buckets = tuple(sorted(buckets))
+        # Per label set: [count per bucket (+Inf last), sum]
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = tuple(labels.get(name, "") for name in self.labelnames)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            counts = self._values.get(key)
+            if counts is None:
+                counts = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            counts[0][index] += 1
+            counts[1] += value
+
+    @contextmanager
+    def time(self, **labels):
+        """Observe the seconds spent in the with block"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def count(self, **labels) -> int:
+        counts = self._values.get(tuple(labels.get(name, "") for name in self.labelnames))
+        return sum(counts[0]) if counts else 0
+
+    def samples(self):
+        for key, (counts, total) in sorted(self._values.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = 'le="' + _number(bound) + '"'
+                yield f"{self.name}_bucket{_labels(self.labelnames, key, le)} {cumulative}"
+            yield f"{self.name}_sum{_labels(self.labelnames, key)} {_number(total)}"
+            yield f"{self.name}_count{_labels(self.labelnames, key)} {cumulative}"
+
+class MetricsRegistry:
+    """Metrics of this process and the service stats read at scrape time"""
+
+    def __init__(self, prefix: str = "support_"):
+        self.prefix = prefix
+        self._metrics = []
+        self._collectors = []
+
+    def counter(self, name: str, help: str, labels: tuple = ()) -> Counter:
+        return self._add(Counter(self.prefix + name, help, labels))
+
+    def histogram(self, name: str, help: str, labels: tuple = (),
+                  buckets: tuple = LATENCY_BUCKETS) -> Histogram:
+        return self._add(Histogram(self.prefix + name, help, labels, buckets))
+
+    def collect(self, name: str, snapshot, counters: tuple = (), gauges: tuple = ()):
+        """Expose fields of snapshot() (a stats dict) as {prefix}{name}_{field}.
+
+        counters are cumulative fields (exported with a _total suffix), gauges
+        current values; a dotted field ("cache.hits") reads a nested dict.
+        """
+        self._collectors.append((name, snapshot, counters, gauges))
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.samples())
+
+        for name, snapshot, counters, gauges in self._collectors:
+            stats = snapshot()
+            for fields, kind, suffix in ((counters, "counter", "_total"), (gauges, "gauge", "")):
+                for field in fields:
+                    value = stats
+                    for part in field.split("."):
+                        value = value.get(part) if isinstance(value, dict) else None
+                    if value is None:
+                        continue
+                    metric = f"{self.prefix}{name}_{field.replace('.', '_')}{suffix}"
+                    lines.append(f"# HELP {metric} {name} {field.replace('.', ' ').replace('_', ' ')}")
+                    lines.append(f"# TYPE {metric} {kind}")
+                    lines.append(f"{metric} {_number(float(value) if isinstance(value, bool) else value)}")
+        return "\n".join(lines) + "\n"
+
+    def _add(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+registry = MetricsRegistry()
+
+http_requests = registry.counter(
+    "http_requests_total", "HTTP requests by route and status", ("method", "route", "status")
+)
+http_request_seconds = registry.histogram(
+    "http_request_duration_seconds", "Time to the end of the response", ("method", "route")
+)
+http_request_statements = registry.histogram(
+    "http_request_sql_statements", "SQL statements issued per request", ("method", "route"), QUERY_BUCKETS
+)
+http_request_commits = registry.histogram(
+    "http_request_sql_commits", "Commits per request", ("method", "route"), QUERY_BUCKETS
+)
+chat_stage_seconds = registry.histogram(
+    "chat_stage_seconds", "Time spent in each stage of a chat turn", ("stage",)
+)
+
+def stage(name: str):
+    """Time a stage of a chat turn into chat_stage_seconds"""
+    return chat_stage_seconds.time(stage=name)
+
+class StageTimer:
+    """Times consecutive stages: lap(name) records the time since the previous lap"""
+
+    def __init__(self):
+        self.last = time.perf_counter()
+
+    def lap(self, name: str):
+        now = time.perf_counter()
+        chat_stage_seconds.observe(now - self.last, stage=name)
+        self.last = now
+
+class MetricsMiddleware:
+    """Times each HTTP request and counts its SQL statements and commits.
+
+    Labelled by the matched route's path template, so /api/chat/history/{session_id}
+    is one series however many sessions there are. Websockets pass through.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+
+        async def send_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        counter = QueryCounter()
+        started = time.perf_counter()
+        try:
+            with count_queries(counter):
+                await self.app(scope, receive, send_status)
+        finally:
+            route = scope.get("route")
+            labels = {"method": scope["method"], "route": getattr(route, "path", "unmatched")}
+            http_request_seconds.observe(time.perf_counter() - started, **labels)
+            http_request_statements.observe(counter.statements, **labels)
+            http_request_commits.observe(counter.commits, **labels)
+            http_requests.inc(status=status, **labels)
@@ -0,0 +1,193 @@
+from sqlalchemy.orm import Session
+from sqlalchemy import case, delete, func, insert, update
+from app.models.database import (
+    ArchivedMetric, Conversation, Message, MetricsRollup, PendingRollup, SessionLocal
+)
+from datetime import datetime
+from app.services.issue_classifier import ISSUE_KEYWORDS
+from app.services.sentiment_trends import SentimentTrendService
+
+SENTIMENT_LABELS = ("positive", "neutral", "negative")
+
+# Every counter kept in the rollup table
+METRICS = (
+    ["conversations_total", "conversations_resolved", "conversations_escalated",
+     "conversation_sentiment_sum", "conversation_sentiment_count"]
+    + [f"messages_{label}" for label in SENTIMENT_LABELS]
+    + [f"issue_{issue}" for issue in ISSUE_KEYWORDS]
+)
+
+def message_deltas(issue_type: str = None, sentiment_label: str = None) -> dict:
+    """Rollup changes for one stored user message"""
+    deltas = {}
+    if issue_type in ISSUE_KEYWORDS:
+        deltas[f"issue_{issue_type}"] = 1
+    if sentiment_label in SENTIMENT_LABELS:
+        deltas[f"messages_{sentiment_label}"] = 1
+    return deltas
+
+def average_deltas(old_average: float, new_average: float) -> dict:
+    """Rollup changes when a conversation's average sentiment moves"""
+    if new_average is None:
+        if old_average is None:
+            return {}
+        return {"conversation_sentiment_sum": -old_average, "conversation_sentiment_count": -1}
+    if old_average is None:
+        return {"conversation_sentiment_sum": new_average, "conversation_sentiment_count": 1}
+    return {"conversation_sentiment_sum": new_average - old_average}
+
+def status_deltas(old_status: str, old_escalated: bool, new_status: str, new_escalated: bool) -> dict:
+    """Rollup changes for a conversation status transition"""
+    deltas = {}
+    resolved_change = int(new_status == "resolved") - int(old_status == "resolved")
+    escalated_change = int(bool(new_escalated)) - int(bool(old_escalated))
+    if resolved_change:
+        deltas["conversations_resolved"] = resolved_change
+    if escalated_change:
+        deltas["conversations_escalated"] = escalated_change
+    return deltas
+
+def merge_deltas(*parts: dict) -> dict:
+    merged = {}
+    for part in parts:
+        for metric, delta in part.items():
+            merged[metric] = merged.get(metric, 0) + delta
+    return merged
+
+class MetricsRollupService:
+    """Dashboard counters kept up to date by the write paths.
+
+    Writers call apply() inside their own transaction, so the rollup commits
+    or rolls back together with the rows it describes. Chat turns running
+    with write-behind call defer() instead: their deltas still commit with
+    their messages, as a pending_rollups row, and apply_pending() adds those
+    rows to the counters summed, from the queue's group commit (and on
+    startup, for rows a crashed worker left). The dashboard reads the whole
+    (fixed size) table in one query.
+    """
+
+    def __init__(self, db: Session):
+        self.db = db
+
+    def apply(self, deltas: dict):
+        """Add deltas to their counters with a single UPDATE (no commit)"""
+        deltas = {metric: delta for metric, delta in deltas.items() if delta}
+        if not deltas:
+            return
+
+        self.db.execute(
+            update(MetricsRollup)
+            .where(MetricsRollup.metric.in_(list(deltas)))
+            .values(value=MetricsRollup.value + case(
+                *[(MetricsRollup.metric == metric, delta) for metric, delta in deltas.items()],
+                else_=0
+            ))
+            .execution_options(synchronize_session=False)
+        )
+
+    def defer(self, deltas: dict, timestamp: datetime, sentiment_score: float):
+        """Store deltas and a trend score for apply_pending() with one INSERT (no commit)"""
+        self.db.execute(insert(PendingRollup).values(
+            deltas={metric: delta for metric, delta in deltas.items() if delta},
+            timestamp=timestamp,
+            sentiment_score=sentiment_score
+        ))
+
+    def apply_pending(self) -> int:
+        """Move every deferred delta and score into the rollup and the trend
+        buckets (no commit); returns how many turns were applied.
+
+        DELETE ... RETURNING claims the rows, so two workers applying at
+        once never add the same row twice.
+        """
+        rows = self.db.execute(delete(PendingRollup).returning(
+            PendingRollup.deltas, PendingRollup.timestamp, PendingRollup.sentiment_score
+        )).all()
+        if rows:
+            self.apply(merge_deltas(*(row.deltas for row in rows)))
+            SentimentTrendService(self.db).record_many(
+                (row.timestamp, row.sentiment_score) for row in rows
+            )
+        return len(rows)
+
+    def read(self) -> dict:
+        values = {metric: 0 for metric in METRICS}
+        values.update(self.db.query(MetricsRollup.metric, MetricsRollup.value).all())
+        return values
+
+    def ensure_initialized(self):
+        """Create missing counter rows; rebuild from raw data if the table was empty"""
+        existing = {m for (m,) in self.db.query(MetricsRollup.metric).all()}
+        if not existing:
+            self.rebuild()
+            return
+
+        missing = [metric for metric in METRICS if metric not in existing]
+        if missing:
+            self.db.add_all(MetricsRollup(metric=metric, value=0) for metric in missing)
+            self.db.commit()
+
+    def rebuild(self):
+        """Recompute every counter from conversations and messages, adding
+        back what archived conversations contributed.
+
+        Writes that land while the rebuild scans are not reflected; run it
+        when traffic is quiet or run it again afterwards. Pending deltas are
+        applied first, since the scan counts the messages they describe.
+        """
+        self.apply_pending()
+        values = {metric: 0 for metric in METRICS}
+
+        total, resolved, escalated, sentiment_sum, sentiment_count = self.db.query(
+            func.count(Conversation.id),
+            func.sum(case((Conversation.status == "resolved", 1), else_=0)),
+            func.sum(case((Conversation.escalated == True, 1), else_=0)),
+            func.sum(Conversation.average_sentiment),
+            func.count(Conversation.average_sentiment)
+        ).one()
+        values.update({
+            "conversations_total": total,
+            "conversations_resolved": resolved or 0,
+            "conversations_escalated": escalated or 0,
+            "conversation_sentiment_sum": sentiment_sum or 0.0,
+            "conversation_sentiment_count": sentiment_count
+        })
+
+        label_counts = self.db.query(Message.sentiment_label, func.count(Message.id)).filter(
+            Message.role == "user",
+            Message.sentiment_label.in_(SENTIMENT_LABELS)
+        ).group_by(Message.sentiment_label).all()
+        for label, count in label_counts:
+            values[f"messages_{label}"] = count
+
+        issue_counts = self.db.query(Message.issue_type, func.count(Message.id)).filter(
+            Message.role == "user",
+            Message.issue_type.in_(list(ISSUE_KEYWORDS))
+        ).group_by(Message.issue_type).all()
+        for issue, count in issue_counts:
+            values[f"issue_{issue}"] = count
+
+        for metric, value in self.db.query(ArchivedMetric.metric, ArchivedMetric.value):
+            if metric in values:
+                values[metric] += value
+
+        self.db.query(MetricsRollup).delete(synchronize_session=False)
+        self.db.add_all(MetricsRollup(metric=metric, value=value) for metric, value in values.items())
+        self.db.commit()
+        return values
+
+def init_rollup():
+    """Create the rollups on startup (rebuilding them for existing data)"""
+    db = SessionLocal()
+    try:
+        rollup = MetricsRollupService(db)
+        trends = SentimentTrendService(db)
+        rebuild_trends = trends.is_empty()
+        # Deltas whose turns committed but whose worker died before applying them
+        if rollup.apply_pending():
+            db.commit()
+        rollup.ensure_initialized()
+        if rebuild_trends:
+            trends.rebuild()
+    finally:
+        db.close()
@@ -0,0 +1,102 @@
+from sqlalchemy import tuple_
+from sqlalchemy.orm import Query
+from datetime import datetime
+import base64
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+def encode_cursor(timestamp: datetime, row_id: int) -> str:
+    """Opaque cursor for a row's position in (timestamp, id) order"""
+    raw = f"{timestamp.isoformat()}|{row_id}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+def decode_cursor(cursor: str) -> tuple:
+    """(timestamp, id) from encode_cursor; raises ValueError for malformed cursors"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        timestamp, row_id = raw.rsplit("|", 1)
+        return datetime.fromisoformat(timestamp), int(row_id)
+    except (UnicodeDecodeError, ValueError, TypeError) as exc:
+        raise ValueError(f"Invalid cursor: {cursor!r}") from exc
+
+class Page:
+    """One page of rows plus cursors for the pages either side of it"""
+
+    def __init__(self, items: list, before: str, after: str, has_more: bool):
+        self.items = items
+        self.before = before
+        self.after = after
+        self.has_more = has_more
+
+    def to_dict(self, serialize) -> dict:
+        return {
+            "items": [serialize(item) for item in self.items],
+            "before": self.before,
+            "after": self.after,
+            "has_more": self.has_more
+        }
+
+def keyset_rows(query: Query, time_column, id_column, limit: int = DEFAULT_PAGE_SIZE,
+                before: str = None, after: str = None) -> list:
+    """The limit + 1 rows of query nearest the cursor in the direction of travel"""
+    if before and after:
+        raise ValueError("Pass either before or after, not both")
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+    position = tuple_(time_column, id_column)
+
+    if after:
+        return query.filter(position > tuple_(*decode_cursor(after))).order_by(
+            time_column, id_column
+        ).limit(limit + 1).all()
+    if before:
+        query = query.filter(position < tuple_(*decode_cursor(before)))
+    return query.order_by(time_column.desc(), id_column.desc()).limit(limit + 1).all()
+
+def keyset_page(query: Query, time_column, id_column, limit: int = DEFAULT_PAGE_SIZE,
+                before: str = None, after: str = None, newest_first: bool = True) -> Page:
+    """Page of query ordered by (time_column, id_column) using keyset conditions.
+
+    With no cursor the page holds the newest rows; before pages towards older
+    rows and after towards newer ones. Each page is one indexed range read of
+    at most limit + 1 rows however deep the client has scrolled. Items come
+    back newest first, or oldest first with newest_first=False; has_more
+    tells whether rows remain beyond the page in the direction of travel.
+    """
+    rows = keyset_rows(query, time_column, id_column, limit, before, after)
+    return _page(rows, bool(after), limit, before, after, newest_first,
+                 lambda row: (getattr(row, time_column.key), getattr(row, id_column.key)))
+
+def rows_page(rows, position, limit: int = DEFAULT_PAGE_SIZE, before: str = None,
+              after: str = None, newest_first: bool = True) -> Page:
+    """keyset_page over rows already in memory, e.g. candidates merged from
+    several sources; position(row) gives its (timestamp, id)"""
+    if before and after:
+        raise ValueError("Pass either before or after, not both")
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+
+    if after:
+        cursor = decode_cursor(after)
+        rows = sorted((row for row in rows if position(row) > cursor), key=position)
+    else:
+        if before:
+            cursor = decode_cursor(before)
+            rows = (row for row in rows if position(row) < cursor)
+        rows = sorted(rows, key=position, reverse=True)
+    return _page(rows[:limit + 1], bool(after), limit, before, after, newest_first, position)
+
+def _page(rows: list, ascending: bool, limit: int, before: str, after: str,
+          newest_first: bool, position) -> Page:
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    if ascending == newest_first:
+        rows.reverse()
+
+    if not rows:
+        # Echo the cursor so a client polling with after can simply retry
+        return Page([], before=before, after=after, has_more=False)
+
+    oldest, newest = (rows[-1], rows[0]) if newest_first else (rows[0], rows[-1])
+    return Page(rows, before=encode_cursor(*position(oldest)), after=encode_cursor(*position(newest)),
+                has_more=has_more)
@@ -0,0 +1,187 @@
+"""EXPLAIN checks for the queries on the request path.
+
+Each hot path is run through the real service code while its SELECTs are
+captured, then every captured statement is EXPLAINed with the same
+parameters. A path regresses when a plan reads a whole table, sorts rows
+instead of reading them in index order, or stops using an index the path
+is expected to use. tests/test_query_plans.py fails on any of these
+against a seeded database, and `python -m app.cli check-query-plans`
+reports them for a real one.
+"""
+from sqlalchemy import event, insert, text
+from sqlalchemy.orm import Session
+from app.models.database import Conversation, Message
+from app.services.analytics_service import AnalyticsService
+from app.services.chat_service import ChatService
+from app.services.turn_processor import TurnProcessor
+from datetime import datetime, timedelta
+import random
+import re
+
+# SQLite reports a full table scan as "SCAN <table>" ("SCAN TABLE <table>" before 3.36)
+_SQLITE_TABLE_SCAN = re.compile(r"^SCAN (?:TABLE )?\w+(?: AS \w+)?$")
+_SQLITE_SORT = re.compile(r"^USE TEMP B-TREE")
+_POSTGRES_TABLE_SCAN = re.compile(r"Seq Scan")
+_POSTGRES_SORT = re.compile(r"^\s*(?:->\s+)?(?:Incremental )?Sort\b")
+
+class PlanSample:
+    """Ids the hot paths are run against"""
+
+    def __init__(self, session_id: str, conversation_id: int, start: datetime, end: datetime):
+        self.session_id = session_id
+        self.conversation_id = conversation_id
+        self.start = start
+        self.end = end
+
+def _history_pages(db: Session, sample: PlanSample):
+    chat_service = ChatService(db)
+    page = chat_service.get_conversation_history(sample.session_id, limit=2)
+    chat_service.get_conversation_history(sample.session_id, limit=2, before=page.before)
+
+def _conversation_pages(db: Session, sample: PlanSample):
+    analytics_service = AnalyticsService(db)
+    page = analytics_service.list_conversations(limit=10)
+    analytics_service.list_conversations(limit=10, before=page.before)
+
+# (name, run, indexes) for each hot path; run(db, sample) issues the path's
+# queries and their plans must use every index listed
+HOT_QUERIES = [
+    ("conversation by session",
+     lambda db, s: ChatService(db).get_or_create_conversation(s.session_id),
+     ["ix_conversations_session_id"]),
+    ("turn history",
+     lambda db, s: TurnProcessor(db).begin(s.session_id, "query plan check"),
+     ["ix_conversations_session_id", "ix_messages_conversation_timestamp_id"]),
+    ("history pages", _history_pages, ["ix_messages_session_timestamp_id"]),
+    ("escalation window",
+     lambda db, s: ChatService(db).should_escalate(0.0, s.conversation_id),
+     []),
+    ("sentiment repair",
+     lambda db, s: ChatService(db).update_conversation_sentiment(s.conversation_id),
+     ["ix_messages_scored_conversation_role_timestamp"]),
+    ("conversation pages", _conversation_pages, ["ix_conversations_created_at_id"]),
+    ("conversations by status",
+     lambda db, s: AnalyticsService(db).list_conversations(status="escalated", limit=10),
+     ["ix_conversations_status_created_at_id"]),
+    ("sentiment trends",
+     lambda db, s: AnalyticsService(db).get_sentiment_over_time("hour", s.start, s.end),
+     []),
+]
+
+class PlanResult:
+    """Plans for one hot path and what is wrong with them (nothing when problems is empty)"""
+
+    def __init__(self, name: str, plans: list, problems: list):
+        self.name = name
+        self.plans = plans
+        self.problems = problems
+
+def capture_selects(db: Session, run) -> list:
+    """(statement, parameters) for every SELECT issued while run() executes"""
+    captured = []
+
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith("SELECT"):
+            captured.append((statement, parameters))
+
+    bind = db.get_bind()
+    event.listen(bind, "before_cursor_execute", capture)
+    try:
+        run()
+    finally:
+        event.remove(bind, "before_cursor_execute", capture)
+    return captured
+
+def explain(db: Session, statement: str, parameters) -> tuple:
+    """(plan lines, lines that scan a whole table or sort) for one driver-level statement"""
+    connection = db.connection()
+    dialect = connection.dialect.name
+
+    if dialect == "sqlite":
+        rows = connection.exec_driver_sql("EXPLAIN QUERY PLAN " + statement, parameters).all()
+        plan = [row[-1] for row in rows]
+        scan, sort = _SQLITE_TABLE_SCAN, _SQLITE_SORT
+    elif dialect == "postgresql":
+        # Small seeded tables are cheaper to scan than to index; with seq scans
+        # priced out, a Seq Scan in the plan means no usable index exists
+        connection.exec_driver_sql("SET LOCAL enable_seqscan = off")
+        plan = [row[0] for row in connection.exec_driver_sql("EXPLAIN " + statement, parameters)]
+        db.rollback()
+        scan, sort = _POSTGRES_TABLE_SCAN, _POSTGRES_SORT
+    else:
+        raise ValueError(f"Query plans are not checked for the {dialect} dialect")
+
+    return plan, [line.strip() for line in plan if scan.search(line) or sort.search(line)]
+
+def check_query_plans(db: Session, sample: PlanSample) -> list:
+    """PlanResult for every hot path"""
+    results = []
+    for name, run, indexes in HOT_QUERIES:
+        plans, problems = [], []
+        for statement, parameters in capture_selects(db, lambda: run(db, sample)):
+            plan, bad_lines = explain(db, statement, parameters)
+            plans.append((statement, plan))
+            problems.extend(bad_lines)
+        db.rollback()
+
+        used = " ".join(line for _, plan in plans for line in plan)
+        problems.extend(f"does not use {index}" for index in indexes if index not in used)
+        results.append(PlanResult(name, plans, problems))
+    return results
+
+def pick_sample(db: Session) -> PlanSample:
+    """Run the paths against the most recent conversation that has messages"""
+    latest = db.query(Message.session_id, Message.conversation_id, Message.timestamp).order_by(
+        Message.id.desc()
+    ).first()
+    if latest is None:
+        raise ValueError("No messages to check query plans against; use --seed on an empty database")
+    return PlanSample(latest.session_id, latest.conversation_id,
+                      latest.timestamp - timedelta(days=1), latest.timestamp + timedelta(hours=1))
+
+def seed_sample_data(db: Session, conversations: int, messages_per_conversation: int = 6,
+                     batch_size: int = 1000) -> int:
+    """Fill an empty database with synthetic conversations; returns conversations added"""
+    if db.query(Conversation.id).first() is not None:
+        return 0
+
+    rng = random.Random(0)
+    started = datetime.utcnow() - timedelta(days=30)
+    conversation_rows = []
+
+    for number in range(1, conversations + 1):
+        status = rng.choice(["active", "active", "resolved", "escalated"])
+        conversation_rows.append({
+            "session_id": f"seed-{number}",
+            "created_at": started + timedelta(minutes=number * 43200 / conversations),
+            "status": status,
+            "escalated": status == "escalated",
+            "average_sentiment": None
+        })
+    _insert_batches(db, Conversation, conversation_rows, batch_size)
+
+    seeded = db.query(Conversation.id, Conversation.session_id, Conversation.created_at)
+    message_rows = []
+    for conversation in seeded:
+        for turn in range(messages_per_conversation):
+            role = "user" if turn % 2 == 0 else "assistant"
+            message_rows.append({
+                "conversation_id": conversation.id,
+                "session_id": conversation.session_id,
+                "role": role,
+                "content": "seeded message",
+                "sentiment_score": round(rng.uniform(-1, 1), 2) if role == "user" else None,
+                "sentiment_label": None,
+                "timestamp": conversation.created_at + timedelta(seconds=turn * 30)
+            })
+    _insert_batches(db, Message, message_rows, batch_size)
+    db.commit()
+
+    # Give the planner statistics for the new rows
+    db.execute(text("ANALYZE"))
+    db.commit()
+    return conversations
+
+def _insert_batches(db: Session, model, rows: list, batch_size: int):
+    for offset in range(0, len(rows), batch_size):
+        db.execute(insert(model), rows[offset:offset + batch_size])
@@ -0,0 +1,318 @@
+"""Help-center FAQ retrieval for grounding assistant replies.
+
+build_index() turns a JSON-lines corpus ({"id", "title", "text"} per line)
+into a directory of NumPy arrays: a BM25 inverted index in CSR form, with
+each posting's term weight precomputed, the passages as one UTF-8 blob with
+offsets and, optionally, a dense matrix of hashed passage embeddings.
+FAQIndex memory-maps those files, so opening an index costs no parsing and
+worker processes share its pages through the OS cache. A query gathers the
+postings of its terms and sums them per passage with one np.bincount; with
+the dense matrix, one matrix-vector product scores every passage as well.
+Rebuild with `python -m app.cli index-faq` after editing the corpus.
+"""
+from app.services.embeddings import embed, tokenize
+from collections import deque
+from pathlib import Path
+import json
+import logging
+import math
+import numpy as np
+import os
+import shutil
+import tempfile
+import time
+import zlib
+
+logger = logging.getLogger(__name__)
+
+_DATA_DIR = Path(__file__).resolve().parents[2] / "data"
+FAQ_CORPUS = Path(os.getenv("FAQ_CORPUS", _DATA_DIR / "faq.jsonl"))
+FAQ_INDEX_DIR = Path(os.getenv("FAQ_INDEX_DIR", _DATA_DIR / "faq_index"))
+
+# Bumped when the on-disk layout changes; older indexes are rebuilt
+INDEX_FORMAT = 1
+# Terms longer than this are dropped, bounding the fixed-width term array
+MAX_TERM_LENGTH = 32
+# Dense similarity at which a passage sharing no word with the query still counts
+MIN_DENSE_SIMILARITY = 0.3
+
+class IndexFormatError(ValueError):
+    """The index on disk was written by a build with another INDEX_FORMAT"""
+
+class Passage:
+    """One retrieved FAQ entry"""
+
+    __slots__ = ("id", "title", "text", "score")
+
+    def __init__(self, id: str, title: str, text: str, score: float):
+        self.id = id
+        self.title = title
+        self.text = text
+        self.score = score
+
+    def to_dict(self) -> dict:
+        return {"id": self.id, "title": self.title, "text": self.text, "score": round(self.score, 4)}
+
+def load_corpus(path: Path = FAQ_CORPUS) -> list:
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+def hashed_vector(text: str, dim: int) -> np.ndarray:
+    """embed(text) folded into dim dimensions with signed feature hashing, unit length"""
+    vector = np.zeros(dim, dtype=np.float32)
+    features = embed(text)
+    if not features:
+        return vector
+    digests = np.array([zlib.crc32(feature.encode("utf-8")) for feature in features], dtype=np.uint32)
+    weights = np.fromiter(features.values(), dtype=np.float32, count=len(features))
+    # The top hash bit picks the sign, so collisions cancel out on average
+    np.add.at(vector, digests % dim, np.where(digests & 0x80000000, weights, -weights))
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+def index_arrays(passages: list, dense_dim: int = 0, k1: float = 1.2, b: float = 0.75) -> tuple:
+    """The index for passages as ({name: array}, metadata), not yet written anywhere"""
+    postings = {}
+    lengths = np.zeros(len(passages), dtype=np.float32)
+    blob, offsets = bytearray(), [0]
+
+    for doc, passage in enumerate(passages):
+        terms = [term for term in tokenize(f"{passage['title']} {passage['text']}")
+                 if len(term) <= MAX_TERM_LENGTH]
+        lengths[doc] = len(terms)
+        counts = {}
+        for term in terms:
+            counts[term] = counts.get(term, 0) + 1
+        for term, count in counts.items():
+            postings.setdefault(term, []).append((doc, count))
+
+        blob += json.dumps({"id": passage["id"], "title": passage["title"],
+                            "text": passage["text"]}).encode("utf-8")
+        offsets.append(len(blob))
+
+    count = len(passages)
+    average_length = float(lengths.mean()) if count else 0.0
+    vocabulary = sorted(postings)
+    term_offsets = np.zeros(len(vocabulary) + 1, dtype=np.int64)
+    docs, weights = [], []
+
+    for number, term in enumerate(vocabulary):
+        entries = postings[term]
+        idf = math.log(1 + (count - len(entries) + 0.5) / (len(entries) + 0.5))
+        term_docs = np.fromiter((doc for doc, _ in entries), dtype=np.int32, count=len(entries))
+        tf = np.fromiter((tf for _, tf in entries), dtype=np.float32, count=len(entries))
+        norm = k1 * (1 - b + b * lengths[term_docs] / (average_length or 1.0))
+        docs.append(term_docs)
+        weights.append((idf * tf * (k1 + 1) / (tf + norm)).astype(np.float32))
+        term_offsets[number + 1] = term_offsets[number] + len(entries)
+
+    arrays = {
+        "terms": np.array(vocabulary, dtype=f"<U{MAX_TERM_LENGTH}"),
+        "term_offsets": term_offsets,
+        "postings_docs": np.concatenate(docs) if docs else np.zeros(0, np.int32),
+        "postings_weights": np.concatenate(weights) if weights else np.zeros(0, np.float32),
+        "passage_offsets": np.array(offsets, dtype=np.int64),
+        "passages": np.frombuffer(bytes(blob), dtype=np.uint8)
+    }
+    if dense_dim:
+        arrays["dense"] = np.stack([
+            hashed_vector(f"{passage['title']} {passage['text']}", dense_dim) for passage in passages
+        ]) if passages else np.zeros((0, dense_dim), np.float32)
+
+    meta = {
+        "format": INDEX_FORMAT,
+        "passages": count,
+        "terms": len(vocabulary),
+        "average_length": average_length,
+        "dense_dim": dense_dim,
+        "built_at": time.time()
+    }
+    return arrays, meta
+
+def write_index(arrays: dict, meta: dict, out_dir: Path = FAQ_INDEX_DIR, replace: bool = True) -> bool:
+    """Write an index_arrays() result to out_dir; returns False when replace is
+    off and another process put an index there first"""
+    # Written to a directory of this process's own beside out_dir and renamed
+    # into place, so readers never see half an index and concurrent builders
+    # never write into each other's files
+    out_dir.parent.mkdir(parents=True, exist_ok=True)
+    staging = Path(tempfile.mkdtemp(prefix=out_dir.name + ".", suffix=".building", dir=out_dir.parent))
+    try:
+        staging.chmod(0o755)
+        for name, array in arrays.items():
+            np.save(staging / f"{name}.npy", array)
+        with open(staging / "meta.json", "w") as f:
+            json.dump(meta, f)
+
+        if not replace:
+            try:
+                staging.rename(out_dir)
+                return True
+            except OSError:
+                if (out_dir / "meta.json").exists():
+                    return False
+                raise
+
+        previous = staging.with_name(staging.name + ".previous")
+        if out_dir.exists():
+            out_dir.rename(previous)
+        staging.rename(out_dir)
+        shutil.rmtree(previous, ignore_errors=True)
+        return True
+    finally:
+        shutil.rmtree(staging, ignore_errors=True)
+
+def build_index(passages: list, out_dir: Path = FAQ_INDEX_DIR, dense_dim: int = 0,
+                k1: float = 1.2, b: float = 0.75) -> dict:
+    """Write the index for passages to out_dir, replacing any previous one; returns its metadata"""
+    arrays, meta = index_arrays(passages, dense_dim, k1, b)
+    write_index(arrays, meta, out_dir)
+    return meta
+
+class FAQIndex:
+    """A built index, memory-mapped read-only (or held in memory, see in_memory())"""
+
+    def __init__(self, path: Path):
+        with open(path / "meta.json") as f:
+            meta = json.load(f)
+        if meta.get("format") != INDEX_FORMAT:
+            raise IndexFormatError(f"{path} was built in an older format; rebuild it with index-faq")
+        self._attach(meta, lambda name: np.load(path / f"{name}.npy", mmap_mode="r"))
+
+    @classmethod
+    def in_memory(cls, arrays: dict, meta: dict) -> "FAQIndex":
+        """An index_arrays() result used directly, for when it cannot be written"""
+        index = cls.__new__(cls)
+        index._attach(meta, arrays.__getitem__)
+        return index
+
+    def _attach(self, meta: dict, load):
+        self.meta = meta
+        self.terms = load("terms")
+        self.term_offsets = load("term_offsets")
+        self.postings_docs = load("postings_docs")
+        self.postings_weights = load("postings_weights")
+        self.passage_offsets = load("passage_offsets")
+        self.passages = load("passages")
+        self.dense = load("dense") if meta["dense_dim"] else None
+
+    def __len__(self):
+        return self.meta["passages"]
+
+    def search(self, query: str, k: int = 3, dense_weight: float = 0.3) -> list:
+        """Top k passages for query by BM25, blended with dense similarity when the index has it"""
+        words = np.array(sorted(set(term for term in tokenize(query) if len(term) <= MAX_TERM_LENGTH)))
+        if not len(words) or not len(self):
+            return []
+
+        # Term ids by binary search over the sorted vocabulary; unknown words drop out
+        found = np.searchsorted(self.terms, words)
+        known = found < len(self.terms)
+        known[known] = self.terms[found[known]] == words[known]
+        found = found[known]
+
+        starts, ends = self.term_offsets[found], self.term_offsets[found + 1]
+        docs = np.concatenate([self.postings_docs[s:e] for s, e in zip(starts, ends)] or [np.zeros(0, np.int32)])
+        weights = np.concatenate([self.postings_weights[s:e] for s, e in zip(starts, ends)] or [np.zeros(0, np.float32)])
+        scores = np.bincount(docs, weights=weights, minlength=len(self))
+
+        if self.dense is not None and dense_weight:
+            similarity = self.dense @ hashed_vector(query, self.dense.shape[1])
+            best = scores.max()
+            # Passages with no query word count only when clearly similar,
+            # not through hash collisions
+            relevant = (scores > 0) | (similarity >= MIN_DENSE_SIMILARITY)
+            scores = np.where(relevant, scores / (best or 1.0) + dense_weight * similarity, 0.0)
+
+        k = min(k, len(self))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [self.passage(int(doc), float(scores[doc])) for doc in top if scores[doc] > 0]
+
+    def passage(self, doc: int, score: float = 0.0) -> Passage:
+        start, end = self.passage_offsets[doc], self.passage_offsets[doc + 1]
+        record = json.loads(self.passages[start:end].tobytes())
+        return Passage(record["id"], record["title"], record["text"], score)
+
+class FAQRetriever:
+    """The service's FAQ index, opened on first use.
+
+    A missing index is built from the corpus once, so a fresh checkout works
+    without the offline step; rebuilding after corpus edits stays explicit.
+    Workers starting together may each build it, but only the first one's
+    is kept. An index in an older format is rebuilt over the old one; where
+    the index directory cannot be written (a read-only deploy) the index
+    built is used from memory.
+    """
+
+    def __init__(self, index_dir: Path = FAQ_INDEX_DIR, corpus: Path = FAQ_CORPUS,
+                 top_k: int = 3, min_score: float = 0.0, window: int = 1000):
+        self.index_dir = index_dir
+        self.corpus = corpus
+        self.top_k = top_k
+        self.min_score = min_score
+        self.queries = 0
+        self.latencies = deque(maxlen=window)
+        self._index = None
+
+    def load(self):
+        """Open (building first if needed) the index; None when there is no corpus"""
+        if self._index is None:
+            stale = False
+            if (self.index_dir / "meta.json").exists():
+                try:
+                    self._index = FAQIndex(self.index_dir)
+                except IndexFormatError as exc:
+                    stale = True
+                    logger.warning("%s; rebuilding it from %s", exc, self.corpus)
+            if self._index is None and self.corpus.exists():
+                self._index = self._build(replace=stale)
+            elif self._index is None and stale:
+                logger.warning("No FAQ corpus at %s; replies go without FAQ passages", self.corpus)
+        return self._index
+
+    def _build(self, replace: bool = False) -> FAQIndex:
+        arrays, meta = index_arrays(load_corpus(self.corpus))
+        try:
+            if write_index(arrays, meta, self.index_dir, replace=replace):
+                logger.info("Built FAQ index of %s passages in %s", meta["passages"], self.index_dir)
+            return FAQIndex(self.index_dir)
+        except OSError as exc:
+            logger.warning("Could not write the FAQ index to %s (%s); using it from memory",
+                           self.index_dir, exc)
+            return FAQIndex.in_memory(arrays, meta)
+
+    def reload(self):
+        self._index = None
+        return self.load()
+
+    def search(self, query: str, k: int = None) -> list:
+        index = self.load()
+        if index is None:
+            return []
+        started = time.perf_counter()
+        passages = index.search(query, k or self.top_k)
+        self.queries += 1
+        self.latencies.append(time.perf_counter() - started)
+        return [passage for passage in passages if passage.score >= self.min_score]
+
+    def snapshot(self) -> dict:
+        latencies = sorted(self.latencies)
+
+        def percentile(p):
+            if not latencies:
+                return 0.0
+            return round(latencies[min(len(latencies) - 1, int(p * len(latencies)))] * 1000, 3)
+
+        index = self._index
+        return {
+            "passages": len(index) if index is not None else 0,
+            "dense_dim": index.meta["dense_dim"] if index is not None else 0,
+            "queries": self.queries,
+            "latency_ms": {"p50": percentile(0.50), "p95": percentile(0.95), "p99": percentile(0.99)}
+        }
+
+faq_retriever = FAQRetriever(
+    top_k=int(os.getenv("FAQ_TOP_K", "3")),
+    min_score=float(os.getenv("FAQ_MIN_SCORE", "0"))
+)
@@ -0,0 +1,201 @@
+from app.services.embeddings import NEGATIONS, cosine, embed, tokenize
+from app.services.intent_router import FALLBACK_INTENT, route_intent
+from collections import OrderedDict
+import os
+import re
+import time
+
+# Seconds a reply stays reusable, per routed intent. 0 never caches: vague
+# messages depend on the conversation, and upset customers get a fresh reply.
+RESPONSE_CACHE_TTLS = {
+    "greeting": 86400,
+    "thanks": 86400,
+    "help": 86400,
+    "refund": 3600,
+    "account": 3600,
+    "product": 3600,
+    "order": 600,
+    "payment": 600,
+    "frustrated": 0,
+    FALLBACK_INTENT: 0,
+}
+
+# Digits are order numbers, amounts and dates and "@" an email address, which
+# make a question, or a reply, specific to one customer
+_CUSTOMER_SPECIFIC = re.compile(r"\d|@")
+
+def parse_ttls(spec: str) -> dict:
+    """RESPONSE_CACHE_TTLS overrides, e.g. "order=300,greeting=0" """
+    ttls = {}
+    for item in filter(None, (part.strip() for part in spec.split(","))):
+        intent, _, seconds = item.partition("=")
+        ttls[intent.strip()] = float(seconds)
+    return ttls
+
+class CachedReply:
+    __slots__ = ("key", "intent", "vector", "reply", "expires_at")
+
+    def __init__(self, key: str, intent: str, vector: dict, reply: str, expires_at: float):
+        self.key = key
+        self.intent = intent
+        self.vector = vector
+        self.reply = reply
+        self.expires_at = expires_at
+
+class ResponseCache:
+    """Provider replies reused for repeated and near-duplicate questions.
+
+    A message is looked up by its normalized words first, then by cosine
+    similarity of its embedding against cached messages of the same intent
+    that share a word with it; matches at or above threshold are hits.
+    Negations are part of the key, and a near-duplicate only matches a
+    cached message with the same ones, so "can't log in" never gets the
+    reply to "can log in". Replies are cached per intent for
+    RESPONSE_CACHE_TTLS seconds, and the least recently used are evicted
+    past max_entries.
+
+    A cached reply is served to any customer, so only replies that depend
+    on nothing but the message are cached: the first turn of a conversation
+    (no earlier messages or summary in the prompt; the FAQ passages it is
+    grounded in are retrieved from the message alone), and neither the
+    message nor the reply may contain digits or an email address.
+    """
+
+    def __init__(self, max_entries: int = 5000, threshold: float = 0.85,
+                 ttls: dict = None, max_candidates: int = 256):
+        self.max_entries = max_entries
+        self.threshold = threshold
+        self.ttls = dict(RESPONSE_CACHE_TTLS, **(ttls or {}))
+        self.max_candidates = max_candidates
+        self.hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+        self.bypassed = 0
+        # Replies not stored because they hold customer data
+        self.rejected = 0
+        self.stores = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        # (intent, word) -> keys of cached messages containing the word
+        self._postings = {}
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0
+
+    def lookup(self, message: str, history: list = ()) -> tuple:
+        """(cached reply or None, key to store the fresh reply under or None when not cacheable).
+
+        history is the turn's prompt history, which ends with message.
+        """
+        intent = route_intent(message).intent
+        words = tokenize(message, keep_negations=True)
+        if (not self.enabled or not words or self.ttls.get(intent, 0) <= 0
+                or len(history) > 1 or _CUSTOMER_SPECIFIC.search(message)):
+            self.bypassed += 1
+            return None, None
+
+        key = (intent, " ".join(words))
+        now = time.monotonic()
+        entry = self._fresh(key, now)
+        if entry is None:
+            entry = self._similar(key, now)
+            if entry is not None:
+                self.semantic_hits += 1
+
+        if entry is None:
+            self.misses += 1
+            return None, key
+
+        self.hits += 1
+        self._entries.move_to_end(entry.key)
+        return entry.reply, key
+
+    def store(self, key: tuple, reply: str):
+        """Cache reply for a key returned by lookup(), unless it holds customer data"""
+        if key is None or not reply:
+            return
+        if _CUSTOMER_SPECIFIC.search(reply):
+            self.rejected += 1
+            return
+        intent, text = key
+        self._remove(key)
+        self._entries[key] = CachedReply(key, intent, embed(text, keep_negations=True), reply,
+                                         time.monotonic() + self.ttls[intent])
+        for word in set(text.split()):
+            self._postings.setdefault((intent, word), set()).add(key)
+        self.stores += 1
+
+        while len(self._entries) > self.max_entries:
+            self._remove(next(iter(self._entries)))
+            self.evictions += 1
+
+    def clear(self):
+        self._entries.clear()
+        self._postings.clear()
+
+    def snapshot(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "threshold": self.threshold,
+            "hits": self.hits,
+            "semantic_hits": self.semantic_hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+            "bypassed": self.bypassed,
+            "rejected": self.rejected,
+            "stores": self.stores,
+            "evictions": self.evictions
+        }
+
+    def _fresh(self, key: tuple, now: float):
+        entry = self._entries.get(key)
+        if entry is not None and entry.expires_at <= now:
+            self._remove(key)
+            return None
+        return entry
+
+    def _similar(self, key: tuple, now: float):
+        intent, text = key
+        words = set(text.split())
+        negations = words & NEGATIONS
+        # Rarest words first, so common ones cannot crowd out the candidates
+        postings = sorted((self._postings.get((intent, word), ()) for word in words), key=len)
+        candidates = set()
+        for posting in postings:
+            candidates.update(posting)
+            if len(candidates) >= self.max_candidates:
+                break
+
+        vector = embed(text, keep_negations=True)
+        best, best_score = None, self.threshold
+        for candidate in candidates:
+            if set(candidate[1].split()) & NEGATIONS != negations:
+                continue
+            entry = self._fresh(candidate, now)
+            if entry is None:
+                continue
+            score = cosine(vector, entry.vector)
+            if score >= best_score:
+                best, best_score = entry, score
+        return best
+
+    def _remove(self, key: tuple):
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        intent, text = key
+        for word in set(text.split()):
+            posting = self._postings.get((intent, word))
+            if posting is not None:
+                posting.discard(key)
+                if not posting:
+                    del self._postings[(intent, word)]
+
+response_cache = ResponseCache(
+    max_entries=int(os.getenv("RESPONSE_CACHE_SIZE", "5000")),
+    threshold=float(os.getenv("RESPONSE_CACHE_THRESHOLD", "0.85")),
+    ttls=parse_ttls(os.getenv("RESPONSE_CACHE_TTLS", ""))
+)
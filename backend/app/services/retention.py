@@ -0,0 +1,258 @@
+"""Retention: moving cold conversations out of the hot tables into monthly archives.
+
+archive_conversations() takes resolved conversations with no message newer
+than a cutoff and writes each one as a line of NDJSON in the bulk import
+transcript format to
+ARCHIVE_DIR/<YYYY-MM of created_at>/<first id>-<last id>-<run>.ndjson.gz.
+Every line is its own gzip member: the file is still an ordinary
+.ndjson.gz, and archived_conversations keeps the offset and length of each
+member, so reading one conversation back is a seek and a small decompress.
+
+The conversations and their messages are then deleted in one transaction,
+which also adds what they contributed to the dashboard rollups to
+archived_metrics and archived_sentiment_buckets. The rollups themselves are
+untouched, so the dashboard and trends keep counting archived
+conversations, and a rebuild from the hot tables adds those contributions
+back. Archives are not meant to be re-imported: import-transcripts would
+count those conversations a second time. Conversation lists and history
+pages merge in archived conversations (see AnalyticsService.list_conversations and ChatService.get_conversation_history).
+Run it from cron: `python -m app.cli archive-conversations`.
+"""
+from sqlalchemy.orm import Session
+from sqlalchemy import delete, exists, insert, select
+from sqlalchemy.dialects import postgresql, sqlite
+from app.models.database import (
+    ArchivedConversation, ArchivedMetric, ArchivedSentimentBucket, Conversation, Message
+)
+from app.services.analytics_cache import CONVERSATION_WRITE, analytics_cache
+from app.services.context_cache import context_cache
+from app.services.metrics_rollup import merge_deltas, message_deltas
+from app.services.sentiment_trends import SentimentTrendService
+from datetime import datetime, timedelta
+from pathlib import Path
+import gzip
+import json
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+ARCHIVE_DIR = Path(os.getenv("ARCHIVE_DIR", Path(__file__).resolve().parents[2] / "data" / "archive"))
+# Days a resolved conversation stays hot after its last message
+RETENTION_DAYS = float(os.getenv("RETENTION_DAYS", "90"))
+
+class ArchiveResult:
+    """Counts from one archive run"""
+
+    def __init__(self):
+        self.conversations = 0
+        self.messages = 0
+        self.skipped = 0
+        self.files = []
+
+    def to_dict(self) -> dict:
+        return {
+            "conversations": self.conversations,
+            "messages": self.messages,
+            "skipped": self.skipped,
+            "files": len(self.files)
+        }
+
+def retention_cutoff(days: float = RETENTION_DAYS, now: datetime = None) -> datetime:
+    return (now or datetime.utcnow()) - timedelta(days=days)
+
+def transcript_record(conversation, messages: list) -> dict:
+    """A conversation and its messages as one import-format transcript"""
+    return {
+        "session_id": conversation.session_id,
+        "customer_name": conversation.customer_name,
+        "status": conversation.status,
+        "escalated": bool(conversation.escalated),
+        "created_at": conversation.created_at.isoformat(),
+        "messages": [
+            {
+                "id": message.id,
+                "role": message.role,
+                "content": message.content,
+                "timestamp": message.timestamp.isoformat(),
+                "sentiment_score": message.sentiment_score,
+                "sentiment_label": message.sentiment_label,
+                "issue_type": message.issue_type
+            }
+            for message in messages
+        ]
+    }
+
+def archive_deltas(conversation, messages: list) -> dict:
+    """What one conversation and its messages add to the metrics rollup"""
+    deltas = {"conversations_total": 1}
+    if conversation.status == "resolved":
+        deltas["conversations_resolved"] = 1
+    if conversation.escalated:
+        deltas["conversations_escalated"] = 1
+    if conversation.average_sentiment is not None:
+        deltas["conversation_sentiment_sum"] = conversation.average_sentiment
+        deltas["conversation_sentiment_count"] = 1
+    return merge_deltas(deltas, *(
+        message_deltas(message.issue_type, message.sentiment_label)
+        for message in messages if message.role == "user"
+    ))
+
+def write_archive(path: Path, records: list) -> list:
+    """Write records to path, one gzip member each; returns their (offset, length)"""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    staging = path.with_name(path.name + ".tmp")
+    spans = []
+    with open(staging, "wb") as f:
+        for record in records:
+            member = gzip.compress((json.dumps(record, separators=(",", ":")) + "\n").encode("utf-8"))
+            spans.append((f.tell(), len(member)))
+            f.write(member)
+        f.flush()
+        os.fsync(f.fileno())
+    # Renamed into place only once complete; rows are deleted after this returns
+    staging.replace(path)
+    return spans
+
+def read_archived(entry, archive_dir: Path = ARCHIVE_DIR) -> dict:
+    """The transcript of one archived_conversations row"""
+    with open(archive_dir / entry.path, "rb") as f:
+        f.seek(entry.offset)
+        return json.loads(gzip.decompress(f.read(entry.length)))
+
+def archived_messages(entries: list, archive_dir: Path = ARCHIVE_DIR) -> list:
+    """Messages of archived conversations as (unsaved) Message objects"""
+    messages = []
+    for entry in entries:
+        for message in read_archived(entry, archive_dir)["messages"]:
+            messages.append(Message(
+                id=message["id"],
+                conversation_id=entry.id,
+                session_id=entry.session_id,
+                role=message["role"],
+                content=message["content"],
+                sentiment_score=message["sentiment_score"],
+                sentiment_label=message["sentiment_label"],
+                issue_type=message["issue_type"],
+                timestamp=datetime.fromisoformat(message["timestamp"])
+            ))
+    return messages
+
+def _still_cold(cutoff: datetime):
+    return ~exists().where(Message.conversation_id == Conversation.id, Message.timestamp >= cutoff)
+
+def archive_batch(db: Session, cutoff: datetime, archive_dir: Path, batch_size: int,
+                  after_id: int, run: str, result: ArchiveResult) -> int:
+    """Archive up to batch_size cold conversations with ids above after_id;
+    returns the last id looked at, or None when there are none left"""
+    conversations = db.execute(
+        select(Conversation.__table__)
+        .where(Conversation.status == "resolved", Conversation.created_at < cutoff,
+               Conversation.id > after_id, _still_cold(cutoff))
+        .order_by(Conversation.id)
+        .limit(batch_size)
+    ).all()
+    if not conversations:
+        return None
+
+    messages = {conversation.id: [] for conversation in conversations}
+    for message in db.execute(
+        select(Message.__table__)
+        .where(Message.conversation_id.in_(list(messages)))
+        .order_by(Message.conversation_id, Message.timestamp, Message.id)
+    ):
+        messages[message.conversation_id].append(message)
+    # Release the read transaction while the files are written
+    db.rollback()
+
+    partitions = {}
+    for conversation in conversations:
+        partitions.setdefault(conversation.created_at.strftime("%Y-%m"), []).append(conversation)
+
+    spans = {}
+    for partition, members in partitions.items():
+        path = f"{partition}/{members[0].id}-{members[-1].id}-{run}.ndjson.gz"
+        written = write_archive(archive_dir / path, [
+            transcript_record(conversation, messages[conversation.id]) for conversation in members
+        ])
+        for conversation, (offset, length) in zip(members, written):
+            spans[conversation.id] = (path, offset, length)
+        result.files.append(path)
+
+    # A conversation that got a message (or was reopened) since it was read
+    # is not deleted; its copy in the file is simply never referenced
+    connection = db.connection()
+    deleted = set(connection.execute(
+        delete(Conversation.__table__)
+        .where(Conversation.id.in_(list(spans)), Conversation.status == "resolved", _still_cold(cutoff))
+        .returning(Conversation.id)
+    ).scalars())
+    archived = [conversation for conversation in conversations if conversation.id in deleted]
+    result.skipped += len(conversations) - len(archived)
+
+    if archived:
+        connection.execute(delete(Message.__table__).where(Message.conversation_id.in_(list(deleted))))
+        now = datetime.utcnow()
+        connection.execute(insert(ArchivedConversation.__table__), [
+            {
+                "id": conversation.id,
+                "session_id": conversation.session_id,
+                "customer_name": conversation.customer_name,
+                "created_at": conversation.created_at,
+                "last_message_at": messages[conversation.id][-1].timestamp if messages[conversation.id] else None,
+                "status": conversation.status,
+                "escalated": bool(conversation.escalated),
+                "average_sentiment": conversation.average_sentiment,
+                "message_count": len(messages[conversation.id]),
+                "path": spans[conversation.id][0],
+                "offset": spans[conversation.id][1],
+                "length": spans[conversation.id][2],
+                "archived_at": now
+            }
+            for conversation in archived
+        ])
+        _add_archived_metrics(db, merge_deltas(*(
+            archive_deltas(conversation, messages[conversation.id]) for conversation in archived
+        )))
+        SentimentTrendService(db).record_many(
+            ((message.timestamp, message.sentiment_score)
+             for conversation in archived for message in messages[conversation.id]
+             if message.role == "user"),
+            model=ArchivedSentimentBucket
+        )
+    db.commit()
+
+    for conversation in archived:
+        context_cache.invalidate(conversation.session_id)
+    result.conversations += len(archived)
+    result.messages += sum(len(messages[conversation.id]) for conversation in archived)
+    return conversations[-1].id
+
+def _add_archived_metrics(db: Session, deltas: dict):
+    rows = [{"metric": metric, "value": value} for metric, value in deltas.items() if value]
+    if not rows:
+        return
+    dialect = db.get_bind().dialect.name
+    statement = (postgresql.insert if dialect == "postgresql" else sqlite.insert)(ArchivedMetric).values(rows)
+    db.execute(statement.on_conflict_do_update(
+        index_elements=[ArchivedMetric.metric],
+        set_={"value": ArchivedMetric.value + statement.excluded.value}
+    ))
+
+def archive_conversations(db: Session, cutoff: datetime = None, archive_dir: Path = ARCHIVE_DIR,
+                          batch_size: int = 500, on_batch=None) -> ArchiveResult:
+    """Archive every resolved conversation whose last message is older than cutoff"""
+    cutoff = cutoff or retention_cutoff()
+    run = datetime.utcnow().strftime("%Y%m%dT%H%M%S")
+    result = ArchiveResult()
+    after_id = 0
+    while after_id is not None:
+        after_id = archive_batch(db, cutoff, archive_dir, batch_size, after_id, run, result)
+        if on_batch is not None:
+            on_batch(result)
+
+    if result.conversations:
+        analytics_cache.invalidate(*CONVERSATION_WRITE)
+        logger.info("Archived %s conversations (%s messages) older than %s",
+                    result.conversations, result.messages, cutoff)
+    return result
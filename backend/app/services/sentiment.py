@@ -1,4 +1,10 @@
 from textblob import TextBlob
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor
+import asyncio
+import multiprocessing
+import os
+import time
 
 def analyze_sentiment(text: str) -> dict:
     """
@@ -6,14 +12,241 @@ def analyze_sentiment(text: str) -> dict:
     """
     polarity = TextBlob(text).sentiment.polarity
     
-    if polarity > 0.2:
-        mood = "positive"
-    elif polarity < -0.2:
-        mood = "negative"
-    else:
-        mood = "neutral"
-    
     return {
-        "mood": mood,
+        "mood": mood_for(polarity),
         "confidence": round(abs(polarity), 2)
-    }
\ No newline at end of file
+    }
+
+def mood_for(polarity: float) -> str:
+    """Sentiment label for a polarity (or signed score) in [-1, 1]"""
+    if polarity > 0.2:
+        return "positive"
+    if polarity < -0.2:
+        return "negative"
+    return "neutral"
+
+def signed_score(result: dict) -> tuple:
+    """(sentiment_score, sentiment_label) for an analyze_sentiment result"""
+    mood = result["mood"]
+    if mood == "positive":
+        return result["confidence"], mood
+    if mood == "negative":
+        return -result["confidence"], mood
+    return 0.0, mood
+
+def analyze_batch(texts: list) -> list:
+    """Score a batch of texts in one call; this is what runs in pool workers."""
+    return [analyze_sentiment(text) for text in texts]
+
+def normalize_text(text: str) -> str:
+    """Cache key for a message. TextBlob polarity ignores spacing but not case
+    ("Thanks :D" scores higher than "thanks :d") or punctuation."""
+    return " ".join(text.split())
+
+class SentimentStats:
+    """Counters and recent latencies for sizing the sentiment pool"""
+
+    def __init__(self, window: int = 1000):
+        self.requests = 0
+        self.cache_hits = 0
+        self.coalesced = 0
+        self.batches = 0
+        self.texts_scored = 0
+        self.scoring_seconds = 0.0
+        self.latencies = deque(maxlen=window)
+        self.batch_sizes = deque(maxlen=window)
+
+    def snapshot(self, workers: int, queue_depth: int, cache_size: int) -> dict:
+        latencies = sorted(self.latencies)
+
+        def percentile(p):
+            if not latencies:
+                return 0.0
+            return round(latencies[min(len(latencies) - 1, int(p * len(latencies)))] * 1000, 3)
+
+        return {
+            "workers": workers,
+            "requests": self.requests,
+            "cache_hits": self.cache_hits,
+            "cache_hit_rate": round(self.cache_hits / self.requests, 3) if self.requests else 0.0,
+            "cache_size": cache_size,
+            "coalesced": self.coalesced,
+            "batches": self.batches,
+            "texts_scored": self.texts_scored,
+            "average_batch_size": round(sum(self.batch_sizes) / len(self.batch_sizes), 2) if self.batch_sizes else 0.0,
+            # Texts per second of batch scoring time, i.e. per busy worker
+            "scoring_throughput": round(self.texts_scored / self.scoring_seconds, 1) if self.scoring_seconds else 0.0,
+            "queue_depth": queue_depth,
+            "latency_ms": {"p50": percentile(0.50), "p95": percentile(0.95), "p99": percentile(0.99)}
+        }
+
+class SentimentEngine:
+    """Sentiment scoring off the event loop.
+
+    Concurrent requests are coalesced into micro-batches that are flushed when
+    max_batch_size texts are waiting or max_wait seconds have passed, and each
+    batch is scored in a process pool. Results are cached per normalized text
+    in a bounded LRU, and identical texts already in flight share one result.
+    Until start() is called batches run on the default thread pool instead.
+    """
+
+    def __init__(self, workers: int = None, max_batch_size: int = 32,
+                 max_wait: float = 0.005, cache_size: int = 10000):
+        self.workers = (os.cpu_count() or 1) if workers is None else workers
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.cache_size = cache_size
+        self.stats = SentimentStats()
+        self._executor = None
+        self._cache = OrderedDict()
+        self._pending = []
+        self._inflight = {}
+        self._flush_handle = None
+        self._batch_tasks = set()
+
+    def start(self):
+        """Start the process pool (no-op with workers=0, which keeps the thread pool)"""
+        if self._executor is None and self.workers > 0:
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context("spawn")
+            )
+            # Warm the workers so the first requests don't pay the TextBlob import
+            for _ in range(self.workers):
+                self._executor.submit(analyze_batch, ["warm up"])
+
+    async def stop(self):
+        """Score anything still queued, then shut the pool down"""
+        self._flush()
+        if self._batch_tasks:
+            await asyncio.gather(*self._batch_tasks, return_exceptions=True)
+        if self._executor is not None:
+            executor, self._executor = self._executor, None
+            await asyncio.get_running_loop().run_in_executor(None, executor.shutdown)
+
+    async def analyze(self, text: str) -> dict:
+        """Mood and confidence for text, as returned by analyze_sentiment"""
+        started = time.perf_counter()
+        self.stats.requests += 1
+        key = normalize_text(text)
+
+        result = self._cache.get(key)
+        if result is not None:
+            self._cache.move_to_end(key)
+            self.stats.cache_hits += 1
+        elif key in self._inflight:
+            self.stats.coalesced += 1
+            result = await asyncio.shield(self._inflight[key])
+        else:
+            future = asyncio.get_running_loop().create_future()
+            self._inflight[key] = future
+            self._pending.append((key, text, future))
+
+            if len(self._pending) >= self.max_batch_size:
+                self._flush()
+            elif self._flush_handle is None:
+                self._flush_handle = asyncio.get_running_loop().call_later(self.max_wait, self._flush)
+
+            result = await asyncio.shield(future)
+
+        self.stats.latencies.append(time.perf_counter() - started)
+        return dict(result)
+
+    async def analyze_many(self, texts: list) -> list:
+        """Results for many texts at once, for bulk jobs such as imports.
+
+        Cached and repeated texts are scored once; the rest are split across
+        the pool's workers and are not added to the cache, so a backfill does
+        not evict the entries live traffic relies on.
+        """
+        self.stats.requests += len(texts)
+        results = [None] * len(texts)
+        missing = {}
+        for position, text in enumerate(texts):
+            key = normalize_text(text)
+            cached = self._cache.get(key)
+            if cached is not None:
+                self.stats.cache_hits += 1
+                results[position] = cached
+            else:
+                missing.setdefault(key, (text, []))[1].append(position)
+
+        if missing:
+            loop = asyncio.get_running_loop()
+            pending = list(missing.values())
+            size = -(-len(pending) // max(1, self.workers if self._executor is not None else 1))
+            started = time.perf_counter()
+            batches = await asyncio.gather(*(
+                loop.run_in_executor(self._executor, analyze_batch,
+                                     [text for text, _ in pending[start:start + size]])
+                for start in range(0, len(pending), size)
+            ))
+            self.stats.batches += len(batches)
+            self.stats.texts_scored += len(pending)
+            self.stats.scoring_seconds += time.perf_counter() - started
+            self.stats.batch_sizes.extend(len(batch) for batch in batches)
+
+            scored = (result for batch in batches for result in batch)
+            for (_, positions), result in zip(pending, scored):
+                for position in positions:
+                    results[position] = result
+
+        return [dict(result) for result in results]
+
+    def snapshot(self) -> dict:
+        return self.stats.snapshot(
+            workers=self.workers if self._executor is not None else 0,
+            queue_depth=len(self._inflight),
+            cache_size=len(self._cache)
+        )
+
+    def _flush(self):
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        if not self._pending:
+            return
+
+        batch, self._pending = self._pending, []
+        task = asyncio.get_running_loop().create_task(self._score(batch))
+        self._batch_tasks.add(task)
+        task.add_done_callback(self._batch_tasks.discard)
+
+    async def _score(self, batch: list):
+        loop = asyncio.get_running_loop()
+        started = time.perf_counter()
+
+        try:
+            results = await loop.run_in_executor(
+                self._executor, analyze_batch, [text for _, text, _ in batch]
+            )
+        except Exception as exc:
+            for key, _, future in batch:
+                self._inflight.pop(key, None)
+                if not future.done():
+                    future.set_exception(exc)
+            return
+
+        self.stats.batches += 1
+        self.stats.texts_scored += len(batch)
+        self.stats.scoring_seconds += time.perf_counter() - started
+        self.stats.batch_sizes.append(len(batch))
+
+        for (key, _, future), result in zip(batch, results):
+            self._inflight.pop(key, None)
+            self._remember(key, result)
+            if not future.done():
+                future.set_result(result)
+
+    def _remember(self, key: str, result: dict):
+        self._cache[key] = result
+        self._cache.move_to_end(key)
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+sentiment_engine = SentimentEngine(
+    workers=int(os.getenv("SENTIMENT_WORKERS")) if os.getenv("SENTIMENT_WORKERS") else None,
+    max_batch_size=int(os.getenv("SENTIMENT_MAX_BATCH", "32")),
+    max_wait=float(os.getenv("SENTIMENT_MAX_WAIT_MS", "5")) / 1000,
+    cache_size=int(os.getenv("SENTIMENT_CACHE_SIZE", "10000"))
+)
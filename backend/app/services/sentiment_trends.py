@@ -0,0 +1,119 @@
+from sqlalchemy.orm import Session
+from sqlalchemy.dialects import postgresql, sqlite
+from app.models.database import ArchivedSentimentBucket, Message, SentimentBucket
+from datetime import datetime, timedelta, timezone
+
+GRANULARITIES = ("hour", "day", "week")
+
+def bucket_start(timestamp: datetime, granularity: str) -> datetime:
+    """Start of the hour, day or (Monday-based) week containing timestamp"""
+    if granularity == "hour":
+        return timestamp.replace(minute=0, second=0, microsecond=0)
+    day = timestamp.replace(hour=0, minute=0, second=0, microsecond=0)
+    if granularity == "day":
+        return day
+    if granularity == "week":
+        return day - timedelta(days=day.weekday())
+    raise ValueError(f"Unknown granularity: {granularity}")
+
+def to_naive_utc(value: datetime) -> datetime:
+    """Stored timestamps are naive UTC; convert aware query bounds to match"""
+    if value is not None and value.tzinfo is not None:
+        return value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+def bucket_label(start: datetime, granularity: str) -> str:
+    return start.isoformat() if granularity == "hour" else str(start.date())
+
+class SentimentTrendService:
+    """Per hour/day/week sums of user message sentiment, maintained on write"""
+
+    def __init__(self, db: Session):
+        self.db = db
+
+    def record(self, timestamp: datetime, sentiment_score: float):
+        """Add one user score to its bucket at every granularity (no commit)"""
+        self.record_many([(timestamp, sentiment_score)])
+
+    def record_many(self, scores, rows_per_statement: int = 1000, model=SentimentBucket):
+        """Add (timestamp, score) pairs to their buckets, upserting each bucket once (no commit)"""
+        buckets = {}
+        for timestamp, sentiment_score in scores:
+            if sentiment_score is None:
+                continue
+            for granularity in GRANULARITIES:
+                key = (granularity, bucket_start(timestamp, granularity))
+                total, count = buckets.get(key, (0.0, 0))
+                buckets[key] = (total + sentiment_score, count + 1)
+
+        rows = [
+            {
+                "granularity": granularity,
+                "bucket_start": start,
+                "sentiment_sum": total,
+                "message_count": count
+            }
+            for (granularity, start), (total, count) in buckets.items()
+        ]
+
+        dialect = self.db.get_bind().dialect.name
+        insert = postgresql.insert if dialect == "postgresql" else sqlite.insert
+        for offset in range(0, len(rows), rows_per_statement):
+            statement = insert(model).values(rows[offset:offset + rows_per_statement])
+            self.db.execute(statement.on_conflict_do_update(
+                index_elements=[model.granularity, model.bucket_start],
+                set_={
+                    "sentiment_sum": model.sentiment_sum + statement.excluded.sentiment_sum,
+                    "message_count": model.message_count + statement.excluded.message_count
+                }
+            ))
+
+    def get_trends(self, granularity: str = "day", start: datetime = None, end: datetime = None):
+        """Average sentiment per bucket, reading only buckets in [start, end)"""
+        query = self.db.query(SentimentBucket).filter(SentimentBucket.granularity == granularity)
+        start, end = to_naive_utc(start), to_naive_utc(end)
+
+        if start:
+            query = query.filter(SentimentBucket.bucket_start >= bucket_start(start, granularity))
+        if end:
+            query = query.filter(SentimentBucket.bucket_start < end)
+
+        return [
+            {
+                "date": bucket_label(bucket.bucket_start, granularity),
+                "sentiment": round(bucket.sentiment_sum / bucket.message_count, 3),
+                "count": bucket.message_count
+            }
+            for bucket in query.order_by(SentimentBucket.bucket_start)
+            if bucket.message_count
+        ]
+
+    def is_empty(self) -> bool:
+        return self.db.query(SentimentBucket.granularity).first() is None
+
+    def rebuild(self, batch_size: int = 1000):
+        """Recompute every bucket from stored user messages (plus what archived ones contributed)"""
+        buckets = {
+            (bucket.granularity, bucket.bucket_start): (bucket.sentiment_sum, bucket.message_count)
+            for bucket in self.db.query(ArchivedSentimentBucket)
+        }
+
+        scores = self.db.query(Message.timestamp, Message.sentiment_score).filter(
+            Message.role == "user",
+            Message.sentiment_score.isnot(None)
+        ).execution_options(yield_per=batch_size)
+
+        for timestamp, score in scores:
+            for granularity in GRANULARITIES:
+                key = (granularity, bucket_start(timestamp, granularity))
+                total, count = buckets.get(key, (0.0, 0))
+                buckets[key] = (total + score, count + 1)
+
+        self.db.query(SentimentBucket).delete(synchronize_session=False)
+        self.db.add_all(
+            SentimentBucket(granularity=granularity, bucket_start=start,
+                            sentiment_sum=total, message_count=count)
+            for (granularity, start), (total, count) in buckets.items()
+        )
+        self.db.commit()
+        return len(buckets)
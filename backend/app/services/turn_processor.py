@@ -0,0 +1,343 @@
+from sqlalchemy.orm import Session
+from sqlalchemy import insert, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.models.database import Conversation, Message, QueryCounter, count_queries, recent_writes
+from app.services.analytics_cache import MESSAGE_WRITE, analytics_cache
+from app.services.chat_service import (
+    apply_sentiment, conversation_event, escalation_needed, guarded_summary, previous_average,
+    recent_window
+)
+from app.services.context_builder import build_history
+from app.services.context_cache import SessionContext, context_cache
+from app.services.event_bus import dashboard_events
+from app.services.issue_classifier import classify_issue
+from app.services.metrics import StageTimer, stage
+from app.services.metrics_rollup import (
+    MetricsRollupService, average_deltas, merge_deltas, message_deltas, status_deltas
+)
+from app.services.sentiment_trends import SentimentTrendService
+from app.services.write_behind import write_behind
+from datetime import datetime
+import asyncio
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+# Statements one chat turn may issue, excluding BEGIN/COMMIT:
+#   1. SELECT the conversation by session_id (skipped when the context cache hits)
+#   2. SELECT the messages the stored summary does not cover (skipped on a cache
+#      hit; INSERT the conversation instead on a new session)
+#   3. INSERT the user message (plus the assistant message in one multi-row
+#      INSERT when it is not queued for write-behind)
+#   4. UPDATE the sentiment aggregates and the rolling summary ... RETURNING the recent window
+#   5. UPDATE the status when the turn escalates
+#   6. UPDATE the dashboard metrics rollup
+#   7. INSERT ... ON CONFLICT the hour/day/week sentiment trend buckets
+# While write-behind runs, 6 and 7 are one INSERT into pending_rollups instead
+TURN_QUERY_BUDGET = 7
+TURN_COMMIT_BUDGET = 1
+
+# Raise instead of logging when a turn goes over budget (CI and load runs)
+ENFORCE_QUERY_BUDGET = os.getenv("ENFORCE_QUERY_BUDGET", "").lower() in ("1", "true", "yes")
+
+class QueryBudgetExceeded(RuntimeError):
+    pass
+
+class ChatTurn:
+    """State carried from the read phase of a turn to its write phase"""
+
+    def __init__(self, session_id: str, conversation_id: int, customer_name: str,
+                 message: str, history: list, context: SessionContext = None,
+                 prompt_tokens: int = 0, tokens_saved: int = 0):
+        self.session_id = session_id
+        self.conversation_id = conversation_id
+        self.customer_name = customer_name
+        self.message = message
+        self.history = history
+        self.context = context
+        # Estimated prompt size, and what the rolling summary saved over full history
+        self.prompt_tokens = prompt_tokens
+        self.tokens_saved = tokens_saved
+
+class TurnProcessor:
+    """Process a chat turn as one unit of work with a single commit.
+
+    The turn is split around response generation so no transaction or pooled
+    connection is held while the reply is produced: begin() only reads,
+    complete() writes both messages, the aggregates and the escalation and
+    commits once. With write-behind, record() commits everything but the
+    assistant message and queued_reply() hands that to the write-behind queue.
+    """
+
+    def __init__(self, db: Session):
+        self.db = db
+        self.queries = QueryCounter()
+
+    def begin(self, session_id: str, message: str, customer_name: str = None) -> ChatTurn:
+        """Load the conversation id and build the token-budgeted prompt history"""
+        context = context_cache.get(session_id)
+        if context is None:
+            with count_queries(self.queries):
+                context = self._load_context(session_id)
+                # Release the connection while the response is generated
+                self.db.rollback()
+
+        with stage("prompt_build"):
+            history, prompt_tokens, tokens_saved = build_history(context, message)
+        logger.debug("Prompt for %s: %s tokens, %s saved by summary",
+                     session_id, prompt_tokens, tokens_saved)
+        return ChatTurn(session_id, context.conversation_id, customer_name, message, history,
+                        context, prompt_tokens, tokens_saved)
+
+    def _load_context(self, session_id: str) -> SessionContext:
+        with stage("conversation_lookup"):
+            conversation = self.db.query(
+                Conversation.id,
+                Conversation.summary,
+                Conversation.summary_message_count,
+                Conversation.summarized_tokens
+            ).filter(Conversation.session_id == session_id).first()
+        if conversation is None:
+            return context_cache.new_context()
+
+        context = context_cache.new_context(
+            conversation.id,
+            summary=conversation.summary,
+            summary_count=conversation.summary_message_count or 0,
+            summarized_tokens=conversation.summarized_tokens or 0
+        )
+        # Normally just the verbatim window; for conversations summarized under
+        # a smaller window (or never), extend() folds the overflow in once
+        with stage("history_load"):
+            pending = self.db.query(Message.role, Message.content).filter(
+                Message.conversation_id == conversation.id
+            ).order_by(Message.timestamp, Message.id).offset(context.summary_count)
+            context.extend((m.role, m.content) for m in pending)
+
+        context_cache.put(session_id, context)
+        return context
+
+    def complete(self, turn: ChatTurn, sentiment_score: float, sentiment_label: str,
+                 ai_response: str) -> bool:
+        """Persist the turn, update aggregates and decide escalation; returns should_escalate"""
+        return self.record(turn, sentiment_score, sentiment_label, ai_response)
+
+    def record(self, turn: ChatTurn, sentiment_score: float, sentiment_label: str,
+               ai_response: str = None) -> bool:
+        """complete(), leaving out the assistant message when ai_response is None"""
+        context = turn.context or context_cache.new_context(turn.conversation_id)
+        try:
+            should_escalate, deltas, changes, now, current = self._write(
+                turn, context, sentiment_score, sentiment_label, ai_response
+            )
+        except Exception:
+            # The context may already hold this turn's messages
+            context_cache.invalidate(turn.session_id)
+            raise
+
+        # Without the reply the summary is stored later, with the reply's queued write
+        if ai_response is not None:
+            context.dirty = False
+        turn.context = context
+        if current:
+            context_cache.put(turn.session_id, context)
+        else:
+            # Another worker stored a newer summary; reload from it next turn
+            logger.info("Stale context for %s dropped; its summary was not stored", turn.session_id)
+            context_cache.invalidate(turn.session_id)
+        recent_writes.mark(turn.session_id)
+        analytics_cache.invalidate(*MESSAGE_WRITE)
+        dashboard_events.publish(metrics=deltas, conversation=changes, sentiment=(now, sentiment_score))
+
+        self._check_budget(turn.session_id)
+        return should_escalate
+
+    def queued_reply(self, turn: ChatTurn, ai_response: str) -> tuple:
+        """Add the reply to the session context after record(); returns the
+        assistant Message row and, if the summary changed, its new values
+        with the summary_base count they replace"""
+        context = turn.context
+        context.extend([("assistant", ai_response)])
+        summary = None
+        if context.dirty:
+            summary = dict(context.summary_values(), summary_base=context.stored_count)
+            # Queued writes are stored in order, so the next one builds on this
+            context.stored_count = context.summary_count
+        context.dirty = False
+        context_cache.put(turn.session_id, context)
+        return {
+            "conversation_id": turn.conversation_id,
+            "session_id": turn.session_id,
+            "role": "assistant",
+            "content": ai_response,
+            "sentiment_score": None,
+            "sentiment_label": None,
+            "issue_type": None,
+            "timestamp": datetime.utcnow()
+        }, summary
+
+    def _write(self, turn: ChatTurn, context: SessionContext, sentiment_score: float,
+               sentiment_label: str, ai_response: str) -> tuple:
+        with count_queries(self.queries):
+            stages = StageTimer()
+            issue_type = classify_issue(turn.message)
+            deltas = message_deltas(issue_type, sentiment_label)
+
+            changes = {"id": turn.conversation_id}
+            if turn.conversation_id is None:
+                deltas["conversations_total"] = 1
+                conversation = Conversation(
+                    session_id=turn.session_id,
+                    customer_name=turn.customer_name,
+                    created_at=datetime.utcnow(),
+                    status="active"
+                )
+                self.db.add(conversation)
+                self.db.flush()
+                turn.conversation_id = conversation.id
+                changes = conversation_event(conversation)
+
+            # The user message, and the reply unless it is queued, in one INSERT
+            now = datetime.utcnow()
+            rows = [{
+                "conversation_id": turn.conversation_id,
+                "session_id": turn.session_id,
+                "role": "user",
+                "content": turn.message,
+                "sentiment_score": sentiment_score,
+                "sentiment_label": sentiment_label,
+                "issue_type": issue_type,
+                "timestamp": now
+            }]
+            messages = [("user", turn.message)]
+            if ai_response is not None:
+                rows.append({
+                    "conversation_id": turn.conversation_id,
+                    "session_id": turn.session_id,
+                    "role": "assistant",
+                    "content": ai_response,
+                    "sentiment_score": None,
+                    "sentiment_label": None,
+                    "issue_type": None,
+                    "timestamp": now
+                })
+                messages.append(("assistant", ai_response))
+            self.db.execute(insert(Message).values(rows))
+            stages.lap("message_insert")
+
+            # Messages pushed out of the verbatim window are folded into the
+            # summary here, so it is stored by the UPDATE the turn already makes.
+            # A summary counting a queued reply is stored with that reply instead,
+            # so the stored count never covers messages that are not stored yet.
+            context.conversation_id = turn.conversation_id
+            context.extend(messages)
+            # Guarded on the count the context was built from, so a context left
+            # stale by another worker cannot move the stored summary back
+            summary = context.summary_values() if context.dirty and ai_response is not None else {}
+
+            row = apply_sentiment(self.db, turn.conversation_id, sentiment_score,
+                                  **guarded_summary(summary, context.stored_count))
+            current = True
+            if summary:
+                current = row.summary_message_count == context.summary_count
+                context.stored_count = row.summary_message_count
+            deltas = merge_deltas(deltas, average_deltas(
+                previous_average(row, sentiment_score), row.average_sentiment
+            ))
+            should_escalate = escalation_needed(sentiment_score, recent_window(row))
+            changes["average_sentiment"] = row.average_sentiment
+
+            if should_escalate:
+                self.db.execute(
+                    update(Conversation)
+                    .where(Conversation.id == turn.conversation_id)
+                    .values(escalated=True, status="escalated")
+                    .execution_options(synchronize_session=False)
+                )
+                deltas = merge_deltas(deltas, status_deltas(
+                    row.status, row.escalated, "escalated", True
+                ))
+                changes.update(status="escalated", escalated=True)
+            stages.lap("escalation_check")
+
+            # Every turn updates the same counter rows, so when write-behind
+            # runs the turn commits its deltas as a row of its own and the
+            # queue's group commit applies them summed, instead of locking the
+            # counters per turn
+            rollup = MetricsRollupService(self.db)
+            if ai_response is None and write_behind.running:
+                rollup.defer(deltas, now, sentiment_score)
+            else:
+                rollup.apply(deltas)
+                SentimentTrendService(self.db).record(now, sentiment_score)
+            stages.lap("rollup_update")
+            self.db.commit()
+            stages.lap("commit")
+
+        return should_escalate, deltas, changes, now, current
+
+    def _check_budget(self, session_id: str):
+        if (self.queries.statements <= TURN_QUERY_BUDGET
+                and self.queries.commits <= TURN_COMMIT_BUDGET):
+            return
+
+        detail = (
+            f"chat turn for {session_id} issued {self.queries.statements} statements "
+            f"and {self.queries.commits} commits (budget {TURN_QUERY_BUDGET}/{TURN_COMMIT_BUDGET})"
+        )
+        if ENFORCE_QUERY_BUDGET:
+            raise QueryBudgetExceeded(detail)
+        logger.warning(detail)
+
+class AsyncTurnProcessor:
+    """TurnProcessor on an AsyncSession; both phases run through run_sync"""
+
+    def __init__(self, db: AsyncSession):
+        self.db = db
+        self.processor = TurnProcessor(db.sync_session)
+
+    @property
+    def queries(self) -> QueryCounter:
+        return self.processor.queries
+
+    async def begin(self, session_id: str, message: str, customer_name: str = None) -> ChatTurn:
+        # A history load must not miss replies still waiting in the write-behind queue
+        if write_behind.pending(session_id) and session_id not in context_cache:
+            await write_behind.flush()
+        return await self.db.run_sync(
+            lambda _: self.processor.begin(session_id, message, customer_name)
+        )
+
+    async def complete(self, turn: ChatTurn, sentiment_score: float, sentiment_label: str,
+                       ai_response: str) -> bool:
+        return await self.db.run_sync(
+            lambda _: self.processor.complete(turn, sentiment_score, sentiment_label, ai_response)
+        )
+
+    async def respond(self, turn: ChatTurn, sentiment_score: float, sentiment_label: str,
+                      reply) -> tuple:
+        """Await reply (a coroutine producing the response) and persist the turn;
+        returns (ai_response, should_escalate).
+
+        With write-behind running, the user message, aggregates and escalation
+        are committed while the reply is produced and the assistant message is
+        queued, so no commit waits for the reply. Otherwise the turn commits
+        once, after the reply.
+        """
+        if not write_behind.running:
+            with stage("response"):
+                ai_response = await reply
+            return ai_response, await self.complete(turn, sentiment_score, sentiment_label, ai_response)
+
+        recording = asyncio.ensure_future(self.db.run_sync(
+            lambda _: self.processor.record(turn, sentiment_score, sentiment_label)
+        ))
+        try:
+            with stage("response"):
+                ai_response = await reply
+        finally:
+            should_escalate = await recording
+        with stage("write_behind_enqueue"):
+            await write_behind.put(turn.session_id, *self.processor.queued_reply(turn, ai_response))
+        return ai_response, should_escalate
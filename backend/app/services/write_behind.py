@@ -0,0 +1,285 @@
+"""Write-behind persistence for the chat writes nothing waits on.
+
+A reply does not depend on the assistant message being stored, so chat
+turns hand that message (and the rolling summary it changes) to this queue
+instead of writing it themselves. A background task group-commits what has
+queued every flush_interval seconds, or as soon as max_batch writes are
+waiting: one multi-row INSERT of the messages and one executemany UPDATE of
+the summaries per commit. The same commit applies the dashboard rollup
+deltas the turns committed to pending_rollups, summed, so concurrent turns
+no longer take turns on the same few counter rows. The queue holds at most
+max_size writes; put() waits for room when it is full, so turns slow down
+to what the database absorbs instead of memory growing without bound.
+stop() writes everything still queued, so a graceful shutdown loses
+nothing; a crashed worker loses at most the replies of its last flush
+interval. Rollup deltas are never lost that way: they are committed with
+the user message, and rows a failed flush leaves behind are applied by the
+next one (or by init_rollup on startup). A batch that still fails after
+its retries is dropped and logged at ERROR with its session ids; if the
+flush task itself dies, turns go back to writing their replies inline and
+flush() raises its exception instead of waiting.
+"""
+from sqlalchemy.orm import Session
+from sqlalchemy import bindparam, insert, select
+from app.models.database import AsyncSessionLocal, Conversation, Message, recent_writes
+from app.services.analytics_cache import MESSAGE_WRITE, analytics_cache
+from app.services.context_cache import context_cache
+from app.services.metrics_rollup import MetricsRollupService
+from collections import deque
+import asyncio
+import logging
+import os
+import time
+
+logger = logging.getLogger(__name__)
+
+def write_pending(db: Session, batch: list):
+    """Store a batch of queued (session_id, message row, summary values) in
+    one transaction, applying the pending rollup deltas with it"""
+    connection = db.connection()
+    connection.execute(insert(Message.__table__), [message for _, message, _ in batch])
+
+    # Summaries are cumulative, so the latest queued one per conversation is
+    # enough, guarded on the count the earliest one replaces (see SessionContext.stored_count)
+    summaries = {}
+    sessions = {}
+    for session_id, message, summary in batch:
+        if summary:
+            conversation_id = message["conversation_id"]
+            base = summaries.get(conversation_id, summary)["summary_base"]
+            summaries[conversation_id] = dict(summary, summary_base=base)
+            sessions[conversation_id] = session_id
+    stale = []
+    if summaries:
+        conversations = Conversation.__table__
+        result = connection.execute(
+            conversations.update().where(
+                conversations.c.id == bindparam("conversation_id"),
+                conversations.c.summary_message_count == bindparam("summary_base")
+            ),
+            [{"conversation_id": conversation_id, **summary}
+             for conversation_id, summary in summaries.items()]
+        )
+        if not connection.dialect.supports_sane_multi_rowcount or result.rowcount != len(summaries):
+            stored = connection.execute(
+                select(conversations.c.id, conversations.c.summary_message_count)
+                .where(conversations.c.id.in_(list(summaries)))
+            )
+            stale = [sessions[row.id] for row in stored
+                     if row.summary_message_count != summaries[row.id]["summary_message_count"]]
+
+    # Summed over every turn committed since the last flush, so each counter
+    # row and trend bucket is written once
+    applied = MetricsRollupService(db).apply_pending()
+    db.commit()
+    if applied:
+        analytics_cache.invalidate(*MESSAGE_WRITE)
+
+    # Another worker stored a newer summary; those sessions reload it next turn
+    for session_id in stale:
+        logger.info("Stale context for %s dropped; its summary was not stored", session_id)
+        context_cache.invalidate(session_id)
+
+async def write_pending_async(batch: list):
+    async with AsyncSessionLocal() as db:
+        await db.run_sync(lambda session: write_pending(session, batch))
+
+class WriteBehindQueue:
+    """Assistant messages queued in memory and group-committed in the background.
+
+    Until start() is called (or with max_size=0) the queue is not running and
+    callers write synchronously instead.
+    """
+
+    def __init__(self, max_size: int = 10000, max_batch: int = 500, flush_interval: float = 0.05,
+                 retries: int = 3, write=write_pending_async, window: int = 1000):
+        self.max_size = max_size
+        self.max_batch = max(1, max_batch)
+        self.flush_interval = flush_interval
+        self.retries = retries
+        self.write = write
+        self.enqueued = 0
+        self.written = 0
+        self.dropped = 0
+        self.batches = 0
+        self.failures = 0
+        self.waits = 0
+        self.flush_latencies = deque(maxlen=window)
+        self.batch_sizes = deque(maxlen=window)
+        self._items = deque()
+        # Queued writes per session, so a cold history load can wait for them
+        self._pending = {}
+        self._arrived = None
+        self._full = None
+        self._room = None
+        self._progress = None
+        self._task = None
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def start(self):
+        if self._task is None and self.max_size > 0:
+            self._arrived = asyncio.Event()
+            self._full = asyncio.Event()
+            self._room = asyncio.Event()
+            self._progress = asyncio.Event()
+            self._task = asyncio.get_running_loop().create_task(self._run())
+            self._task.add_done_callback(self._stopped)
+
+    async def stop(self):
+        """Write everything still queued, then stop the flush task"""
+        if self._task is None:
+            return
+        try:
+            # A task that died has logged why; what it left is dropped below
+            if self.running:
+                await self.flush()
+        finally:
+            task, self._task = self._task, None
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+            self._drop_queued("the write-behind queue stopped")
+
+    async def put(self, session_id: str, message: dict, summary: dict = None):
+        """Queue a Message row (and the conversation summary it changes), waiting while the queue is full"""
+        if len(self._items) >= self.max_size:
+            self.waits += 1
+            while len(self._items) >= self.max_size:
+                if not self.running:
+                    raise RuntimeError("write-behind queue is not running")
+                self._full.set()
+                self._room.clear()
+                room = asyncio.ensure_future(self._room.wait())
+                await asyncio.wait({room, self._task}, return_when=asyncio.FIRST_COMPLETED)
+                room.cancel()
+
+        self._items.append((session_id, message, summary))
+        self._pending[session_id] = self._pending.get(session_id, 0) + 1
+        self.enqueued += 1
+        self._arrived.set()
+        if len(self._items) >= self.max_batch:
+            self._full.set()
+
+    def pending(self, session_id: str) -> int:
+        """Writes queued for session_id and not yet committed"""
+        return self._pending.get(session_id, 0)
+
+    async def flush(self):
+        """Wait until everything queued so far has been written (or dropped).
+
+        Raises the flush task's exception if it has died, since what it left
+        queued will never be written.
+        """
+        target = self.enqueued
+        while self._task is not None:
+            if self._task.done():
+                if self._task.cancelled():
+                    raise RuntimeError("write-behind flush task was cancelled")
+                self._task.result()
+            if self.written + self.dropped >= target:
+                return
+            self._full.set()
+            self._progress.clear()
+            progress = asyncio.ensure_future(self._progress.wait())
+            await asyncio.wait({progress, self._task}, return_when=asyncio.FIRST_COMPLETED)
+            progress.cancel()
+
+    def snapshot(self) -> dict:
+        latencies = sorted(self.flush_latencies)
+
+        def percentile(p):
+            if not latencies:
+                return 0.0
+            return round(latencies[min(len(latencies) - 1, int(p * len(latencies)))] * 1000, 3)
+
+        return {
+            "running": self.running,
+            "queued": len(self._items),
+            "max_size": self.max_size,
+            "enqueued": self.enqueued,
+            "written": self.written,
+            "dropped": self.dropped,
+            "batches": self.batches,
+            "failures": self.failures,
+            "waits": self.waits,
+            "average_batch_size": round(sum(self.batch_sizes) / len(self.batch_sizes), 2) if self.batch_sizes else 0.0,
+            "flush_ms": {"p50": percentile(0.50), "p95": percentile(0.95), "p99": percentile(0.99)}
+        }
+
+    async def _run(self):
+        while True:
+            if not self._items:
+                self._arrived.clear()
+                await self._arrived.wait()
+            # Group commit: let writes accumulate for one interval unless a batch is full
+            if len(self._items) < self.max_batch and not self._full.is_set():
+                try:
+                    await asyncio.wait_for(self._full.wait(), self.flush_interval)
+                except asyncio.TimeoutError:
+                    pass
+            self._full.clear()
+            await self._flush_batch()
+
+    async def _flush_batch(self):
+        batch = [self._items.popleft() for _ in range(min(len(self._items), self.max_batch))]
+        if not batch:
+            return
+
+        for attempt in range(self.retries + 1):
+            started = time.perf_counter()
+            try:
+                await self.write(batch)
+            except Exception:
+                self.failures += 1
+                logger.warning("Write-behind flush of %s messages failed (attempt %s)",
+                               len(batch), attempt + 1, exc_info=True)
+                if attempt < self.retries:
+                    await asyncio.sleep(self.flush_interval * 2 ** attempt)
+                continue
+            self.flush_latencies.append(time.perf_counter() - started)
+            self.batch_sizes.append(len(batch))
+            self.batches += 1
+            self.written += len(batch)
+            recent_writes.mark(*{session_id for session_id, _, _ in batch})
+            break
+        else:
+            self._drop(batch, f"{self.retries + 1} failed flushes")
+
+        self._done(batch)
+
+    def _drop(self, batch: list, reason: str):
+        self.dropped += len(batch)
+        logger.error("Dropped %s assistant messages after %s; sessions: %s", len(batch), reason,
+                     ", ".join(sorted({session_id for session_id, _, _ in batch})))
+
+    def _done(self, batch: list):
+        for session_id, _, _ in batch:
+            remaining = self._pending.get(session_id, 0) - 1
+            if remaining > 0:
+                self._pending[session_id] = remaining
+            else:
+                self._pending.pop(session_id, None)
+        self._room.set()
+        self._progress.set()
+
+    def _drop_queued(self, reason: str):
+        batch = list(self._items)
+        self._items.clear()
+        if batch:
+            self._drop(batch, reason)
+            self._done(batch)
+
+    def _stopped(self, task: asyncio.Task):
+        if not task.cancelled() and task.exception() is not None:
+            logger.error("Write-behind flush task died; replies are written inline until restart",
+                         exc_info=task.exception())
+            # Nothing will write these now; dropping them (logged) clears pending()
+            self._drop_queued("the flush task died")
+
+write_behind = WriteBehindQueue(
+    max_size=int(os.getenv("WRITE_BEHIND_QUEUE_SIZE", "10000")),
+    max_batch=int(os.getenv("WRITE_BEHIND_BATCH", "500")),
+    flush_interval=float(os.getenv("WRITE_BEHIND_INTERVAL_MS", "50")) / 1000
+)
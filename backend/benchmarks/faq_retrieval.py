@@ -0,0 +1,94 @@
+"""FAQ retrieval latency over a large synthetic corpus.
+
+Run from backend/:
+
+    python -m benchmarks.faq_retrieval [--passages 100000] [--queries 1000] [--max-p95-ms 10]
+
+Builds an index of --passages synthetic passages (help-center vocabulary
+mixed with Zipf-distributed filler words) in a temporary directory, times
+the build and the memory-mapped open, then times top-k search for BM25
+alone and for BM25 blended with dense vectors. Exits 1 when the p95 of
+either exceeds --max-p95-ms.
+"""
+from app.services.embeddings import tokenize
+from app.services.rag_service import FAQIndex, build_index, load_corpus
+from pathlib import Path
+import argparse
+import numpy as np
+import random
+import sys
+import tempfile
+import time
+
+def synthetic_passages(count: int, seed: int = 0) -> tuple:
+    """FAQ-like passages: real help-center words plus a long tail of filler terms"""
+    rng = np.random.default_rng(seed)
+    faq_words = np.array(sorted({word for entry in load_corpus()
+                                 for word in tokenize(f"{entry['title']} {entry['text']}")}))
+    filler = np.array([f"term{number}" for number in range(50000)])
+    # Zipf-like weights so a few filler terms are common and most are rare
+    weights = 1 / np.arange(1, len(filler) + 1)
+
+    faq_counts = rng.integers(5, 16, size=count)
+    filler_counts = rng.integers(15, 46, size=count)
+    faq_picks = iter(np.split(faq_words[rng.integers(0, len(faq_words), faq_counts.sum())],
+                              np.cumsum(faq_counts)[:-1]))
+    filler_picks = iter(np.split(filler[rng.choice(len(filler), filler_counts.sum(), p=weights / weights.sum())],
+                                 np.cumsum(filler_counts)[:-1]))
+
+    passages = []
+    for number in range(count):
+        words = rng.permutation(np.concatenate([next(faq_picks), next(filler_picks)])).tolist()
+        passages.append({"id": f"p{number}", "title": " ".join(words[:6]), "text": " ".join(words[6:])})
+    return passages, faq_words.tolist()
+
+def time_queries(index: FAQIndex, queries: list, k: int, dense_weight: float) -> list:
+    latencies = []
+    for query in queries:
+        started = time.perf_counter()
+        index.search(query, k, dense_weight=dense_weight)
+        latencies.append((time.perf_counter() - started) * 1000)
+    return sorted(latencies)
+
+def percentile(latencies: list, p: float) -> float:
+    return latencies[min(len(latencies) - 1, int(p * len(latencies)))]
+
+def main(argv: list = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--passages", type=int, default=100000)
+    parser.add_argument("--queries", type=int, default=1000)
+    parser.add_argument("--k", type=int, default=3)
+    parser.add_argument("--dense-dim", type=int, default=128)
+    parser.add_argument("--max-p95-ms", type=float, default=10.0)
+    args = parser.parse_args(argv)
+
+    rng = random.Random(0)
+    passages, faq_words = synthetic_passages(args.passages)
+    queries = [" ".join(rng.choices(faq_words, k=rng.randint(2, 6))) for _ in range(args.queries)]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / "index"
+        started = time.perf_counter()
+        meta = build_index(passages, path, dense_dim=args.dense_dim)
+        print(f"built {meta['passages']} passages, {meta['terms']} terms in {time.perf_counter() - started:.1f}s")
+
+        started = time.perf_counter()
+        index = FAQIndex(path)
+        print(f"opened (memory-mapped) in {(time.perf_counter() - started) * 1000:.2f} ms")
+
+        failed = False
+        for name, dense_weight in (("bm25", 0.0), ("bm25+dense", 0.3)):
+            index.search(queries[0], args.k, dense_weight=dense_weight)  # fault the pages in
+            latencies = time_queries(index, queries, args.k, dense_weight)
+            p95 = percentile(latencies, 0.95)
+            print(f"{name:11} p50 {percentile(latencies, 0.5):6.2f} ms  p95 {p95:6.2f} ms  "
+                  f"p99 {percentile(latencies, 0.99):6.2f} ms")
+            failed = failed or p95 > args.max_p95_ms
+
+    if failed:
+        print(f"p95 above {args.max_p95_ms} ms")
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
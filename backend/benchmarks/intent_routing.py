@@ -0,0 +1,89 @@
+"""Intent routing accuracy and throughput: compiled router vs the old keyword cascade.
+
+Run from backend/:
+
+    python -m benchmarks.intent_routing [--repeat N] [--min-accuracy 0.98]
+
+Accuracy is measured on the labelled messages in data/intents.jsonl and
+throughput on the same messages repeated. Exits 1 when the router's accuracy
+falls below --min-accuracy, so it can gate changes to the keyword lists.
+"""
+from app.services.intent_router import FALLBACK_INTENT, route_intent
+from pathlib import Path
+import argparse
+import json
+import sys
+import time
+
+DATASET = Path(__file__).parent / "data" / "intents.jsonl"
+
+# The substring cascade get_llm_response used before the router, kept as the baseline
+_CASCADE = [
+    ("greeting", ["hello", "hi", "hey"]),
+    ("order", ["order", "delivery", "shipping", "package"]),
+    ("frustrated", ["frustrated", "angry", "upset", "annoyed", "terrible"]),
+    ("refund", ["refund", "return", "money back", "cancel"]),
+    ("account", ["account", "login", "password", "sign in"]),
+    ("payment", ["payment", "charge", "credit card", "billing"]),
+    ("product", ["product", "item", "quality", "size", "color"]),
+    ("thanks", ["thank", "thanks", "appreciate", "great", "awesome"]),
+    ("help", ["help", "support", "assist", "question"]),
+]
+
+def cascade_intent(message: str) -> str:
+    message_lower = message.lower()
+    for intent, words in _CASCADE:
+        if any(word in message_lower for word in words):
+            return intent
+    return FALLBACK_INTENT
+
+def router_intent(message: str) -> str:
+    return route_intent(message).intent
+
+def load_dataset(path: Path = DATASET) -> list:
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+def evaluate(route, cases: list) -> tuple:
+    """(accuracy, misrouted (message, expected, got) triples)"""
+    misses = [(case["message"], case["intent"], route(case["message"])) for case in cases]
+    misses = [miss for miss in misses if miss[1] != miss[2]]
+    return 1 - len(misses) / len(cases), misses
+
+def throughput(route, messages: list, repeat: int) -> float:
+    """Messages routed per second"""
+    started = time.perf_counter()
+    for _ in range(repeat):
+        for message in messages:
+            route(message)
+    return len(messages) * repeat / (time.perf_counter() - started)
+
+def main(argv: list = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=2000, help="passes over the dataset for throughput")
+    parser.add_argument("--min-accuracy", type=float, default=0.98)
+    parser.add_argument("--verbose", action="store_true", help="list misrouted messages")
+    args = parser.parse_args(argv)
+
+    cases = load_dataset()
+    messages = [case["message"] for case in cases]
+    router_accuracy = None
+
+    print(f"{len(cases)} labelled messages, {args.repeat} throughput passes")
+    for name, route in (("cascade", cascade_intent), ("router", router_intent)):
+        accuracy, misses = evaluate(route, cases)
+        rate = throughput(route, messages, args.repeat)
+        print(f"{name:8} accuracy {accuracy:6.1%}  {rate:12,.0f} msg/s  {len(misses)} misrouted")
+        if args.verbose:
+            for message, expected, got in misses:
+                print(f"    {message!r}: expected {expected}, got {got}")
+        if route is router_intent:
+            router_accuracy = accuracy
+
+    if router_accuracy < args.min_accuracy:
+        print(f"Router accuracy below {args.min_accuracy:.0%}")
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,90 @@
+"""Local stand-in for the Anthropic Messages API.
+
+Point the backend at it to exercise the real LLM client (pooling, timeouts,
+retries, fallback) without network access or API spend. Run from backend/:
+
+    uvicorn benchmarks.llm_stub:app --port 8100
+    LLM_PROVIDER=anthropic ANTHROPIC_API_KEY=stub LLM_BASE_URL=http://127.0.0.1:8100 uvicorn app.main:app
+
+Behaviour is set with environment variables on the stub process:
+
+    LLM_STUB_LATENCY       seconds before the reply (or its first chunk) starts
+    LLM_STUB_CHUNK_DELAY   seconds between streamed chunks
+    LLM_STUB_FAILURE_RATE  share of requests answered 529 overloaded (0-1)
+
+GET /stats reports how many requests arrived, how many failed and the
+highest number handled at once.
+"""
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+import asyncio
+import json
+import os
+import random
+import re
+
+LATENCY = float(os.getenv("LLM_STUB_LATENCY", "0.2"))
+CHUNK_DELAY = float(os.getenv("LLM_STUB_CHUNK_DELAY", "0.01"))
+FAILURE_RATE = float(os.getenv("LLM_STUB_FAILURE_RATE", "0"))
+
+app = FastAPI(title="LLM stub")
+stats = {"requests": 0, "failures": 0, "in_flight": 0, "peak_in_flight": 0}
+
+def stub_reply(body: dict) -> str:
+    last = body["messages"][-1]["content"] if body.get("messages") else ""
+    return f"(stub) Thanks for your message about \"{last[:60]}\". How else can I help?"
+
+def sse(event: dict) -> str:
+    return f"event: {event['type']}\ndata: {json.dumps(event)}\n\n"
+
+@app.post("/v1/messages")
+async def messages(request: Request):
+    body = await request.json()
+    stats["requests"] += 1
+
+    if random.random() < FAILURE_RATE:
+        stats["failures"] += 1
+        return JSONResponse(
+            {"type": "error", "error": {"type": "overloaded_error", "message": "Overloaded"}},
+            status_code=529
+        )
+
+    reply = stub_reply(body)
+    stats["in_flight"] += 1
+    stats["peak_in_flight"] = max(stats["peak_in_flight"], stats["in_flight"])
+
+    if not body.get("stream"):
+        try:
+            await asyncio.sleep(LATENCY)
+        finally:
+            stats["in_flight"] -= 1
+        return {
+            "id": "msg_stub",
+            "type": "message",
+            "role": "assistant",
+            "model": body.get("model"),
+            "content": [{"type": "text", "text": reply}],
+            "stop_reason": "end_turn",
+            "usage": {"input_tokens": 0, "output_tokens": 0}
+        }
+
+    async def events():
+        try:
+            await asyncio.sleep(LATENCY)
+            yield sse({"type": "message_start", "message": {"id": "msg_stub", "role": "assistant", "content": []}})
+            yield sse({"type": "content_block_start", "index": 0, "content_block": {"type": "text", "text": ""}})
+            for chunk in re.findall(r"\S+\s*", reply):
+                yield sse({"type": "content_block_delta", "index": 0,
+                           "delta": {"type": "text_delta", "text": chunk}})
+                await asyncio.sleep(CHUNK_DELAY)
+            yield sse({"type": "content_block_stop", "index": 0})
+            yield sse({"type": "message_delta", "delta": {"stop_reason": "end_turn"}})
+            yield sse({"type": "message_stop"})
+        finally:
+            stats["in_flight"] -= 1
+
+    return StreamingResponse(events(), media_type="text/event-stream")
+
+@app.get("/stats")
+async def get_stats():
+    return stats
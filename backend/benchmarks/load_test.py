@@ -0,0 +1,378 @@
+"""End-to-end load test of the chat and analytics APIs.
+
+Run from backend/:
+
+    python -m benchmarks.load_test [--seed-messages 10000] [--concurrency 8] [--duration 20]
+        [--mix chat=60,dashboard=10,conversations=10,trends=10,history=10]
+        [--baseline benchmarks/baselines/load_test.json] [--save-baseline PATH]
+
+Drives the ASGI app in-process with an asyncio httpx client, so there is no
+server or network in the measurement. The database is a scratch SQLite file
+(or --database-url, e.g. a local Postgres) seeded with synthetic history
+through the bulk importer; pass --database to keep a seeded file between
+runs, which matters at --seed-messages 1000000. The LLM is simulated:
+rule-based replies after --llm-latency seconds.
+
+Each of --concurrency virtual users sends requests picked from the mix for
+--duration seconds after a --warmup. The report gives throughput, p50/p95/
+p99 latency and SQL statements per request for each request type. With
+--baseline the run exits 1 when a result breaks a threshold stored there;
+--save-baseline writes thresholds from this run with --headroom slack
+(default 1.25: latency ceilings 25% above the measured p95/p99, minimum
+throughput 20% below the measured rate). Baselines are machine-specific:
+save one on the machine that checks it, and from the slowest of a few
+runs, since chat and history latency vary with how flushes of queued
+replies line up with reads.
+"""
+from pathlib import Path
+import argparse
+import asyncio
+import json
+import math
+import os
+import random
+import sys
+import tempfile
+import time
+
+BASELINE = Path(__file__).resolve().parent / "baselines" / "load_test.json"
+
+DEFAULT_MIX = "chat=60,dashboard=10,conversations=10,trends=10,history=10"
+
+CUSTOMER_MESSAGES = [
+    "Where is my order? It was supposed to arrive yesterday",
+    "I want a refund for order {number}",
+    "My card was charged twice for the same purchase",
+    "I can't log in to my account, the password reset email never comes",
+    "How do I change the delivery address on order {number}?",
+    "The app keeps showing an error when I check out",
+    "Thanks, that fixed it!",
+    "This is the third time I'm asking, this is unacceptable",
+    "Do you ship to Canada?",
+    "Can I return an item I bought on sale?",
+    "hello",
+    "The size I ordered doesn't fit, can I exchange it?",
+]
+
+AGENT_REPLY = "Thanks for reaching out, let me look into that for you."
+
+def parse_mix(spec: str) -> dict:
+    """{"chat": 60, ...} from "chat=60,dashboard=10,..." """
+    mix = {}
+    for item in filter(None, (part.strip() for part in spec.split(","))):
+        kind, _, weight = item.partition("=")
+        if kind not in REQUESTS:
+            raise SystemExit(f"Unknown request type {kind!r}; choose from {', '.join(REQUESTS)}")
+        mix[kind] = float(weight)
+    return mix
+
+def seed_transcripts(count: int, messages_per_conversation: int = 10, seed: int = 0):
+    """NDJSON lines for count synthetic conversations spread over the last 90 days"""
+    rng = random.Random(seed)
+    now = time.time()
+    for number in range(count):
+        started = now - rng.uniform(0, 90 * 86400)
+        messages = []
+        for turn in range(max(1, messages_per_conversation // 2)):
+            stamp = time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(started + turn * 60))
+            messages.append({
+                "role": "user",
+                "content": rng.choice(CUSTOMER_MESSAGES).format(number=rng.randint(10000, 99999)),
+                "timestamp": stamp,
+                # Scores are supplied, so seeding does not wait on sentiment analysis
+                "sentiment_score": round(rng.uniform(-1, 1), 2)
+            })
+            messages.append({"role": "assistant", "content": AGENT_REPLY, "timestamp": stamp})
+        yield json.dumps({
+            "session_id": f"seed-{number}",
+            "customer_name": f"Customer {number}",
+            "status": rng.choice(("active", "active", "resolved")),
+            "messages": messages
+        })
+
+class LoadUser:
+    """One virtual user: its random stream and the chat sessions it has opened"""
+
+    def __init__(self, number: int, seeded: int, new_session_rate: float):
+        self.number = number
+        self.rng = random.Random(number)
+        self.seeded = seeded
+        self.new_session_rate = new_session_rate
+        self.sessions = []
+
+    def session(self) -> str:
+        """A new session, one of this user's, or a seeded one (a cold history load)"""
+        if not self.sessions or self.rng.random() < self.new_session_rate:
+            self.sessions.append(f"load-{self.number}-{len(self.sessions)}")
+            return self.sessions[-1]
+        if self.seeded and self.rng.random() < 0.2:
+            return f"seed-{self.rng.randrange(self.seeded)}"
+        return self.rng.choice(self.sessions[-5:])
+
+async def chat(client, user: LoadUser):
+    message = user.rng.choice(CUSTOMER_MESSAGES).format(number=user.rng.randint(10000, 99999))
+    return await client.post("/api/chat", json={"session_id": user.session(), "message": message})
+
+async def dashboard(client, user: LoadUser):
+    return await client.get("/api/analytics/dashboard")
+
+async def conversations(client, user: LoadUser):
+    params = {"limit": 20}
+    if user.rng.random() < 0.3:
+        params["status"] = user.rng.choice(("active", "resolved", "escalated"))
+    return await client.get("/api/analytics/conversations", params=params)
+
+async def trends(client, user: LoadUser):
+    return await client.get("/api/analytics/sentiment-trends",
+                            params={"granularity": user.rng.choice(("hour", "day", "week"))})
+
+async def history(client, user: LoadUser):
+    return await client.get(f"/api/chat/history/{user.session()}", params={"limit": 50})
+
+REQUESTS = {
+    "chat": chat,
+    "dashboard": dashboard,
+    "conversations": conversations,
+    "trends": trends,
+    "history": history,
+}
+
+class Results:
+    """Latencies and query counts per request type"""
+
+    def __init__(self):
+        self.latencies = {}
+        self.statements = {}
+        self.commits = {}
+        self.errors = {}
+        # First failure per request type, to say what went wrong
+        self.first_errors = {}
+
+    def add(self, kind: str, seconds: float, counter, error: str = None):
+        self.latencies.setdefault(kind, []).append(seconds * 1000)
+        self.statements[kind] = self.statements.get(kind, 0) + counter.statements
+        self.commits[kind] = self.commits.get(kind, 0) + counter.commits
+        if error is not None:
+            self.errors[kind] = self.errors.get(kind, 0) + 1
+            self.first_errors.setdefault(kind, error)
+
+    def summary(self, duration: float) -> dict:
+        report = {}
+        for kind, latencies in sorted(self.latencies.items()):
+            latencies.sort()
+            count = len(latencies)
+            report[kind] = {
+                "requests": count,
+                "errors": self.errors.get(kind, 0),
+                "rps": round(count / duration, 1),
+                "p50_ms": round(percentile(latencies, 0.50), 2),
+                "p95_ms": round(percentile(latencies, 0.95), 2),
+                "p99_ms": round(percentile(latencies, 0.99), 2),
+                "queries_per_request": round(self.statements[kind] / count, 2),
+                "commits_per_request": round(self.commits[kind] / count, 2)
+            }
+        total = sum(item["requests"] for item in report.values())
+        errors = sum(item["errors"] for item in report.values())
+        report["total"] = {
+            "requests": total,
+            "errors": errors,
+            "rps": round(total / duration, 1),
+            "error_rate": round(errors / total, 4) if total else 0.0
+        }
+        return report
+
+def percentile(latencies: list, p: float) -> float:
+    return latencies[min(len(latencies) - 1, int(p * len(latencies)))] if latencies else 0.0
+
+def check_baseline(report: dict, baseline: dict) -> list:
+    """Threshold breaches: *_ms and queries_per_request are maxima, min_rps a minimum"""
+    failures = []
+    for kind, limits in baseline.items():
+        result = report.get(kind)
+        if result is None:
+            continue
+        for name, limit in limits.items():
+            if name == "min_rps":
+                if result["rps"] < limit:
+                    failures.append(f"{kind}: {result['rps']} rps < {limit}")
+            elif name.startswith("max_"):
+                value = result[name[len("max_"):]]
+                if value > limit:
+                    failures.append(f"{kind}: {name[len('max_'):]} {value} > {limit}")
+    return failures
+
+def baseline_from(report: dict, headroom: float, max_error_rate: float) -> dict:
+    def ceiling(value):
+        # Fast endpoints get absolute slack too: a few ms of scheduler noise is not a regression
+        return round(max(value * headroom, value + 25), 1)
+
+    baseline = {}
+    for kind, result in report.items():
+        if kind == "total":
+            baseline[kind] = {"min_rps": round(result["rps"] / headroom, 1),
+                              "max_error_rate": max_error_rate}
+            continue
+        baseline[kind] = {
+            "max_p95_ms": ceiling(result["p95_ms"]),
+            # Query counts are deterministic per path, so no slack beyond rounding up
+            "max_queries_per_request": math.ceil(result["queries_per_request"])
+        }
+        # p99 is the second-worst request at 200 samples; only hold larger samples to it
+        if result["requests"] >= 1000:
+            baseline[kind]["max_p99_ms"] = ceiling(result["p99_ms"])
+    return baseline
+
+def print_report(report: dict):
+    print(f"{'request':14} {'count':>7} {'err':>5} {'rps':>8} {'p50 ms':>8} {'p95 ms':>8} "
+          f"{'p99 ms':>8} {'queries':>8} {'commits':>8}")
+    for kind, result in report.items():
+        if kind == "total":
+            continue
+        print(f"{kind:14} {result['requests']:7} {result['errors']:5} {result['rps']:8} "
+              f"{result['p50_ms']:8} {result['p95_ms']:8} {result['p99_ms']:8} "
+              f"{result['queries_per_request']:8} {result['commits_per_request']:8}")
+    total = report["total"]
+    print(f"{'total':14} {total['requests']:7} {total['errors']:5} {total['rps']:8}")
+
+async def run(args) -> dict:
+    # Imported here: the app reads its configuration from the environment on import
+    from app.main import app
+    from app.models.database import QueryCounter, SessionLocal, count_queries, init_db
+    from app.models.database import Message
+    from app.services.bulk_import import import_transcripts
+    from app.services.llm import RuleBasedProvider, llm_client
+    from app.services.metrics_rollup import init_rollup
+    from app.services.write_behind import write_behind
+    import httpx
+
+    class SimulatedProvider(RuleBasedProvider):
+        """Rule-based replies after a fixed model latency"""
+
+        name = "simulated"
+
+        async def complete(self, message: str, history: list) -> str:
+            await asyncio.sleep(args.llm_latency)
+            return await super().complete(message, history)
+
+        async def stream(self, message: str, history: list):
+            await asyncio.sleep(args.llm_latency)
+            async for chunk in super().stream(message, history):
+                yield chunk
+
+    init_db()
+    init_rollup()
+    db = SessionLocal()
+    try:
+        stored = db.query(Message.id).count()
+        conversations = args.seed_messages // args.messages_per_conversation
+        if stored == 0 and conversations:
+            started = time.perf_counter()
+            seeded = import_transcripts(
+                db, seed_transcripts(conversations, args.messages_per_conversation), batch_size=2000
+            )
+            stored = seeded.messages
+            print(f"seeded {seeded.conversations} conversations / {seeded.messages} messages "
+                  f"in {time.perf_counter() - started:.1f}s")
+        else:
+            print(f"using {stored} stored messages")
+    finally:
+        db.close()
+
+    llm_client.provider = SimulatedProvider()
+    await app.router.startup()
+    results = Results()
+    mix = parse_mix(args.mix)
+    kinds, weights = list(mix), list(mix.values())
+    seeded_sessions = stored // args.messages_per_conversation
+
+    async def virtual_user(number: int, client, deadline: float, recording: float):
+        user = LoadUser(number, seeded_sessions, args.new_session_rate)
+        while time.perf_counter() < deadline:
+            kind = user.rng.choices(kinds, weights)[0]
+            counter = QueryCounter()
+            started = time.perf_counter()
+            error = None
+            try:
+                with count_queries(counter):
+                    response = await REQUESTS[kind](client, user)
+                if response.status_code >= 400:
+                    error = f"HTTP {response.status_code}: {response.text[:200]}"
+            except Exception as exc:
+                error = repr(exc)
+            if started >= recording:
+                results.add(kind, time.perf_counter() - started, counter, error)
+
+    try:
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://load-test",
+                                     timeout=60) as client:
+            recording = time.perf_counter() + args.warmup
+            deadline = recording + args.duration
+            await asyncio.gather(*(
+                virtual_user(number, client, deadline, recording) for number in range(args.concurrency)
+            ))
+        write_stats = write_behind.snapshot()
+    finally:
+        await app.router.shutdown()
+
+    print(f"write-behind: {write_stats['written']} replies in {write_stats['batches']} group commits, "
+          f"flush p95 {write_stats['flush_ms']['p95']} ms, {write_stats['waits']} waits for room")
+
+    for kind, error in results.first_errors.items():
+        print(f"first {kind} error: {error}")
+    return results.summary(args.duration)
+
+def main(argv: list = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--seed-messages", type=int, default=10000,
+                        help="synthetic history to seed an empty database with (e.g. 1000000)")
+    parser.add_argument("--messages-per-conversation", type=int, default=10)
+    parser.add_argument("--database", help="SQLite file to use and keep (default: a scratch file)")
+    parser.add_argument("--database-url", help="any DATABASE_URL instead, e.g. a local Postgres")
+    parser.add_argument("--concurrency", type=int, default=8, help="virtual users")
+    parser.add_argument("--duration", type=float, default=20.0, help="seconds measured")
+    parser.add_argument("--warmup", type=float, default=3.0, help="seconds run before measuring")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help="request type weights")
+    parser.add_argument("--new-session-rate", type=float, default=0.2,
+                        help="share of chat turns that open a new session")
+    parser.add_argument("--llm-latency", type=float, default=0.05, help="simulated model latency in seconds")
+    parser.add_argument("--baseline", type=Path, nargs="?", const=BASELINE,
+                        help=f"fail when a threshold in this file is broken (default {BASELINE.name})")
+    parser.add_argument("--save-baseline", type=Path, help="write thresholds from this run")
+    parser.add_argument("--headroom", type=float, default=1.25,
+                        help="slack applied to latency and throughput when saving a baseline")
+    parser.add_argument("--max-error-rate", type=float, default=0.01,
+                        help="error rate allowed by a saved baseline (SQLite can time out on its write lock)")
+    parser.add_argument("--json", type=Path, help="also write the report here")
+    args = parser.parse_args(argv)
+    parse_mix(args.mix)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        if args.database_url:
+            os.environ["DATABASE_URL"] = args.database_url
+        else:
+            os.environ["DATABASE_URL"] = f"sqlite:///{Path(args.database or Path(tmp) / 'load.db').resolve()}"
+        os.environ.pop("ASYNC_DATABASE_URL", None)
+        # The simulated provider replaces the configured one
+        os.environ.setdefault("LLM_PROVIDER", "rules")
+        report = asyncio.run(run(args))
+
+    print_report(report)
+    if args.json:
+        args.json.write_text(json.dumps(report, indent=2))
+    if args.save_baseline:
+        args.save_baseline.parent.mkdir(parents=True, exist_ok=True)
+        args.save_baseline.write_text(json.dumps(baseline_from(report, args.headroom, args.max_error_rate), indent=2) + "\n")
+        print(f"baseline written to {args.save_baseline}")
+
+    if args.baseline:
+        failures = check_baseline(report, json.loads(args.baseline.read_text()))
+        for failure in failures:
+            print(f"FAIL {failure}")
+        if failures:
+            return 1
+        print(f"within baseline {args.baseline}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
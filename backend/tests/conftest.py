@@ -0,0 +1,33 @@
+import os
+import tempfile
+
+# The engines are created when app.models.database is imported, so the test
+# database has to be configured before any test module imports the app. The
+# tests drop every table, so a DATABASE_URL from the environment is never
+# used; TEST_DATABASE_URL picks another throwaway database
+_data = tempfile.mkdtemp(prefix="support-tests-")
+os.environ["DATABASE_URL"] = os.getenv("TEST_DATABASE_URL", f"sqlite:///{_data}/test.db")
+os.environ.pop("ASYNC_DATABASE_URL", None)
+os.environ.pop("DATABASE_REPLICA_URL", None)
+os.environ.pop("ASYNC_DATABASE_REPLICA_URL", None)
+os.environ["ARCHIVE_DIR"] = os.path.join(_data, "archive")
+os.environ.setdefault("ANTHROPIC_API_KEY", "")
+os.environ.setdefault("SENTIMENT_WORKERS", "0")
+
+import pytest
+from app.models.database import Base, SessionLocal, engine, init_db
+from app.services.analytics_cache import analytics_cache
+from app.services.context_cache import context_cache
+
+@pytest.fixture
+def db():
+    """A session on freshly created tables, with the in-process caches empty"""
+    Base.metadata.drop_all(bind=engine)
+    init_db()
+    context_cache.clear()
+    analytics_cache.clear()
+    session = SessionLocal()
+    try:
+        yield session
+    finally:
+        session.close()
@@ -0,0 +1,69 @@
+import asyncio
+import gc
+import pytest
+from app.api import chat
+from app.schemas.chat import ChatSocketMessage
+
+class HistoryLoadFailed(Exception):
+    pass
+
+class ScoringFailed(Exception):
+    pass
+
+def run_turn(monkeypatch, begin, analyze):
+    """run_socket_turn with the history load and scoring replaced; returns
+    (what it raised, frames sent, errors the event loop reported)"""
+    class Processor:
+        def __init__(self, db):
+            pass
+
+    Processor.begin = begin
+    monkeypatch.setattr(chat, "AsyncTurnProcessor", Processor)
+    monkeypatch.setattr(chat, "analyze_sentiment", analyze)
+    frames, unhandled = [], []
+
+    async def send(event):
+        frames.append(event)
+
+    async def main():
+        asyncio.get_running_loop().set_exception_handler(lambda loop, context: unhandled.append(context))
+        with pytest.raises(Exception) as raised:
+            await chat.run_socket_turn("socket", ChatSocketMessage(message="Where is my order?"), send)
+        # Unretrieved task exceptions are reported when the task is collected
+        gc.collect()
+        await asyncio.sleep(0)
+        return raised.value
+
+    return asyncio.run(main()), frames, unhandled
+
+def test_history_load_failure_is_reported_when_scoring_fails_after_it(db, monkeypatch):
+    async def begin(self, session_id, message, customer_name=None):
+        raise HistoryLoadFailed("database unavailable")
+
+    async def analyze(message):
+        await asyncio.sleep(0.01)
+        raise ScoringFailed("pool broken")
+
+    raised, frames, unhandled = run_turn(monkeypatch, begin, analyze)
+    assert isinstance(raised, HistoryLoadFailed)
+    assert isinstance(raised.__context__, ScoringFailed)
+    assert frames == [] and unhandled == []
+
+def test_scoring_failure_cancels_a_running_history_load(db, monkeypatch):
+    cancelled = []
+
+    async def begin(self, session_id, message, customer_name=None):
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            cancelled.append(True)
+            raise
+
+    async def analyze(message):
+        await asyncio.sleep(0)
+        raise ScoringFailed("pool broken")
+
+    raised, frames, unhandled = run_turn(monkeypatch, begin, analyze)
+    assert isinstance(raised, ScoringFailed)
+    assert cancelled == [True]
+    assert frames == [] and unhandled == []
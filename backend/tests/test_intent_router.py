@@ -0,0 +1,34 @@
+import pytest
+from app.services.intent_router import FALLBACK_INTENT, route_intent
+from benchmarks.intent_routing import load_dataset
+
+CASES = load_dataset()
+
+@pytest.mark.parametrize("case", CASES, ids=[case["message"] for case in CASES])
+def test_labelled_messages_route_to_their_intent(case):
+    assert route_intent(case["message"]).intent == case["intent"]
+
+@pytest.mark.parametrize("message,intent", [
+    # Negations still carry the intent they negate
+    ("I can't login", "account"),
+    ("I cannot sign in anymore", "account"),
+    ("My package never arrived", "order"),
+    ("I don't recognise this charge", "payment"),
+    ("I'm not happy, this is unacceptable", "frustrated"),
+    ("Please don't cancel my order", "refund"),
+])
+def test_negated_requests(message, intent):
+    assert route_intent(message).intent == intent
+
+@pytest.mark.parametrize("message", [
+    "", None, "ok", "His hidden history", "Thankless task", "Helpful hints?", "Shipped by whom?",
+])
+def test_messages_without_keywords_fall_back(message):
+    match = route_intent(message)
+    assert match.intent == FALLBACK_INTENT
+    assert match.confidence == 0.0
+
+def test_highest_priority_intent_wins():
+    match = route_intent("Hi, I want a refund for my order")
+    assert match.intent == "refund"
+    assert match.confidence == pytest.approx(1 / 3, abs=0.001)
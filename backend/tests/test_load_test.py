@@ -0,0 +1,34 @@
+from benchmarks.load_test import baseline_from, check_baseline
+
+REPORT = {
+    "chat": {"requests": 1200, "rps": 60.0, "p95_ms": 300.0, "p99_ms": 900.0, "queries_per_request": 3.78},
+    "dashboard": {"requests": 180, "rps": 9.0, "p95_ms": 20.0, "p99_ms": 50.0, "queries_per_request": 0.9},
+    "total": {"requests": 1380, "errors": 0, "rps": 69.0, "error_rate": 0.0}
+}
+
+def test_baseline_adds_the_stated_headroom():
+    baseline = baseline_from(REPORT, 1.25, 0.01)
+    assert baseline["chat"] == {"max_p95_ms": 375.0, "max_queries_per_request": 4, "max_p99_ms": 1125.0}
+    # Fast endpoints get at least 25 ms, and no p99 ceiling below 1000 requests
+    assert baseline["dashboard"] == {"max_p95_ms": 45.0, "max_queries_per_request": 1}
+    assert baseline["total"] == {"min_rps": 55.2, "max_error_rate": 0.01}
+
+def test_a_run_within_its_own_baseline_passes():
+    assert check_baseline(REPORT, baseline_from(REPORT, 1.25, 0.01)) == []
+
+def test_regressions_break_the_baseline():
+    baseline = baseline_from(REPORT, 1.25, 0.01)
+    slower = {
+        "chat": dict(REPORT["chat"], p95_ms=400.0, queries_per_request=4.2),
+        "dashboard": REPORT["dashboard"],
+        "total": dict(REPORT["total"], rps=50.0, errors=28, error_rate=0.02)
+    }
+    assert check_baseline(slower, baseline) == [
+        "chat: p95_ms 400.0 > 375.0",
+        "chat: queries_per_request 4.2 > 4",
+        "total: 50.0 rps < 55.2",
+        "total: error_rate 0.02 > 0.01"
+    ]
+
+def test_request_types_missing_from_the_run_are_skipped():
+    assert check_baseline({"total": REPORT["total"]}, baseline_from(REPORT, 1.25, 0.01)) == []
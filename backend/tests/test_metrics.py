@@ -0,0 +1,82 @@
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import text
+from app.models.database import SessionLocal
+from app.services.metrics import (
+    MetricsMiddleware, MetricsRegistry, StageTimer, chat_stage_seconds, http_request_statements,
+    http_requests
+)
+
+def test_render_counters_and_histograms():
+    registry = MetricsRegistry(prefix="test_")
+    requests = registry.counter("requests_total", "Requests", ("route",))
+    latency = registry.histogram("latency_seconds", "Latency", buckets=(0.1, 1.0))
+    requests.inc(route='/a"b')
+    requests.inc(2, route='/a"b')
+    latency.observe(0.05)
+    latency.observe(0.5)
+    latency.observe(5.0)
+
+    lines = registry.render().splitlines()
+    assert lines[:3] == [
+        "# HELP test_requests_total Requests",
+        "# TYPE test_requests_total counter",
+        'test_requests_total{route="/a\\"b"} 3',
+    ]
+    # Buckets are cumulative and end with +Inf, which equals the count
+    assert lines[5:] == [
+        'test_latency_seconds_bucket{le="0.1"} 1',
+        'test_latency_seconds_bucket{le="1.0"} 2',
+        'test_latency_seconds_bucket{le="+Inf"} 3',
+        "test_latency_seconds_sum 5.55",
+        "test_latency_seconds_count 3",
+    ]
+
+def test_collect_reads_service_stats_at_scrape_time():
+    registry = MetricsRegistry(prefix="test_")
+    stats = {"hits": 1, "running": True, "flush_ms": {"p95": 2.5}}
+    registry.collect("cache", lambda: stats, counters=("hits",), gauges=("running", "flush_ms.p95", "missing"))
+    stats["hits"] = 7
+
+    samples = [line for line in registry.render().splitlines() if not line.startswith("#")]
+    assert samples == ["test_cache_hits_total 7", "test_cache_running 1.0", "test_cache_flush_ms_p95 2.5"]
+
+def test_stage_timer_records_each_lap():
+    before = chat_stage_seconds.count(stage="test_lap")
+    timer = StageTimer()
+    timer.lap("test_lap")
+    timer.lap("test_lap")
+    assert chat_stage_seconds.count(stage="test_lap") == before + 2
+
+def test_middleware_labels_by_route_template_and_counts_statements(db):
+    app = FastAPI()
+    app.add_middleware(MetricsMiddleware)
+
+    @app.get("/test-items/{item_id}")
+    def item(item_id: int):
+        session = SessionLocal()
+        try:
+            session.execute(text("SELECT 1"))
+            session.execute(text("SELECT 2"))
+        finally:
+            session.close()
+        return {"id": item_id}
+
+    labels = {"method": "GET", "route": "/test-items/{item_id}"}
+    key = ("GET", "/test-items/{item_id}")
+
+    def statements():
+        # (requests observed, statements summed) for the route
+        _, total = http_request_statements._values.get(key, (None, 0))
+        return http_request_statements.count(**labels), total
+
+    before = statements()
+    client = TestClient(app)
+    for item_id in (1, 2):
+        assert client.get(f"/test-items/{item_id}").status_code == 200
+    assert client.get("/nowhere").status_code == 404
+
+    requests, total = statements()
+    assert (requests - before[0], total - before[1]) == (2, 4)
+    assert http_requests.value(status=200, **labels) >= 2
+    assert http_requests.value(method="GET", route="unmatched", status=404) >= 1
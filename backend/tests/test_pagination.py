@@ -0,0 +1,94 @@
+import pytest
+from app.models.database import ArchivedConversation, Conversation, Message
+from app.services.analytics_service import AnalyticsService
+from app.services.chat_service import ChatService
+from app.services.pagination import decode_cursor, encode_cursor
+from datetime import datetime, timedelta
+
+START = datetime(2024, 5, 1, 12, 0, 0)
+
+def add_messages(db, session_id: str, timestamps: list) -> list:
+    conversation = Conversation(session_id=session_id, created_at=START, status="active")
+    db.add(conversation)
+    db.flush()
+    messages = [
+        Message(conversation_id=conversation.id, session_id=session_id, role="user",
+                content=f"message {number}", timestamp=timestamp)
+        for number, timestamp in enumerate(timestamps)
+    ]
+    db.add_all(messages)
+    db.commit()
+    return [message.id for message in messages]
+
+def walk(fetch, cursor_name: str, cursor: str = None) -> list:
+    """Every page from cursor onwards, following cursor_name until has_more is off"""
+    pages = []
+    while True:
+        page = fetch(**{cursor_name: cursor})
+        pages.append(page)
+        if not page.has_more:
+            return pages
+        cursor = getattr(page, cursor_name)
+
+def test_cursor_round_trip():
+    assert decode_cursor(encode_cursor(START, 42)) == (START, 42)
+
+@pytest.mark.parametrize("cursor", ["not a cursor", "!!!", encode_cursor(START, 1)[:-3]])
+def test_malformed_cursor_is_a_value_error(db, cursor):
+    with pytest.raises(ValueError):
+        decode_cursor(cursor)
+    with pytest.raises(ValueError):
+        ChatService(db).get_conversation_history("pages", before=cursor)
+    with pytest.raises(ValueError):
+        AnalyticsService(db).list_conversations(after=cursor)
+
+def test_history_pages_break_timestamp_ties_by_id(db):
+    # Five messages share one timestamp, so only the id orders them
+    ids = add_messages(db, "pages", [START] * 5 + [START + timedelta(seconds=1)] * 2)
+    service = ChatService(db)
+
+    latest = service.get_conversation_history("pages", limit=3)
+    assert [message.id for message in latest.items] == ids[-3:]
+    assert latest.has_more
+
+    older = walk(lambda before: service.get_conversation_history("pages", limit=3, before=before),
+                 "before", latest.before)
+    pages = [latest] + older
+    assert [message.id for page in reversed(pages) for message in page.items] == ids
+    assert [len(page.items) for page in pages] == [3, 3, 1]
+
+    newer = walk(lambda after: service.get_conversation_history("pages", limit=2, after=after),
+                 "after", encode_cursor(START, ids[0]))
+    assert [message.id for page in newer for message in page.items] == ids[1:]
+
+def test_last_page(db):
+    ids = add_messages(db, "pages", [START + timedelta(seconds=n) for n in range(4)])
+    service = ChatService(db)
+
+    page = service.get_conversation_history("pages", limit=4)
+    assert [message.id for message in page.items] == ids
+    assert not page.has_more
+
+    # Past either end: an empty page that echoes the cursor back
+    beyond = service.get_conversation_history("pages", limit=4, before=page.before)
+    assert beyond.items == [] and not beyond.has_more and beyond.before == page.before
+    polled = service.get_conversation_history("pages", limit=4, after=page.after)
+    assert polled.items == [] and not polled.has_more and polled.after == page.after
+
+def test_conversation_pages_merge_archived_ties(db):
+    hot = [Conversation(session_id=f"hot-{n}", created_at=START, status="active") for n in range(4)]
+    db.add_all(hot)
+    db.flush()
+    archived = ArchivedConversation(id=hot[-1].id + 10, session_id="archived", created_at=START,
+                                    status="resolved", path="2024-05/x.ndjson.gz", offset=0, length=1)
+    db.add(archived)
+    db.add(Conversation(session_id="older", created_at=START - timedelta(days=1), status="active"))
+    db.commit()
+
+    service = AnalyticsService(db)
+    pages = walk(lambda before: service.list_conversations(limit=2, before=before), "before")
+    listed = [conversation.session_id for page in pages for conversation in page.items]
+    # Newest first; the tie on created_at is broken by id, archived rows included
+    assert listed == ["archived", "hot-3", "hot-2", "hot-1", "hot-0", "older"]
+    assert [len(page.items) for page in pages] == [2, 2, 2]
+    assert not pages[-1].has_more
@@ -0,0 +1,77 @@
+import asyncio
+from app.models.database import AsyncSessionLocal, PendingRollup, SentimentBucket
+from app.services.metrics_rollup import MetricsRollupService, init_rollup
+from app.services.turn_processor import AsyncTurnProcessor
+from app.services.write_behind import write_behind
+
+TURNS = [
+    ("rollup-a", "Hi, where is my order?", 0.1, "neutral"),
+    ("rollup-b", "My password reset link is broken", -0.4, "negative"),
+    ("rollup-a", "Thanks, that is great", 0.7, "positive"),
+    ("rollup-b", "This is unacceptable, I want a refund", -0.8, "negative"),
+]
+
+def run_turns():
+    async def turns():
+        for session_id, message, score, label in TURNS:
+            async with AsyncSessionLocal() as session:
+                processor = AsyncTurnProcessor(session)
+                turn = await processor.begin(session_id, message)
+                await processor.respond(turn, score, label, reply())
+
+    async def reply():
+        return "Let me look into that for you."
+
+    return turns()
+
+def buckets(db):
+    return sorted((bucket.granularity, bucket.bucket_start, round(bucket.sentiment_sum, 6),
+                   bucket.message_count) for bucket in db.query(SentimentBucket))
+
+def assert_matches_rebuild(db):
+    db.expire_all()
+    rollup = MetricsRollupService(db)
+    values, trends = rollup.read(), buckets(db)
+    rebuilt = rollup.rebuild()
+    assert {metric: round(value, 6) for metric, value in values.items()} == \
+           {metric: round(value, 6) for metric, value in rebuilt.items()}
+    assert trends == buckets(db)
+
+def test_write_behind_applies_pending_rollups(db):
+    init_rollup()
+
+    async def main():
+        write_behind.start()
+        try:
+            await run_turns()
+            await write_behind.flush()
+        finally:
+            await write_behind.stop()
+
+    asyncio.run(main())
+    assert db.query(PendingRollup).count() == 0
+    assert_matches_rebuild(db)
+
+def test_pending_rollups_survive_a_failed_flush(db, monkeypatch):
+    init_rollup()
+
+    async def fail(batch):
+        raise RuntimeError("database unavailable")
+
+    monkeypatch.setattr(write_behind, "write", fail)
+    monkeypatch.setattr(write_behind, "retries", 0)
+
+    async def main():
+        write_behind.start()
+        try:
+            await run_turns()
+            await write_behind.flush()
+        finally:
+            await write_behind.stop()
+
+    asyncio.run(main())
+    # The replies are gone, but every turn's deltas were committed with it
+    assert db.query(PendingRollup).count() == len(TURNS)
+    init_rollup()
+    assert db.query(PendingRollup).count() == 0
+    assert_matches_rebuild(db)
@@ -0,0 +1,9 @@
+from app.services.query_plans import HOT_QUERIES, check_query_plans, pick_sample, seed_sample_data
+
+def test_hot_queries_use_their_indexes(db):
+    # Enough rows that a scan or a sort costs more than the index to the planner
+    seed_sample_data(db, 2000)
+    results = check_query_plans(db, pick_sample(db))
+
+    assert [result.name for result in results] == [name for name, _, _ in HOT_QUERIES]
+    assert {result.name: result.problems for result in results if result.problems} == {}
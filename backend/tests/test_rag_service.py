@@ -0,0 +1,50 @@
+import json
+import pytest
+from app.services import rag_service
+from app.services.rag_service import INDEX_FORMAT, FAQIndex, FAQRetriever, IndexFormatError, build_index
+
+PASSAGES = [
+    {"id": "reset", "title": "Resetting your password", "text": "Use the forgot password link to reset it."},
+    {"id": "refunds", "title": "Refunds", "text": "Refunds reach your card within five business days."},
+]
+
+@pytest.fixture
+def corpus(tmp_path):
+    path = tmp_path / "faq.jsonl"
+    path.write_text("".join(json.dumps(passage) + "\n" for passage in PASSAGES))
+    return path
+
+@pytest.fixture
+def old_index(tmp_path):
+    """An index directory left by a build with an earlier INDEX_FORMAT"""
+    path = tmp_path / "faq_index"
+    build_index(PASSAGES[:1], path)
+    meta = json.loads((path / "meta.json").read_text())
+    (path / "meta.json").write_text(json.dumps(dict(meta, format=INDEX_FORMAT - 1)))
+    return path
+
+def test_old_format_is_an_index_format_error(old_index):
+    with pytest.raises(IndexFormatError):
+        FAQIndex(old_index)
+
+def test_old_format_index_is_rebuilt(old_index, corpus):
+    retriever = FAQRetriever(index_dir=old_index, corpus=corpus)
+    assert len(retriever.load()) == len(PASSAGES)
+    assert json.loads((old_index / "meta.json").read_text())["format"] == INDEX_FORMAT
+    assert [passage.id for passage in retriever.search("refund to my card")][:1] == ["refunds"]
+    # Nothing left behind by the rebuild
+    assert [path.name for path in old_index.parent.iterdir() if "building" in path.name] == []
+
+def test_old_format_index_is_used_from_memory_when_unwritable(old_index, corpus, monkeypatch):
+    def read_only(*args, **kwargs):
+        raise PermissionError("read-only file system")
+
+    monkeypatch.setattr(rag_service, "write_index", read_only)
+    retriever = FAQRetriever(index_dir=old_index, corpus=corpus)
+    assert len(retriever.load()) == len(PASSAGES)
+    assert retriever.search("forgot my password")[0].id == "reset"
+
+def test_old_format_index_without_corpus_disables_retrieval(old_index, tmp_path):
+    retriever = FAQRetriever(index_dir=old_index, corpus=tmp_path / "missing.jsonl")
+    assert retriever.load() is None
+    assert retriever.search("refund") == []
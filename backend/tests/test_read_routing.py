@@ -0,0 +1,68 @@
+import pytest
+from app.models import database
+from app.models.database import RecentWrites, _async_database_url, _engine_options, read_session
+from app.services.turn_processor import TurnProcessor
+
+@pytest.mark.parametrize("url,expected", [
+    ("sqlite:///./support.db", "sqlite+aiosqlite:///./support.db"),
+    ("postgresql://u:p@db/support", "postgresql+asyncpg://u:p@db/support"),
+    ("postgres://u:p@db/support", "postgresql+asyncpg://u:p@db/support"),
+    ("postgresql+asyncpg://u:p@db/support", "postgresql+asyncpg://u:p@db/support"),
+])
+def test_async_url_for_each_driver(url, expected):
+    assert _async_database_url(url) == expected
+
+def test_pool_settings_from_env(monkeypatch):
+    monkeypatch.setenv("DB_REPLICA_POOL_SIZE", "20")
+    monkeypatch.setenv("DB_REPLICA_POOL_PRE_PING", "false")
+    monkeypatch.setenv("DB_POOL_SIZE", "3")
+
+    assert _engine_options("postgresql://db/support", "DB_REPLICA_") == {
+        "pool_pre_ping": False, "pool_recycle": 1800,
+        "pool_size": 20, "max_overflow": 10, "pool_timeout": 30.0
+    }
+    assert _engine_options("postgresql://db/support")["pool_size"] == 3
+    # An in-memory SQLite database is one connection, so it gets no pool size
+    assert "pool_size" not in _engine_options("sqlite://")
+
+def test_recent_writes_expire_after_the_window(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(database.time, "monotonic", lambda: now[0])
+    writes = RecentWrites(window=5)
+    writes.mark("a")
+    now[0] += 3
+    writes.mark("b")
+    assert "a" in writes and "b" in writes
+
+    now[0] += 2.5
+    assert "a" not in writes and "b" in writes
+    # Expired sessions are dropped on the next mark
+    writes.mark("c")
+    assert list(writes._written) == ["b", "c"]
+
+def test_recent_writes_are_bounded():
+    writes = RecentWrites(window=60, max_sessions=2)
+    writes.mark("a", "b")
+    writes.mark("c")
+    assert "a" not in writes and "b" in writes and "c" in writes
+
+def test_reads_go_to_the_primary_after_a_write(monkeypatch):
+    monkeypatch.setattr(database, "AsyncSessionLocal", lambda: "primary")
+    monkeypatch.setattr(database, "AsyncReadSessionLocal", lambda: "replica")
+    monkeypatch.setattr(database, "recent_writes", RecentWrites(window=60))
+
+    assert read_session() == "replica"
+    assert read_session("routing") == "replica"
+    database.recent_writes.mark("routing")
+    assert read_session("routing") == "primary"
+    assert read_session("other") == "replica"
+    # Analytics reads never need the session's own writes
+    assert read_session() == "replica"
+
+def test_a_chat_turn_marks_its_session(db, monkeypatch):
+    writes = RecentWrites(window=60)
+    monkeypatch.setattr("app.services.turn_processor.recent_writes", writes)
+    processor = TurnProcessor(db)
+    turn = processor.begin("routing-turn", "Where is my order?")
+    processor.complete(turn, 0.0, "neutral", "Let me check.")
+    assert "routing-turn" in writes
@@ -0,0 +1,72 @@
+import gzip
+import json
+from app.models.database import ArchivedConversation, Conversation, Message, SentimentBucket
+from app.services.chat_service import ChatService
+from app.services.metrics_rollup import MetricsRollupService, init_rollup
+from app.services.retention import ARCHIVE_DIR, archive_conversations, read_archived
+from datetime import datetime, timedelta
+
+NOW = datetime(2024, 6, 1)
+CUTOFF = NOW - timedelta(days=90)
+
+def add_conversation(db, session_id: str, status: str, last_message: datetime, scores=(-0.5, 0.4)):
+    created = last_message - timedelta(minutes=len(scores))
+    conversation = Conversation(session_id=session_id, created_at=created, status=status,
+                                escalated=False, average_sentiment=sum(scores) / len(scores))
+    db.add(conversation)
+    db.flush()
+    for number, score in enumerate(scores):
+        timestamp = created + timedelta(minutes=number + 1)
+        db.add_all([
+            Message(conversation_id=conversation.id, session_id=session_id, role="user",
+                    content=f"question {number}", sentiment_score=score,
+                    sentiment_label="negative" if score < -0.2 else "positive", issue_type="order",
+                    timestamp=timestamp),
+            Message(conversation_id=conversation.id, session_id=session_id, role="assistant",
+                    content=f"answer {number}", timestamp=timestamp),
+        ])
+    db.commit()
+
+def dashboard(db):
+    db.expire_all()
+    buckets = sorted((bucket.granularity, bucket.bucket_start, round(bucket.sentiment_sum, 6),
+                      bucket.message_count) for bucket in db.query(SentimentBucket))
+    values = {metric: round(value, 6) for metric, value in MetricsRollupService(db).read().items()}
+    return values, buckets
+
+def test_archive_moves_only_cold_resolved_conversations(db, tmp_path):
+    add_conversation(db, "cold", "resolved", CUTOFF - timedelta(days=10))
+    add_conversation(db, "recent", "resolved", CUTOFF + timedelta(days=10))
+    add_conversation(db, "open", "active", CUTOFF - timedelta(days=10))
+    init_rollup()
+    before = dashboard(db)
+
+    result = archive_conversations(db, CUTOFF, tmp_path)
+    assert result.to_dict() == {"conversations": 1, "messages": 4, "skipped": 0, "files": 1}
+    assert sorted(session for (session,) in db.query(Conversation.session_id)) == ["open", "recent"]
+    assert db.query(Message).filter(Message.session_id == "cold").count() == 0
+
+    # The file is ordinary gzipped NDJSON in the transcript format
+    entry = db.query(ArchivedConversation).one()
+    with gzip.open(tmp_path / entry.path, "rt") as f:
+        lines = [json.loads(line) for line in f]
+    assert [line["session_id"] for line in lines] == ["cold"]
+    assert read_archived(entry, tmp_path) == lines[0]
+    assert entry.message_count == 4 and entry.path.startswith(entry.created_at.strftime("%Y-%m/"))
+
+    # Archived conversations still count, and a rebuild adds them back
+    assert dashboard(db) == before
+    MetricsRollupService(db).rebuild()
+    assert dashboard(db) == before
+
+    # Running again finds nothing left to archive
+    assert archive_conversations(db, CUTOFF, tmp_path).conversations == 0
+
+def test_archived_history_is_read_from_the_file(db):
+    add_conversation(db, "cold", "resolved", CUTOFF - timedelta(days=10))
+    # History reads archives from ARCHIVE_DIR (a scratch directory under the tests)
+    archive_conversations(db, CUTOFF, ARCHIVE_DIR)
+
+    page = ChatService(db).get_conversation_history("cold", limit=3)
+    assert [message.content for message in page.items] == ["answer 0", "question 1", "answer 1"]
+    assert page.has_more
@@ -0,0 +1,23 @@
+import asyncio
+from app.services.sentiment import SentimentEngine, analyze_sentiment, normalize_text
+
+def test_cache_key_keeps_case():
+    # Emoticons score differently by case, so they must not share a cache entry
+    assert analyze_sentiment("Thanks :D") != analyze_sentiment("thanks :d")
+    assert normalize_text("Thanks :D") != normalize_text("thanks :d")
+    assert normalize_text("  Thanks \n :D ") == normalize_text("Thanks :D")
+
+def test_case_variants_are_scored_separately():
+    async def scores():
+        engine = SentimentEngine(workers=0)
+        results = await asyncio.gather(
+            engine.analyze("Thanks :D"), engine.analyze("thanks :d"), engine.analyze("Thanks  :D")
+        )
+        return engine, results
+
+    engine, (upper, lower, spaced) = asyncio.run(scores())
+    assert upper == analyze_sentiment("Thanks :D")
+    assert lower == analyze_sentiment("thanks :d")
+    assert spaced == upper
+    assert len(engine._cache) == 2
+    assert engine.stats.coalesced == 1
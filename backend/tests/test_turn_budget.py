@@ -0,0 +1,57 @@
+import asyncio
+import pytest
+from app.models.database import AsyncSessionLocal, count_queries
+from app.services.context_cache import context_cache
+from app.services.turn_processor import (
+    TURN_COMMIT_BUDGET, TURN_QUERY_BUDGET, AsyncTurnProcessor, TurnProcessor
+)
+from app.services.write_behind import write_behind
+
+# (message, sentiment score, label); the last one escalates the conversation
+TURNS = [
+    ("Hi, where is my order?", 0.1, "neutral"),
+    ("It was supposed to arrive on Monday", -0.2, "neutral"),
+    ("This is unacceptable, I want a refund", -0.8, "negative"),
+]
+
+def assert_within_budget(counter):
+    assert counter.statements <= TURN_QUERY_BUDGET, f"{counter.statements} statements"
+    assert counter.commits <= TURN_COMMIT_BUDGET, f"{counter.commits} commits"
+
+def inline_turn(db, session_id, message, score, label):
+    processor = TurnProcessor(db)
+    with count_queries() as counter:
+        turn = processor.begin(session_id, message)
+        processor.complete(turn, score, label, "Let me look into that for you.")
+    return counter
+
+@pytest.mark.parametrize("cached", [True, False])
+def test_inline_turn_within_budget(db, cached):
+    for message, score, label in TURNS:
+        if not cached:
+            # Every turn after the first loads its history cold
+            context_cache.clear()
+        assert_within_budget(inline_turn(db, "budget-inline", message, score, label))
+
+@pytest.mark.parametrize("cached", [True, False])
+def test_write_behind_turn_within_budget(db, cached):
+    async def turns():
+        write_behind.start()
+        try:
+            for message, score, label in TURNS:
+                if not cached:
+                    await write_behind.flush()
+                    context_cache.clear()
+                async with AsyncSessionLocal() as session:
+                    processor = AsyncTurnProcessor(session)
+                    with count_queries() as counter:
+                        turn = await processor.begin("budget-write-behind", message)
+                        await processor.respond(turn, score, label, reply())
+                assert_within_budget(counter)
+        finally:
+            await write_behind.stop()
+
+    async def reply():
+        return "Let me look into that for you."
+
+    asyncio.run(turns())
@@ -1,5 +1,5 @@
 import { useState, useEffect } from 'react';
-import { getDashboardAnalytics, getAllConversations, getSentimentTrends } from '../services/api';
+import { getDashboardAnalytics, getAllConversations, getSentimentTrends, subscribeToDashboard } from '../services/api';
 import { PieChart, Pie, Cell, LineChart, Line, XAxis, YAxis, CartesianGrid, Tooltip, Legend, ResponsiveContainer } from 'recharts';
 import { TrendingUp, MessageSquare, CheckCircle, AlertTriangle, RefreshCw } from 'lucide-react';
 
@@ -11,6 +11,17 @@ const AnalyticsDashboard = () => {
   
   useEffect(() => {
     fetchAnalytics();
+    
+    // Live updates replace polling; one stream per open dashboard
+    const source = subscribeToDashboard({
+      onSnapshot: (data) => setAnalytics(data.dashboard),
+      onUpdate: (data) => {
+        setAnalytics(data.dashboard);
+        setConversations(prev => mergeConversations(prev, data.conversations));
+        setSentimentTrends(prev => applyTrendDeltas(prev, data.trends));
+      },
+    });
+    return () => source.close();
   }, []);
   
   const fetchAnalytics = async () => {
@@ -23,7 +34,7 @@ const AnalyticsDashboard = () => {
       ]);
       
       setAnalytics(analyticsData);
-      setConversations(conversationsData);
+      setConversations(conversationsData.items || []);
       setSentimentTrends(trendsData.trends || []);
     } catch (error) {
       console.error('Error fetching analytics:', error);
@@ -224,6 +235,27 @@ const AnalyticsDashboard = () => {
   );
 };
 
+// Update listed conversations in place and put new ones first
+const mergeConversations = (conversations, changes) => {
+  const byId = new Map(changes.map(change => [change.id, change]));
+  const updated = conversations.map(conv => byId.has(conv.id) ? { ...conv, ...byId.get(conv.id) } : conv);
+  const known = new Set(conversations.map(conv => conv.id));
+  const added = changes.filter(change => !known.has(change.id) && change.session_id);
+  return [...added.reverse(), ...updated];
+};
+
+// Fold sentiment bucket deltas into the daily trend line
+const applyTrendDeltas = (trends, deltas) => {
+  const points = new Map(trends.map(point => [point.date, point]));
+  deltas.filter(delta => delta.granularity === 'day').forEach(delta => {
+    const point = points.get(delta.date) || { date: delta.date, sentiment: 0, count: 0 };
+    const count = point.count + delta.count;
+    const sentiment = (point.sentiment * point.count + delta.sentiment_sum) / count;
+    points.set(delta.date, { date: delta.date, sentiment: Math.round(sentiment * 1000) / 1000, count });
+  });
+  return [...points.values()].sort((a, b) => a.date.localeCompare(b.date));
+};
+
 const MetricCard = ({ title, value, icon, color }) => {
   return (
     <div className="bg-white rounded-lg shadow p-6 hover:shadow-xl transition-all duration-300 hover:-translate-y-1 cursor-pointer transform">
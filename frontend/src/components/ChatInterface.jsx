@@ -1,5 +1,5 @@
 import { useState, useEffect, useRef } from 'react';
-import { sendMessage } from '../services/api';
+import { openChatSocket, sendMessage } from '../services/api';
 import { Send, User, Bot } from 'lucide-react';
 import SentimentMeter from './SentimentMeter';
 
@@ -7,6 +7,7 @@ const ChatInterface = () => {
   const [messages, setMessages] = useState([]);
   const [inputMessage, setInputMessage] = useState('');
   const [isLoading, setIsLoading] = useState(false);
+  const [isStreaming, setIsStreaming] = useState(false);
   const [sessionId] = useState(() => `session_${Date.now()}`);
   const [currentSentiment, setCurrentSentiment] = useState({ score: 0, label: 'neutral' });
   const [customerName, setCustomerName] = useState('');
@@ -14,6 +15,7 @@ const ChatInterface = () => {
   const [isEscalated, setIsEscalated] = useState(false);
   
   const messagesEndRef = useRef(null);
+  const socketRef = useRef(null);
   
   const scrollToBottom = () => {
     messagesEndRef.current?.scrollIntoView({ behavior: 'smooth' });
@@ -23,6 +25,88 @@ const ChatInterface = () => {
     scrollToBottom();
   }, [messages]);
   
+  useEffect(() => {
+    return () => socketRef.current?.close();
+  }, []);
+  
+  const appendReplyChunk = (chunk) => {
+    setIsStreaming(true);
+    setMessages(prev => {
+      const last = prev[prev.length - 1];
+      if (last?.streaming) {
+        return [...prev.slice(0, -1), { ...last, content: last.content + chunk }];
+      }
+      return [...prev, { role: 'assistant', content: chunk, timestamp: new Date(), streaming: true }];
+    });
+  };
+  
+  const finishReply = (response) => {
+    setMessages(prev => {
+      const last = prev[prev.length - 1];
+      const reply = { role: 'assistant', content: response, timestamp: last?.streaming ? last.timestamp : new Date() };
+      return last?.streaming ? [...prev.slice(0, -1), reply] : [...prev, reply];
+    });
+    setIsStreaming(false);
+    setIsLoading(false);
+  };
+  
+  const showError = () => {
+    setMessages(prev => [
+      ...prev.filter(m => !m.streaming),
+      {
+        role: 'assistant',
+        content: 'Sorry, I encountered an error. Please try again.',
+        timestamp: new Date(),
+      },
+    ]);
+    setIsStreaming(false);
+    setIsLoading(false);
+  };
+  
+  const handleSocketEvent = (event) => {
+    const data = JSON.parse(event.data);
+    
+    if (data.type === 'sentiment') {
+      setCurrentSentiment({ score: data.sentiment_score, label: data.sentiment_label });
+    } else if (data.type === 'chunk') {
+      appendReplyChunk(data.content);
+    } else if (data.type === 'done') {
+      if (data.should_escalate) {
+        setIsEscalated(true);
+      }
+      finishReply(data.response);
+    } else if (data.type === 'error') {
+      console.error('Chat socket error:', data.detail);
+      showError();
+    }
+  };
+  
+  // Resolves with an open socket for this session, reconnecting if it dropped
+  const getSocket = () => {
+    const current = socketRef.current;
+    if (current?.readyState === WebSocket.OPEN) {
+      return Promise.resolve(current);
+    }
+    
+    return new Promise((resolve, reject) => {
+      const socket = openChatSocket(sessionId);
+      socket.onmessage = handleSocketEvent;
+      socket.onopen = () => {
+        socketRef.current = socket;
+        resolve(socket);
+      };
+      socket.onerror = () => reject(new Error('Chat socket unavailable'));
+      socket.onclose = () => {
+        if (socketRef.current === socket) {
+          socketRef.current = null;
+          // A reply cut off by a dropped connection is not coming back
+          setIsStreaming(false);
+          setIsLoading(false);
+        }
+      };
+    });
+  };
+  
   const handleStartChat = () => {
     if (customerName.trim()) {
       setShowNameInput(false);
@@ -49,6 +133,15 @@ const ChatInterface = () => {
     setInputMessage('');
     setIsLoading(true);
     
+    try {
+      const socket = await getSocket();
+      socket.send(JSON.stringify({ message: inputMessage, customer_name: customerName }));
+      return;
+    } catch (error) {
+      // Fall back to a plain request when sockets are blocked
+      console.warn('Falling back to HTTP:', error);
+    }
+    
     try {
       const response = await sendMessage(sessionId, inputMessage, customerName);
       
@@ -61,25 +154,10 @@ const ChatInterface = () => {
         setIsEscalated(true);
       }
       
-      const assistantMessage = {
-        role: 'assistant',
-        content: response.response,
-        timestamp: new Date(),
-      };
-      
-      setMessages(prev => [...prev, assistantMessage]);
+      finishReply(response.response);
     } catch (error) {
       console.error('Error:', error);
-      setMessages(prev => [
-        ...prev,
-        {
-          role: 'assistant',
-          content: 'Sorry, I encountered an error. Please try again.',
-          timestamp: new Date(),
-        },
-      ]);
-    } finally {
-      setIsLoading(false);
+      showError();
     }
   };
   
@@ -162,7 +240,7 @@ const ChatInterface = () => {
             </div>
           ))}
           
-          {isLoading && (
+          {isLoading && !isStreaming && (
             <div className="flex justify-start">
               <div className="flex items-start space-x-2 max-w-2xl">
                 <div className="p-2 rounded-full bg-gray-300">
@@ -23,6 +23,13 @@ export const sendMessage = async (sessionId, message, customerName = null) => {
   }
 };
 
+// One socket per chat session. The server sends { type: 'sentiment' } first,
+// then { type: 'chunk', content } pieces of the reply, then { type: 'done' }.
+export const openChatSocket = (sessionId) => {
+  const socketUrl = API_BASE_URL.replace(/^http/, 'ws');
+  return new WebSocket(`${socketUrl}/ws/chat/${encodeURIComponent(sessionId)}`);
+};
+
 export const getDashboardAnalytics = async () => {
   try {
     const response = await api.get('/analytics/dashboard');
@@ -33,10 +40,14 @@ export const getDashboardAnalytics = async () => {
   }
 };
 
-export const getAllConversations = async (status = null, limit = 50) => {
+// Returns a page: { items, before, after, has_more }. Pass page.before to
+// load older conversations, or page.after to check for newer ones.
+export const getAllConversations = async (status = null, limit = 50, { before = null, after = null } = {}) => {
   try {
     const params = { limit };
     if (status) params.status = status;
+    if (before) params.before = before;
+    if (after) params.after = after;
     const response = await api.get('/analytics/conversations', { params });
     return response.data;
   } catch (error) {
@@ -45,9 +56,26 @@ export const getAllConversations = async (status = null, limit = 50) => {
   }
 };
 
-export const getSentimentTrends = async () => {
+// The first page holds the latest messages; pass page.before to scroll back
+export const getChatHistory = async (sessionId, limit = 50, { before = null, after = null } = {}) => {
+  try {
+    const params = { limit };
+    if (before) params.before = before;
+    if (after) params.after = after;
+    const response = await api.get(`/chat/history/${sessionId}`, { params });
+    return response.data;
+  } catch (error) {
+    console.error('Error fetching chat history:', error);
+    throw error;
+  }
+};
+
+export const getSentimentTrends = async (granularity = 'day', start = null, end = null) => {
   try {
-    const response = await api.get('/analytics/sentiment-trends');
+    const params = { granularity };
+    if (start) params.start = start;
+    if (end) params.end = end;
+    const response = await api.get('/analytics/sentiment-trends', { params });
     return response.data;
   } catch (error) {
     console.error('Error fetching sentiment trends:', error);
@@ -55,4 +83,14 @@ export const getSentimentTrends = async () => {
   }
 };
 
+// Live dashboard feed (server-sent events). 'snapshot' and 'update' events
+// both carry the full dashboard; updates also list changed conversations and
+// sentiment bucket deltas. EventSource reconnects on its own.
+export const subscribeToDashboard = ({ onSnapshot, onUpdate }) => {
+  const source = new EventSource(`${API_BASE_URL}/analytics/live`);
+  source.addEventListener('snapshot', (event) => onSnapshot(JSON.parse(event.data)));
+  source.addEventListener('update', (event) => onUpdate(JSON.parse(event.data)));
+  return source;
+};
+
 export default api;